@@ -0,0 +1 @@
+# Benchmarks and local stub servers (not used by the bots at runtime)
@@ -0,0 +1,59 @@
+"""Saved-results comparison shared by the benchmarks with --out / --compare / --max-regression."""
+import subprocess
+from typing import Any
+
+
+def git_commit() -> str | None:
+    """Short hash of HEAD, recorded with saved results (None outside a git checkout)."""
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def flatten(results: dict[str, Any], prefix: str = "") -> dict[str, Any]:
+    """Nested results as {"dotted.path": value}."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def compare(
+    current: dict[str, Any],
+    baseline: dict[str, Any],
+    metrics: dict[str, bool],
+    max_regression: float,
+    commit: str | None = None,
+) -> bool:
+    """
+    Print deltas of the metrics in both results against baseline; False if any got worse by
+    more than max_regression %. metrics: path or path suffix ("p99", "ready_ms") -> True when
+    higher is better.
+    """
+    ok = True
+    print(f"\nvs baseline {commit}:")
+    old_values = flatten(baseline)
+    compared = []
+    for path, new in flatten(current).items():
+        old = old_values.get(path)
+        higher_is_better = next(
+            (better for name, better in metrics.items() if path == name or path.endswith(f".{name}")), None
+        )
+        if higher_is_better is None or not isinstance(new, (int, float)) or not isinstance(old, (int, float)):
+            continue
+        compared.append((path, old, new, higher_is_better))
+    width = max((len(path) for path, *_ in compared), default=0)
+    for path, old, new, higher_is_better in compared:
+        delta = (new - old) / old * 100 if old else 0.0
+        worse = -delta if higher_is_better else delta
+        flag = ""
+        if worse > max_regression:
+            flag, ok = "  REGRESSION", False
+        print(f"  {path:{width}} {old:>10} -> {new:>10}  ({delta:+.1f}%){flag}")
+    return ok
@@ -0,0 +1,122 @@
+"""
+Admin CLI (bot_mem/admin.py) on a generated database of --rows messages (--rows-per-user each):
+
+1. export to NDJSON: rows/s and peak RSS of the CLI process (bounded by the page, not the DB;
+   RSS includes up to SQLITE_MMAP_SIZE of mapped database pages)
+2. import into an empty database: rows/s and peak RSS, once keeping everything and once with
+   the default HISTORY_PAIRS_LIMIT trimming
+3. online backup while a writer thread keeps recording turns: backup time and the writer's
+   worst write latency before and during the backup
+
+Run from project root: python -m benchmarks.bench_admin --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+_RUN_CLI = (
+    "import resource, subprocess, sys; subprocess.run(sys.argv[1:], check=True); "
+    "print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)"
+)
+_WORDS = "the weather report book travel python answer question summary memory data user river town".split()
+
+
+def generate(path: Path, rows: int, per_user: int) -> None:
+    os.environ["MEMORY_DB_PATH"] = str(path)
+    from common import db
+
+    db.init_db()
+    rng = random.Random(1)
+    texts = [db.encode_content(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(5, 60)))) for _ in range(1000)]
+    now = int(time.time())
+    conn = sqlite3.connect(str(path))
+    batch = 100_000
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO messages (user_id, role, content, created_at, tokens) VALUES (?, ?, ?, ?, ?)",
+            ((i % (rows // per_user) + 1, "user" if i % 2 == 0 else "assistant", texts[i % 1000], now, None)
+             for i in range(start, min(rows, start + batch))),
+        )
+        conn.commit()
+    conn.close()
+    db.close_connections()
+
+
+def cli(db_path: Path, *args: str, **env) -> tuple[float, float]:
+    """Run the admin CLI; returns (seconds, peak RSS in MB)."""
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", _RUN_CLI, sys.executable, "-m", "bot_mem.admin", *args],
+        env={**os.environ, "MEMORY_DB_PATH": str(db_path), "LOG_QUEUE_SIZE": "0", **env},
+        capture_output=True, text=True, check=True,
+    )
+    return time.perf_counter() - t0, int(out.stdout.strip().splitlines()[-1]) / 1024
+
+
+def backup_under_load(db_path: Path, dest: Path, seconds: float = 2.0) -> tuple[float, float, float]:
+    from common import memory_repo
+
+    worst = {"before": 0.0, "during": 0.0}
+    phase = {"name": "before"}
+    stop = threading.Event()
+
+    def writer() -> None:
+        user = 0
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            memory_repo.write_batch([("record_turn", (10**9 + user % 1000, "question", "answer"))])
+            worst[phase["name"]] = max(worst[phase["name"]], time.perf_counter() - t0)
+            user += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(seconds)
+    phase["name"] = "during"
+    took, _ = cli(db_path, "backup", str(dest))
+    stop.set()
+    thread.join()
+    return took, worst["before"] * 1000, worst["during"] * 1000
+
+
+def run(args) -> None:
+    tmp = Path(tempfile.mkdtemp(prefix="bench_admin_"))
+    os.environ["DATA_DIR"] = str(tmp)
+    os.environ["HISTORY_PAIRS_LIMIT"] = str(args.rows)  # no trimming by the writer thread
+    source, dump = tmp / "source.db", tmp / "dump.ndjson"
+    t0 = time.perf_counter()
+    generate(source, args.rows, args.rows_per_user)
+    print(f"{args.rows} rows, {args.rows // args.rows_per_user} users: generated in {time.perf_counter() - t0:.1f} s, "
+          f"{source.stat().st_size / 2**20:.0f} MB")
+
+    took, rss = cli(source, "export", "-o", str(dump))
+    print(f"export          {args.rows / took:9.0f} rows/s  {took:6.1f} s  peak RSS {rss:5.0f} MB  "
+          f"{dump.stat().st_size / 2**20:.0f} MB NDJSON")
+    for name, limit in (("import, keep all", str(args.rows)), ("import, trimmed", "5")):
+        target = tmp / f"import-{limit}.db"
+        took, rss = cli(target, "import", str(dump), HISTORY_PAIRS_LIMIT=limit)
+        kept = sqlite3.connect(str(target)).execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        print(f"{name:15} {args.rows / took:9.0f} rows/s  {took:6.1f} s  peak RSS {rss:5.0f} MB  {kept} rows kept")
+        target.unlink()
+
+    os.environ["MEMORY_DB_PATH"] = str(source)
+    took, before, during = backup_under_load(source, tmp / "backup.db")
+    print(f"backup          {took:6.1f} s while writing; worst write latency {before:.1f} ms before, "
+          f"{during:.1f} ms during")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--rows-per-user", type=int, default=50)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
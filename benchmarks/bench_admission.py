@@ -0,0 +1,68 @@
+"""
+Traffic spike against a slow fake completion server through admission control.
+One noisy user sends many requests next to many users with one request each:
+shows how many were served vs shed, how fast shed replies come back, and that
+the noisy user does not take the slots of the others.
+
+Run from project root: python -m benchmarks.bench_admission --users 100 --noisy 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+async def run(users: int, noisy: int, latency: float, in_flight: int, queue: int, wait: float) -> None:
+    async with FakeOpenAIServer(latency=latency) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        from common import openai_client
+        from common.admission import AdmissionController
+
+        logging.getLogger("common.admission").setLevel(logging.ERROR)
+
+        openai_client.admission = AdmissionController(
+            max_in_flight=in_flight, max_queue=queue, max_wait=wait, max_queued_per_user=2
+        )
+
+        async def one(user_id: int) -> tuple[int, bool, float]:
+            t0 = time.perf_counter()
+            ok, _ = await openai_client.achat_completion("hello", user_id=user_id)
+            return user_id, ok, time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        calls = [one(0) for _ in range(noisy)] + [one(i) for i in range(1, users + 1)]
+        results = await asyncio.gather(*calls)
+        elapsed = time.perf_counter() - t0
+        stats = openai_client.admission.stats()
+
+    served = [r for r in results if r[1]]
+    shed = [r for r in results if not r[1]]
+    noisy_served = sum(1 for uid, ok, _ in results if uid == 0 and ok)
+    others_served = len(served) - noisy_served
+    print(f"requests: {len(results)} in {elapsed:.2f}s, limit {in_flight} in flight, queue {queue}, wait {wait}s")
+    print(f"served: {len(served)} (noisy user {noisy_served}/{noisy}, others {others_served}/{users})")
+    if shed:
+        print(f"shed: {len(shed)}, slowest busy reply {max(t for _, _, t in shed):.3f}s")
+    print(f"max queue wait: {stats['wait_seconds_max']:.3f}s, "
+          f"shed queue_full={stats['shed_queue_full']} user_queue_full={stats['shed_user_queue_full']} "
+          f"timeout={stats['shed_timeout']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--noisy", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--in-flight", type=int, default=16)
+    parser.add_argument("--queue", type=int, default=64)
+    parser.add_argument("--wait", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.noisy, args.latency, args.in_flight, args.queue, args.wait))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+History backends (MEMORY_BACKEND) side by side: sqlite, memory and redis (a local fake Redis
+server answering after --redis-rtt seconds, or a real one at --redis-url).
+
+1. Conformance: the same checks against every backend (empty user, capped window in order,
+   record_turn, trim, clear, isolation between users, a batch with an unsupported op applies
+   nothing, unicode round trip, readers during concurrent writes, MemoryStore on top; for
+   backends without atomic batches (redis): a batch that failed after being applied is not
+   replayed, so no turn is stored twice).
+   A failed check is printed and the exit code is 1.
+2. Speed: writes one by one vs batched (group commit / one pipeline), context reads from
+   storage (p50/p99; sqlite and memory also from their in-process window) and --turns
+   concurrent turns (read context + record the turn) through MemoryStore.
+
+Run from project root: python -m benchmarks.bench_backends --writes 5000 --redis-rtt 0.0005
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+BACKENDS = ("sqlite", "memory", "redis")
+
+
+def _window(backend, user_id: int) -> list[tuple[str, str]]:
+    return [(m["role"], m["content"]) for m in backend.load_context(user_id)]
+
+
+def conformance(backend, limit: int) -> list[str]:
+    """Failed checks (empty when the backend behaves like the others)."""
+    failures = []
+
+    def check(name: str, ok: bool) -> None:
+        if not ok:
+            failures.append(name)
+
+    check("empty user has no history", _window(backend, 1) == [])
+
+    expected = []
+    for i in range(limit * 3):
+        role = "user" if i % 2 == 0 else "assistant"
+        backend.add_message(2, role, f"m{i}")
+        expected.append((role, f"m{i}"))
+    check("window capped to the newest messages, in order", _window(backend, 2) == expected[-limit:])
+
+    backend.record_turn(2, "question", "answer")
+    expected += [("user", "question"), ("assistant", "answer")]
+    check("record_turn appends both messages", _window(backend, 2) == expected[-limit:])
+    backend.trim_user(2)
+    check("trim keeps the window", _window(backend, 2) == expected[-limit:])
+    check("tokens counted", all(isinstance(m["tokens"], int) for m in backend.load_context(2)))
+
+    backend.record_turn(3, "other", "user")
+    backend.clear_user(2)
+    check("clear removes the user's history", _window(backend, 2) == [])
+    check("clear leaves other users alone", _window(backend, 3) == [("user", "other"), ("assistant", "user")])
+
+    try:
+        backend.write_batch([("record_turn", (4, "q", "a")), ("no_such_op", (4,))])
+        check("unsupported op raises", False)
+    except Exception:
+        pass
+    check("failed batch applies nothing", _window(backend, 4) == [])
+
+    text = "Привет 👋\nвторая строка \"кавычки\" \\ \r\n\x00 конец"
+    backend.record_turn(5, text, "ответ")
+    check("unicode and control characters round trip", _window(backend, 5) == [("user", text), ("assistant", "ответ")])
+    check("cached window matches storage", backend.get_context(5) == backend.load_context(5))
+
+    check("readers during concurrent writes see ordered windows", _concurrent(backend, limit))
+    check("MemoryStore on top of the backend", asyncio.run(_through_store(backend)))
+    if not backend.atomic_batches:
+        check("a failed non-atomic batch is not replayed", asyncio.run(_no_replay(backend)))
+    return failures
+
+
+class _ReplyLost:
+    """Backend wrapper whose writes reach storage but whose reply is lost (socket error after sending)."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, name: str):
+        return getattr(self._backend, name)
+
+    def write_batch(self, ops: list[tuple[str, tuple]]) -> None:
+        self._backend.write_batch(ops)
+        raise ConnectionError("reply lost")
+
+
+async def _no_replay(backend, writes: int = 20) -> bool:
+    """Concurrent writes that all fail after being applied: each turn must be stored exactly once."""
+    from common.memory_store import MemoryStore
+
+    store = MemoryStore(backend=_ReplyLost(backend))
+    store.start()
+    try:
+        results = await asyncio.gather(
+            *(store.record_turn(300 + u, f"q{u}", f"a{u}") for u in range(writes)), return_exceptions=True
+        )
+    finally:
+        await store.stop()
+    return all(isinstance(r, ConnectionError) for r in results) and all(
+        _window(backend, 300 + u) == [("user", f"q{u}"), ("assistant", f"a{u}")] for u in range(writes)
+    )
+
+
+def _concurrent(backend, limit: int, writers: int = 4, turns: int = 200) -> bool:
+    """Writers append numbered turns for their own user while a reader checks every window it sees."""
+    stop, bad = threading.Event(), []
+
+    def write(user_id: int) -> None:
+        for i in range(turns):
+            backend.record_turn(user_id, f"q{i}", f"a{i}")
+
+    def read() -> None:
+        while not stop.is_set():
+            for user_id in range(100, 100 + writers):
+                numbers = [int(m["content"][1:]) for m in backend.get_context(user_id)]
+                if len(numbers) > limit or numbers != sorted(numbers):
+                    bad.append(numbers)
+
+    threads = [threading.Thread(target=write, args=(100 + w,)) for w in range(writers)]
+    reader = threading.Thread(target=read)
+    reader.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    reader.join()
+    last = [(role, ("q" if role == "user" else "a") + str(i))
+            for i in range(turns - limit // 2, turns) for role in ("user", "assistant")]
+    return not bad and all(_window(backend, 100 + w) == last[-limit:] for w in range(writers))
+
+
+async def _through_store(backend) -> bool:
+    from common.memory_store import MemoryStore
+
+    store = MemoryStore(backend=backend)
+    store.start()
+    try:
+        await asyncio.gather(*(store.record_turn(200 + u, f"q{u}", f"a{u}") for u in range(50)))
+        windows = await asyncio.gather(*(store.get_context(200 + u) for u in range(50)))
+        ok = all([(m["role"], m["content"]) for m in w] == [("user", f"q{u}"), ("assistant", f"a{u}")]
+                 for u, w in enumerate(windows))
+        await store.clear_user(200)
+        return ok and await store.get_context(200) == [] and await store.get_summary(201) is None
+    finally:
+        await store.stop()
+
+
+def _percentile(values: list[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def speed(backend, args) -> dict[str, float]:
+    users = args.users
+    t0 = time.perf_counter()
+    for i in range(args.writes):
+        backend.record_turn(1000 + i % users, "question about the weather", "a fairly short answer")
+    single = args.writes / (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for start in range(0, args.writes, args.batch):
+        backend.write_batch([
+            ("record_turn", (1000 + i % users, "question about the weather", "a fairly short answer"))
+            for i in range(start, min(args.writes, start + args.batch))
+        ])
+    batched = args.writes / (time.perf_counter() - t0)
+
+    reads = []
+    for i in range(args.reads):
+        t0 = time.perf_counter()
+        backend.load_context(1000 + i % users)
+        reads.append(time.perf_counter() - t0)
+    cached = []
+    for i in range(args.reads):
+        t0 = time.perf_counter()
+        if backend.cached_context(1000 + i % users) is None:
+            break
+        cached.append(time.perf_counter() - t0)
+    return {
+        "single": single,
+        "batched": batched,
+        "read_p50": _percentile(reads, 0.5) * 1e6,
+        "read_p99": _percentile(reads, 0.99) * 1e6,
+        "cached_p50": statistics.median(cached) * 1e6 if cached else None,
+        "turns": asyncio.run(_turns(backend, args)),
+    }
+
+
+async def _turns(backend, args) -> float:
+    from common.memory_store import MemoryStore
+
+    store = MemoryStore(backend=backend)
+    store.start()
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def turn(i: int) -> None:
+        async with limit:
+            user_id = 5000 + i % args.users
+            await store.get_context(user_id)
+            await store.record_turn(user_id, "question about the weather", "a fairly short answer")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(turn(i) for i in range(args.turns)))
+    took = time.perf_counter() - t0
+    await store.stop()
+    return args.turns / took
+
+
+def run(args) -> bool:
+    from benchmarks.fake_redis import fake_redis_thread
+    from common import memory_repo
+    from common.memory_backends import InMemoryBackend, RedisBackend, SqliteBackend
+
+    limit = memory_repo.LIMIT_ROWS
+    server = nullcontext() if args.redis_url else fake_redis_thread(latency=args.redis_rtt)
+    ok = True
+    with server as fake:
+        redis_url = args.redis_url or fake.url
+        prefix = f"bench_backends:{os.getpid()}"
+        # Keys on a real server expire on their own within the hour
+        factories = {
+            "sqlite": SqliteBackend,
+            "memory": InMemoryBackend,
+            "redis": lambda: RedisBackend(url=redis_url, prefix=prefix, ttl_seconds=3600),
+        }
+        where = args.redis_url or f"fake, RTT {args.redis_rtt * 1000:.2f} ms"
+        print(f"window {limit} messages; redis: {where}\n")
+        print(f"{'backend':8} {'conformance':>12} {'single w/s':>11} {'batched w/s':>12} "
+              f"{'read p50 us':>12} {'read p99 us':>12} {'cached us':>10} {'store turns/s':>14}")
+        for name in args.backends.split(","):
+            backend = factories[name]()
+            backend.open()
+            failures = conformance(backend, limit)
+            ok = ok and not failures
+            result = speed(backend, args)
+            backend.close()
+            cached = f"{result['cached_p50']:.1f}" if result["cached_p50"] is not None else "-"
+            print(f"{name:8} {'ok' if not failures else 'FAILED':>12} {result['single']:>11.0f} "
+                  f"{result['batched']:>12.0f} {result['read_p50']:>12.1f} {result['read_p99']:>12.1f} "
+                  f"{cached:>10} {result['turns']:>14.0f}")
+            for failure in failures:
+                print(f"  failed: {failure}")
+        if fake is not None:
+            print(f"\nfake redis: {fake.commands} commands in {fake.round_trips} round trips")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--writes", type=int, default=5000, help="turns written one by one, then batched")
+    parser.add_argument("--batch", type=int, default=64, help="turns per batch")
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=5000, help="turns through MemoryStore")
+    parser.add_argument("--concurrency", type=int, default=200, help="turns in flight")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--redis-rtt", type=float, default=0.0, help="fake Redis latency per round trip, seconds")
+    parser.add_argument("--redis-url", default=None, help="real Redis-protocol server instead of the fake")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="bench_backends_") as data_dir:
+        os.environ["DATA_DIR"] = data_dir
+        os.environ.pop("MEMORY_DB_PATH", None)
+        ok = run(args)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
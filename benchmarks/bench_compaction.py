@@ -0,0 +1,105 @@
+"""
+Rolling summarization with a stub model: one user talks for --turns turns, stating a few
+facts early on. Compares the prompt sent on each turn for three memory models:
+
+  window     last HISTORY_PAIRS_LIMIT pairs only (default bot_mem): bounded, old facts lost
+  full       whole history (what raising the limit tends to): facts kept, prompt keeps growing
+  compaction window + summary of folded turns: bounded, facts kept
+
+The stub summarizer keeps "fact:" lines of user messages, so survival of facts is exact.
+
+Run from project root: python -m benchmarks.bench_compaction --turns 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench_compaction_"))
+os.environ["MEMORY_COMPACTION"] = "1"
+os.environ.setdefault("HISTORY_PAIRS_LIMIT", "5")
+os.environ.setdefault("MEMORY_COMPACT_AFTER_PAIRS", "5")
+
+FACTS = [
+    "fact: my name is Alice",
+    "fact: my cat is called Tom",
+    "fact: I live in Riga",
+    "fact: I am allergic to peanuts",
+]
+FILLER = "Tell me more about the weather, travel and books, and keep it short please. " * 4
+
+
+async def stub_summarize(previous: str | None, turns: list[tuple[str, str]], user_id: int) -> str:
+    facts = previous.splitlines() if previous else []
+    for role, content in turns:
+        if role == "user":
+            facts.extend(line for line in content.splitlines() if line.startswith("fact:") and line not in facts)
+    return "\n".join(facts)
+
+
+def _prompt_tokens(messages: list[dict[str, str]]) -> int:
+    from common.tokens import MESSAGE_OVERHEAD, count_tokens
+
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+async def run(turns: int) -> None:
+    from common.compaction import Compactor
+    from common.context_builder import build_messages
+    from common.db import close_connections, init_db
+    from common.memory_store import memory_store
+    from common.openai_client import SYSTEM_PROMPT
+
+    init_db()
+    memory_store.start()
+    compactor = Compactor(summarize=stub_summarize)
+    compactor.start()
+    user_id = 1
+    full_history: list[dict[str, str]] = []
+    sizes = {"window": [], "full": [], "compaction": []}
+    last = {}
+    for turn in range(turns):
+        text = (FACTS[turn] + "\n" if turn < len(FACTS) else "") + FILLER + f"(turn {turn})"
+        history = await memory_store.get_context(user_id)
+        summary = await memory_store.get_summary(user_id)
+        last = {
+            "window": build_messages(SYSTEM_PROMPT, history, text, budget=10**9),
+            "full": build_messages(SYSTEM_PROMPT, full_history, text, budget=10**9),
+            "compaction": build_messages(
+                SYSTEM_PROMPT, history, text, budget=10**9, summary=summary["content"] if summary else None
+            ),
+        }
+        for name, messages in last.items():
+            sizes[name].append(_prompt_tokens(messages))
+        reply = f"Stub answer to turn {turn}. " * 10
+        await memory_store.record_turn(user_id, text, reply)
+        full_history += [{"role": "user", "content": text}, {"role": "assistant", "content": reply}]
+        compactor.notify(user_id)
+        await compactor.wait_idle()
+
+    await compactor.stop()
+    await memory_store.stop()
+    close_connections()
+
+    print(f"{turns} turns, compactions: {compactor.compacted}")
+    print(f"{'model':12} {'max prompt':>11} {'last prompt':>12} {'facts kept':>11}")
+    for name, messages in last.items():
+        prompt = "\n".join(m["content"] for m in messages)
+        kept = sum(fact in prompt for fact in FACTS)
+        print(f"{name:12} {max(sizes[name]):>11} {sizes[name][-1]:>12} {kept:>8}/{len(FACTS)}")
+
+    last_prompt = "\n".join(m["content"] for m in last["compaction"])
+    assert all(fact in last_prompt for fact in FACTS), "facts from old turns lost with compaction"
+    tail = sizes["compaction"][turns // 2:]
+    assert max(tail) <= max(sizes["compaction"][: turns // 2]) * 1.1, "compaction prompt keeps growing"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+N parallel users against a local fake completion server.
+With the async client, N requests finish in about the time of one.
+
+Run from project root: python -m benchmarks.bench_concurrency --users 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+async def run(users: int, latency: float) -> None:
+    async with FakeOpenAIServer(latency=latency) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        from common import openai_client
+
+        await openai_client.achat_completion("warm-up")
+        t0 = time.perf_counter()
+        ok, _ = await openai_client.achat_completion("hello")
+        single = time.perf_counter() - t0
+        assert ok, "single request failed"
+
+        t0 = time.perf_counter()
+        results = await asyncio.gather(
+            *(openai_client.achat_completion(f"hello from {i}") for i in range(users))
+        )
+        parallel = time.perf_counter() - t0
+
+    failed = sum(1 for ok, _ in results if not ok)
+    print(f"single request:      {single:.3f}s")
+    print(f"{users} parallel users: {parallel:.3f}s (x{parallel / single:.2f} of single), failed={failed}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.latency))
+
+
+if __name__ == "__main__":
+    main()
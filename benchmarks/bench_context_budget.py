@@ -0,0 +1,69 @@
+"""
+Token-budget context builder: packing sanity checks and cost of building a
+prompt with cached per-message token counts versus re-tokenizing history.
+
+Run from project root: python -m benchmarks.bench_context_budget --history 40 --iterations 2000
+"""
+import argparse
+import random
+import time
+
+from common.context_builder import build_messages, message_tokens
+from common.tokens import count_tokens
+
+SYSTEM = "You are a helpful assistant. Reply concisely."
+
+
+def _history(n: int) -> list[dict]:
+    rnd = random.Random(1)
+    out = []
+    for i in range(n):
+        content = " ".join(f"слово{rnd.randint(0, 999)}" for _ in range(rnd.randint(5, 400)))
+        role = "user" if i % 2 == 0 else "assistant"
+        out.append({"role": role, "content": content, "tokens": count_tokens(content)})
+    return out
+
+
+def _check_packing(history: list[dict], budget: int) -> None:
+    messages = build_messages(SYSTEM, history, "новый вопрос", budget=budget)
+    used = sum(message_tokens(m) for m in messages)
+    assert used <= budget, f"budget exceeded: {used} > {budget}"
+    assert messages[0]["role"] == "system" and messages[-1]["content"] == "новый вопрос"
+    assert len(messages) < 3 or messages[1]["role"] == "user", "history starts with assistant"
+    packed = messages[1:-1]
+    assert packed == [{"role": m["role"], "content": m["content"]} for m in history[len(history) - len(packed):]], "not newest-first"
+    huge = build_messages(SYSTEM, history, "x " * 50000, budget=budget)
+    assert sum(message_tokens(m) for m in huge) <= budget and len(huge) == 2
+
+
+def run(history_len: int, iterations: int, budget: int) -> None:
+    history = _history(history_len)
+    _check_packing(history, budget)
+    uncached = [{"role": m["role"], "content": m["content"]} for m in history]
+
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        build_messages(SYSTEM, history, "новый вопрос", budget=budget)
+    cached = (time.perf_counter() - t0) / iterations
+
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        build_messages(SYSTEM, uncached, "новый вопрос", budget=budget)
+    recount = (time.perf_counter() - t0) / iterations
+
+    print(f"packing checks: ok (budget={budget}, history={history_len} messages)")
+    print(f"cached token counts: {cached * 1e6:8.1f} us/prompt")
+    print(f"re-tokenized:        {recount * 1e6:8.1f} us/prompt  (x{recount / cached:.1f})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--history", type=int, default=40)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--budget", type=int, default=6000)
+    args = parser.parse_args()
+    run(args.history, args.iterations, args.budget)
+
+
+if __name__ == "__main__":
+    main()
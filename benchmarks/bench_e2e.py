@@ -0,0 +1,256 @@
+"""
+End-to-end load test: the real bot_mem / bot_nomem dispatchers poll a fake Telegram Bot API
+and call a fake OpenAI server (both run on their own event loop in a background thread, so
+the bots' loop is measured alone). Synthetic users replay a conversation trace: each turn is
+a burst of messages, the user waits for the reply, thinks, and sends the next turn.
+
+Reports throughput, first-output and full-reply latency percentiles, event-loop lag and peak
+RSS; --out saves them as JSON, --compare diffs against an earlier JSON and exits with code 1
+when a metric regressed by more than --max-regression percent.
+
+Run from project root:
+  python -m benchmarks.bench_e2e --bot both --users 50 --turns 5 --history 20 --out run.json
+  python -m benchmarks.bench_e2e --bot mem --burst 3 --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.baseline import compare, git_commit
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.fake_telegram import FakeTelegramServer
+
+TOKENS = {"mem": "1001:fake-mem", "nomem": "1002:fake-nomem"}
+WORDS = "the a bot memory reply user turn context model stream cache token fast slow hello why how".split()
+
+# Metrics compared with --compare: name -> True when higher is better
+COMPARED = {
+    "throughput_turns_per_s": True,
+    "latency_first_ms.p50": False,
+    "latency_first_ms.p99": False,
+    "latency_done_ms.p50": False,
+    "latency_done_ms.p99": False,
+    "loop_lag_ms.p99": False,
+    "peak_rss_mb": False,
+}
+
+
+def percentiles(values: list[float], scale: float = 1000.0) -> dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, 3)
+
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(ordered[-1] * scale, 3)}
+
+
+class _BackgroundLoop:
+    """Event loop in a daemon thread for the fake servers and the simulated users."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="fakes", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def run(self, coro):
+        """Schedule coro on the background loop; returns an awaitable for the caller's loop."""
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+async def _user(telegram: FakeTelegramServer, token: str, user_id: int, args, rng: random.Random, stats: dict) -> None:
+    """One simulated user: `turns` turns of `burst` messages, waiting for each reply."""
+    burst = args.burst if token == TOKENS["mem"] else 1  # only bot_mem merges bursts into one turn
+    await asyncio.sleep(rng.uniform(0, args.ramp_up))
+    for turn in range(args.turns):
+        for i in range(burst):
+            if i:
+                await asyncio.sleep(args.burst_gap)
+            text = " ".join(rng.choice(WORDS) for _ in range(args.words))
+            telegram.push_message(token, user_id, f"{text} ({turn}.{i})")
+            stats["sent"] += 1
+        try:
+            await asyncio.wait_for(telegram.answered(token, user_id), args.turn_timeout)
+            stats["turns"] += 1
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            return
+        if args.rate > 0:
+            await asyncio.sleep(rng.expovariate(args.rate))
+
+
+async def _replay(telegram: FakeTelegramServer, args) -> dict:
+    rng = random.Random(args.seed)
+    stats = {"sent": 0, "turns": 0, "timeouts": 0}
+    bots = ["mem", "nomem"] if args.bot == "both" else [args.bot]
+    users = [
+        _user(telegram, TOKENS[bots[uid % len(bots)]], 10_000 + uid, args, random.Random(rng.random()), stats)
+        for uid in range(args.users)
+    ]
+    t0 = time.perf_counter()
+    await asyncio.gather(*users)
+    stats["duration_s"] = time.perf_counter() - t0
+    return stats
+
+
+async def _loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - t0 - interval))
+
+
+def _prefill_history(user_ids: list[int], pairs: int) -> None:
+    """Give bot_mem users `pairs` stored turns, then drop them from the cache (cold first read)."""
+    from common import memory_repo
+    from common.db import init_db
+
+    init_db()
+    ops = [
+        ("record_turn", (uid, f"old question {i} " * 5, f"old answer {i} " * 20))
+        for uid in user_ids
+        for i in range(pairs)
+    ]
+    for start in range(0, len(ops), 500):
+        memory_repo.write_batch(ops[start:start + 500])
+    memory_repo.history_cache.clear()
+
+
+async def run(args) -> dict:
+    fakes = _BackgroundLoop()
+    fakes.start()
+    final_piece = args.reply if args.tokens == 1 else f"{args.reply}{args.tokens - 1}"
+    openai = FakeOpenAIServer(
+        latency=args.latency, reply=args.reply, tokens=args.tokens, token_interval=args.token_interval
+    )
+    telegram = FakeTelegramServer(
+        # Partial streamed texts start with the reply and lack its last piece; error replies are final too
+        is_final=lambda text: text != "…" and (text.endswith(final_piece) or not text.startswith(args.reply))
+    )
+    await fakes.run(openai.start())
+    await fakes.run(telegram.start())
+
+    os.environ.update(
+        {
+            "OPENAI_BASE_URL": openai.base_url,
+            "OPENAI_API_KEY": "sk-fake",
+            "BOT_MEM_TOKEN": TOKENS["mem"],
+            "BOT_NOMEM_TOKEN": TOKENS["nomem"],
+            "DATA_DIR": args.data_dir or tempfile.mkdtemp(prefix="bench_e2e_"),
+            "STREAM_REPLIES": "1" if args.stream else "0",
+        }
+    )
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    bots = ["mem", "nomem"] if args.bot == "both" else [args.bot]
+    if "mem" in bots and args.history:
+        mem_users = [10_000 + uid for uid in range(args.users) if bots[uid % len(bots)] == "mem"]
+        _prefill_history(mem_users, args.history)
+
+    api = TelegramAPIServer.from_base(telegram.base_url)
+    pollers = []
+    for name in bots:
+        if name == "mem":
+            from bot_mem.main import create_dispatcher
+        else:
+            from bot_nomem.main import create_dispatcher
+        bot = Bot(token=TOKENS[name], session=AiohttpSession(api=api))
+        dp = create_dispatcher()
+        pollers.append((dp, asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))))
+
+    await asyncio.sleep(0.5)  # let pollers run startup hooks
+    lag: list[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_loop_lag(lag, stop))
+    stats = await fakes.run(_replay(telegram, args))
+    stop.set()
+    await lag_task
+    for dp, task in pollers:
+        await dp.stop_polling()
+        await task
+    await fakes.run(telegram.stop())
+    await fakes.run(openai.stop())
+    fakes.stop()
+
+    duration = stats["duration_s"]
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "max_regression")},
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "commit": git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": {
+            "messages_sent": stats["sent"],
+            "turns_answered": stats["turns"],
+            "turn_timeouts": stats["timeouts"],
+            "unanswered_messages": telegram.unanswered,
+            "duration_s": round(duration, 3),
+            "throughput_turns_per_s": round(stats["turns"] / duration, 3) if duration else 0.0,
+            "latency_first_ms": percentiles(telegram.first_latencies),
+            "latency_done_ms": percentiles(telegram.done_latencies),
+            "loop_lag_ms": percentiles(lag),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "openai_requests": openai.requests,
+            "telegram_requests": telegram.requests,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot", choices=("mem", "nomem", "both"), default="both")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=5, help="turns per user")
+    parser.add_argument("--burst", type=int, default=1, help="messages per turn (bot_mem merges them)")
+    parser.add_argument("--burst-gap", type=float, default=0.05, help="seconds between messages of a burst")
+    parser.add_argument("--rate", type=float, default=1.0, help="turns/s per user after a reply (0 = no think time)")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="users start uniformly within this many seconds")
+    parser.add_argument("--words", type=int, default=12, help="words per message")
+    parser.add_argument("--history", type=int, default=10, help="stored turns per bot_mem user before the run")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake OpenAI latency to first token")
+    parser.add_argument("--tokens", type=int, default=20, help="reply chunks")
+    parser.add_argument("--token-interval", type=float, default=0.01)
+    parser.add_argument("--reply", default="ok")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir", default=None, help="DATA_DIR for bot_mem (default: fresh temp dir)")
+    parser.add_argument("--out", type=Path, default=None, help="write results JSON here")
+    parser.add_argument("--compare", type=Path, default=None, help="baseline results JSON")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="percent")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report["results"], indent=2))
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"saved to {args.out}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        commit = baseline.get("environment", {}).get("commit")
+        if not compare(report["results"], baseline["results"], COMPARED, args.max_regression, commit):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+History cache check: warm conversation turns (get_context + record_turn)
+must not issue SELECTs to SQLite. Prints hit/miss counters and turn rate.
+
+Run from project root: python -m benchmarks.bench_history_cache --users 100 --turns 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def run(users: int, turns: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATA_DIR"] = tmp
+        from common import db, memory_repo
+
+        db.init_db()
+        selects = 0
+
+        def trace(sql: str) -> None:
+            nonlocal selects
+            if sql.lstrip().upper().startswith("SELECT"):
+                selects += 1
+
+        db.get_connection().set_trace_callback(trace)
+
+        # Cold pass: one DB read per user fills the cache
+        for user_id in range(users):
+            memory_repo.get_context(user_id)
+        cold_selects = selects
+
+        t0 = time.perf_counter()
+        for i in range(turns):
+            user_id = i % users
+            memory_repo.get_context(user_id)
+            memory_repo.record_turn(user_id, "question", "answer")
+        elapsed = time.perf_counter() - t0
+        warm_selects = selects - cold_selects
+
+        # Cached window must match what is in SQLite
+        memory_repo.history_cache.clear()
+        expected = [("user", "question"), ("assistant", "answer")] * memory_repo.HISTORY_PAIRS_LIMIT
+        assert [(m["role"], m["content"]) for m in memory_repo.get_context(0)] == expected
+        db.close_connections()
+
+    print(f"cold pass: {cold_selects} SELECTs for {users} users")
+    print(f"warm turns: {turns}, SELECTs: {warm_selects}, {turns / elapsed:.0f} turns/s")
+    print(f"cache stats: {memory_repo.cache_stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=5000)
+    args = parser.parse_args()
+    run(args.users, args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Logging pipeline (common/logging_setup.py) with a slow sink: stdout is replaced by a stream whose
+every write takes --sink-delay seconds (a blocked pipe or slow log collector). Simulated requests
+arrive at --rate per second for --seconds; each logs --lines INFO lines (SAMPLED, with its own
+request_id) and yields to the loop. Event-loop lag is sampled every 5 ms.
+
+Modes: sync handler (LOG_QUEUE_SIZE=0, the old behaviour), queue with "drop" and "block"
+policies, drop with LOG_SAMPLE_RATE, JSON format. For each: loop lag p50/p99/max, lines
+written / dropped / sampled out, and how long stop_logging() took to write out the queue
+(every accepted line must be written by then). Each mode runs in its own interpreter, since
+settings are read at import.
+
+Run from project root: python -m benchmarks.bench_logging --rate 400 --seconds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+_MARK = "Строка"
+MODES = {
+    "sync": {"LOG_QUEUE_SIZE": "0"},
+    "queue drop": {"LOG_QUEUE_POLICY": "drop"},
+    "queue block": {"LOG_QUEUE_POLICY": "block"},
+    "drop + sample 0.25": {"LOG_QUEUE_POLICY": "drop", "LOG_SAMPLE_RATE": "0.25"},
+    "drop + json": {"LOG_QUEUE_POLICY": "drop", "LOG_FORMAT": "json"},
+}
+
+
+class SlowSink:
+    """File-like stdout replacement: each write sleeps `delay` (blocking the calling thread)."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        self.lines += text.count(_MARK)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _pct(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else 0.0
+
+
+async def _load(args, logger, request_id, sampled) -> int:
+    produced = 0
+
+    async def request(n: int) -> None:
+        nonlocal produced
+        request_id.set(f"bench:{n}")
+        for i in range(args.lines):
+            logger.info(_MARK + " %s запроса user_id=%s", i, n, extra=sampled)
+            produced += 1
+            await asyncio.sleep(0)
+
+    tasks = []
+    started = time.perf_counter()
+    n = 0
+    while (elapsed := time.perf_counter() - started) < args.seconds:
+        while n < elapsed * args.rate:
+            tasks.append(asyncio.create_task(request(n)))
+            n += 1
+        await asyncio.sleep(0.005)
+    await asyncio.gather(*tasks)
+    return produced
+
+
+async def _lag(samples: list[float], stop: asyncio.Event, interval: float = 0.005) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - t0 - interval))
+
+
+def child(args) -> dict:
+    sink = SlowSink(args.sink_delay)
+    sys.stdout = sink
+    from common import logging_setup
+
+    logger = logging_setup.setup_logging("bench")
+
+    async def main() -> tuple[int, list[float]]:
+        lag: list[float] = []
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(_lag(lag, stop))
+        produced = await _load(args, logger, logging_setup.request_id, logging_setup.SAMPLED)
+        stop.set()
+        await monitor
+        return produced, lag
+
+    produced, lag = asyncio.run(main())
+    dropped = logging_setup.log_stats()["dropped"]
+    t0 = time.perf_counter()
+    logging_setup.stop_logging()
+    flush = time.perf_counter() - t0
+    written = sink.lines
+    return {
+        "produced": produced,
+        "written": written,
+        "dropped": dropped,
+        "flush_s": flush,
+        "lag_p50": _pct(lag, 0.5),
+        "lag_p99": _pct(lag, 0.99),
+        "lag_max": _pct(lag, 1.0),
+    }
+
+
+def run(args) -> None:
+    print(f"{args.rate} requests/s x {args.lines} lines for {args.seconds}s, sink {args.sink_delay * 1000:g} ms/line "
+          f"(max {1 / args.sink_delay:.0f} lines/s), queue {args.queue}")
+    for mode, env_mode in MODES.items():
+        env = {**os.environ, "LOG_QUEUE_SIZE": str(args.queue), "LOG_FORMAT": "text", "LOG_SAMPLE_RATE": "1", **env_mode}
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_logging", "--child", *sys.argv[1:]],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stderr.strip().splitlines()[-1])
+        print(
+            f"{mode:19} loop lag p50/p99/max {r['lag_p50']:7.1f}/{r['lag_p99']:7.1f}/{r['lag_max']:7.1f} ms  "
+            f"lines {r['produced']} -> written {r['written']}, dropped {r['dropped']}, "
+            f"sampled out {r['produced'] - r['written'] - r['dropped']}  "
+            f"flush at stop {r['flush_s']:5.2f} s"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=400)
+    parser.add_argument("--lines", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--sink-delay", type=float, default=0.001)
+    parser.add_argument("--queue", type=int, default=1000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        # stdout is the slow sink in the child: report on stderr
+        print(json.dumps(child(args)), file=sys.stderr)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
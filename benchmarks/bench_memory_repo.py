@@ -0,0 +1,88 @@
+"""
+Turns per second through memory_repo. One turn = get_context + two add_message.
+"before" replays the old connect-per-call pattern (new connection + schema
+script + commit on every call); "after" uses the current memory_repo.
+
+Run from project root: python -m benchmarks.bench_memory_repo --turns 2000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def _legacy_conn(path: Path) -> sqlite3.Connection:
+    from common.db import _SCHEMA
+
+    conn = sqlite3.connect(str(path))
+    conn.executescript(_SCHEMA)
+    conn.commit()
+    return conn
+
+
+def _legacy_turn(path: Path, user_id: int, limit_rows: int) -> None:
+    conn = _legacy_conn(path)
+    conn.execute(
+        "SELECT role, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+        (user_id, limit_rows),
+    ).fetchall()
+    conn.close()
+    for role, content in (("user", "question"), ("assistant", "answer")):
+        conn = _legacy_conn(path)
+        conn.execute(
+            "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            (user_id, role, content, datetime.now(tz=timezone.utc).isoformat()),
+        )
+        conn.commit()
+        conn.close()
+        conn = _legacy_conn(path)
+        conn.execute(
+            """
+            DELETE FROM messages WHERE user_id = ? AND id NOT IN (
+                SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?
+            )
+            """,
+            (user_id, user_id, limit_rows),
+        )
+        conn.commit()
+        conn.close()
+
+
+def run(turns: int, users: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATA_DIR"] = tmp
+        from common import db, memory_repo
+
+        legacy_path = Path(tmp) / "legacy.db"
+        t0 = time.perf_counter()
+        for i in range(turns):
+            _legacy_turn(legacy_path, i % users, memory_repo.LIMIT_ROWS)
+        before = turns / (time.perf_counter() - t0)
+
+        db.init_db()
+        t0 = time.perf_counter()
+        for i in range(turns):
+            user_id = i % users
+            memory_repo.get_context(user_id)
+            memory_repo.add_message(user_id, "user", "question")
+            memory_repo.add_message(user_id, "assistant", "answer")
+        after = turns / (time.perf_counter() - t0)
+        db.close_connections()
+
+    print(f"before (connect per call): {before:8.0f} turns/s")
+    print(f"after  (memory_repo):      {after:8.0f} turns/s  (x{after / before:.1f})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+    run(args.turns, args.users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Event-loop lag while the write rate climbs: direct sync memory_repo calls
+from the loop versus the async MemoryStore (reader pool + group-committing writer).
+
+Run from project root: python -m benchmarks.bench_memory_store --rates 200,1000,5000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+TICK = 0.005
+
+
+async def _measure_lag(stop: asyncio.Event, samples: list[float]) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK)
+        samples.append(time.perf_counter() - t0 - TICK)
+
+
+async def _drive(rate: int, duration: float, users: int, write) -> tuple[float, float, int]:
+    stop = asyncio.Event()
+    lag: list[float] = []
+    monitor = asyncio.create_task(_measure_lag(stop, lag))
+    pending = []
+    done = 0
+    t_start = time.perf_counter()
+    while (elapsed := time.perf_counter() - t_start) < duration:
+        due = int(elapsed * rate)
+        while done < due:
+            result = write(done % users)
+            if result is not None:
+                pending.append(result)
+            done += 1
+        await asyncio.sleep(0)
+    await asyncio.gather(*pending)
+    stop.set()
+    await monitor
+    lag.sort()
+    p99 = lag[int(len(lag) * 0.99) - 1] if lag else 0.0
+    return p99 * 1000, (lag[-1] if lag else 0.0) * 1000, done
+
+
+async def run(rates: list[int], duration: float, users: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATA_DIR"] = tmp
+        from common import db, memory_repo
+        from common.memory_store import MemoryStore
+
+        db.init_db()
+        store = MemoryStore()
+        store.start()
+        print(f"{'rate/s':>8} {'mode':<6} {'lag p99 ms':>11} {'lag max ms':>11} {'turns':>7}")
+        for rate in rates:
+            p99, worst, n = await _drive(
+                rate, duration, users, lambda u: memory_repo.record_turn(u, "question", "answer")
+            )
+            print(f"{rate:>8} {'sync':<6} {p99:>11.2f} {worst:>11.2f} {n:>7}")
+            p99, worst, n = await _drive(
+                rate, duration, users, lambda u: asyncio.ensure_future(store.record_turn(u, "question", "answer"))
+            )
+            print(f"{rate:>8} {'store':<6} {p99:>11.2f} {worst:>11.2f} {n:>7}")
+        await store.stop()
+        db.close_connections()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rates", default="200,1000,5000", help="comma-separated turns per second")
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run([int(r) for r in args.rates.split(",")], args.duration, args.users))
+
+
+if __name__ == "__main__":
+    main()
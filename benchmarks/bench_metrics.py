@@ -0,0 +1,54 @@
+"""
+Cost of instrumentation on the hot path: a bare timed call vs the same call with a
+histogram observation (bound child and labels() lookup), plus render time of /metrics.
+
+Run from project root: python -m benchmarks.bench_metrics --n 200000
+"""
+import argparse
+import time
+
+from common.metrics import Histogram, registry
+
+
+def _per_call_ns(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def run(n: int) -> None:
+    histogram = Histogram("bench_seconds", "benchmark", ("model", "outcome"))
+    child = histogram.labels("gpt-4", "ok")
+
+    def bare() -> None:
+        started = time.perf_counter()
+        time.perf_counter() - started
+
+    def bound() -> None:
+        started = time.perf_counter()
+        child.observe(time.perf_counter() - started)
+
+    def lookup() -> None:
+        started = time.perf_counter()
+        histogram.labels("gpt-4", "ok").observe(time.perf_counter() - started)
+
+    base = _per_call_ns(bare, n)
+    print(f"timing only:               {base:8.0f} ns/call")
+    print(f"+ observe (bound child):   {_per_call_ns(bound, n):8.0f} ns/call")
+    print(f"+ observe (labels lookup): {_per_call_ns(lookup, n):8.0f} ns/call")
+
+    t0 = time.perf_counter()
+    text = registry.render()
+    print(f"render /metrics: {(time.perf_counter() - t0) * 1000:.2f} ms, {len(text.splitlines())} lines")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=200000)
+    args = parser.parse_args()
+    run(args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Per-request latency: shared pooled client vs. a new client per request
+(the old get_client() behaviour). Runs against a local stub server.
+
+Run from project root: python -m benchmarks.bench_openai_pool --requests 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def _report(name: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1000
+    print(f"{name:<22} mean={statistics.mean(samples) * 1000:.2f}ms p50={p50:.2f}ms p99={p99:.2f}ms")
+
+
+async def run(requests: int, latency: float) -> None:
+    async with FakeOpenAIServer(latency=latency) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        from openai import AsyncOpenAI
+
+        from common import openai_client
+
+        fresh = []
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            client = AsyncOpenAI()
+            await client.chat.completions.create(model="fake", messages=MESSAGES)
+            await client.close()
+            fresh.append(time.perf_counter() - t0)
+
+        pooled = []
+        client = openai_client.get_async_client()
+        await client.chat.completions.create(model="fake", messages=MESSAGES)  # warm pool
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            await client.chat.completions.create(model="fake", messages=MESSAGES)
+            pooled.append(time.perf_counter() - t0)
+        await openai_client.close_clients()
+
+    _report("new client / request", fresh)
+    _report("shared pooled client", pooled)
+    print(f"gain per request: {(statistics.mean(fresh) - statistics.mean(pooled)) * 1000:.2f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Outbound Telegram limiter (common/outbound.py) against a fake Bot API that enforces flood
+limits (429 + retry_after for more than --chat-limit messages per chat or --global-limit in
+total per second). Every chat gets a context dump of --chunks messages (bulk) and, shortly
+after, one interactive reply. Sent directly, part of them fail with RetryAfter; through the
+limiter all arrive, in order, and interactive replies overtake the remaining bulk chunks.
+
+Then cancellation: a waiter cancelled after being granted but before it resumes hands the grant
+back. A chat lane must not stay busy, and with every other queued call cancelled that way the
+delivered calls must still go out at the global rate (not half of it).
+
+Run from project root: python -m benchmarks.bench_outbound --chats 40 --chunks 5
+"""
+import argparse
+import asyncio
+import time
+from collections.abc import Callable
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from common.outbound import BULK, INTERACTIVE, Outbound, TokenBucket, _ChatLane, _GlobalRate
+
+TOKEN = "1001:fake"
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+
+async def run_mode(mode: str, args) -> None:
+    telegram = FakeTelegramServer(chat_limit=args.chat_limit, global_limit=args.global_limit)
+    await telegram.start()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(telegram.base_url)))
+    # A bucket of rate r and burst b lets r + b through in a one-second window: stay within the limits
+    limiter = Outbound(global_rate=args.global_limit - 1, chat_rate=1.0, chat_burst=args.chat_limit - 1)
+    failed = 0
+    interactive: list[float] = []
+    bulk_done: list[float] = []
+
+    async def send(chat_id: int, text: str, priority: int) -> None:
+        nonlocal failed
+        try:
+            if mode == "direct":
+                await bot.send_message(chat_id, text)
+            else:
+                await limiter.call(chat_id, lambda: bot.send_message(chat_id, text), priority)
+        except TelegramRetryAfter:
+            failed += 1
+
+    async def dump(chat_id: int) -> None:
+        t0 = time.perf_counter()
+        for i in range(args.chunks):
+            await send(chat_id, f"chunk {i}", BULK)
+        bulk_done.append(time.perf_counter() - t0)
+
+    async def reply(chat_id: int) -> None:
+        await asyncio.sleep(args.reply_after)
+        t0 = time.perf_counter()
+        await send(chat_id, "reply", INTERACTIVE)
+        interactive.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(dump(c) for c in range(1, args.chats + 1)), *(reply(c) for c in range(1, args.chats + 1)))
+    elapsed = time.perf_counter() - t0
+    await bot.session.close()
+    await telegram.stop()
+
+    total = args.chats * (args.chunks + 1)
+    in_order = all(
+        [t for t in telegram.outputs[c] if t.startswith("chunk")] == [f"chunk {i}" for i in range(args.chunks)]
+        for c in range(1, args.chats + 1)
+    )
+    print(
+        f"{mode:9} delivered {total - failed:>4}/{total}  429s {telegram.flood_errors:>4}  "
+        f"chunks in order {str(in_order):5}  reply p50 {_percentile(interactive, 0.5):7.0f} ms "
+        f"p99 {_percentile(interactive, 0.99):7.0f} ms  dump p50 {_percentile(bulk_done, 0.5):7.0f} ms  "
+        f"total {elapsed:5.1f} s"
+    )
+    if mode == "outbound":
+        assert failed == 0 and in_order, "limiter lost or reordered messages"
+        assert _percentile(interactive, 0.5) < _percentile(bulk_done, 0.5), "interactive replies waited for bulk"
+
+
+class _CancelGranted(_GlobalRate):
+    """Cancels the task of a granted waiter right after the grant, before it can use the token."""
+
+    def __init__(self, bucket: TokenBucket, victim_of: Callable[[asyncio.Future], asyncio.Task | None]):
+        super().__init__(bucket)
+        self.victim_of = victim_of
+
+    def _grant(self) -> None:
+        pending = [w[2] for w in self._waiters if not w[2].done()]
+        super()._grant()
+        granted = next((f for f in pending if f.done()), None)
+        task = self.victim_of(granted) if granted is not None else None
+        if task is not None:
+            task.cancel()
+
+
+async def check_cancellation(args) -> None:
+    lane = _ChatLane(TokenBucket(1.0, 1))
+    await lane.acquire(INTERACTIVE)
+    waiter = asyncio.create_task(lane.acquire(INTERACTIVE))
+    await asyncio.sleep(0)
+    lane.release()
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    await asyncio.wait_for(lane.acquire(INTERACTIVE), 1.0)
+    print("chat lane: grant cancelled before use, next call goes through")
+
+    rate = args.global_limit - 1
+    limiter = Outbound(global_rate=rate, chat_rate=1.0, chat_burst=1)
+    tasks: dict[int, asyncio.Task] = {}
+    sent: list[float] = []
+
+    def victim_of(future: asyncio.Future) -> asyncio.Task | None:
+        # Odd chats are cancelled once granted; even chats send
+        for chat_id, lane in limiter._lanes.items():
+            if chat_id % 2 and lane.global_wait is not None and lane.global_wait[1] is future:
+                return tasks[chat_id]
+        return None
+
+    limiter._global = _CancelGranted(TokenBucket(rate, 1), victim_of)
+
+    async def send() -> None:
+        sent.append(time.perf_counter())
+
+    calls = 2 * rate + 1
+    for chat_id in range(1, calls + 1):
+        tasks[chat_id] = asyncio.create_task(limiter.call(chat_id, send))
+    results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    cancelled = sum(isinstance(r, asyncio.CancelledError) for r in results)
+    achieved = (len(sent) - 1) / (sent[-1] - sent[0])
+    print(f"global rate: {cancelled} of {calls} calls cancelled after their grant, "
+          f"{len(sent)} sent at {achieved:.1f}/s (limit {rate}/s)")
+    assert cancelled and len(sent) == calls - cancelled, "calls lost or cancelled twice"
+    assert achieved > 0.8 * rate, "cancelled grants used up global tokens"
+
+
+async def run(args) -> None:
+    print(f"{args.chats} chats x ({args.chunks} bulk chunks + 1 reply), "
+          f"limits {args.chat_limit}/s per chat, {args.global_limit}/s global")
+    for mode in ("direct", "outbound"):
+        await run_mode(mode, args)
+    await check_cancellation(args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--reply-after", type=float, default=0.1, help="seconds after the dump starts")
+    parser.add_argument("--chat-limit", type=int, default=3)
+    parser.add_argument("--global-limit", type=int, default=30)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
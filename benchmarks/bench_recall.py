@@ -0,0 +1,123 @@
+"""
+Semantic recall index: query latency (p50/p99) for one user with 10k / 100k / 1M stored
+messages, append latency, hashing-embedder throughput, and an end-to-end check that a fact
+stated long before the window is recalled into the prompt (needs numpy).
+
+Large sizes use random unit vectors written straight into the index, so only the search is
+timed; the planted-fact check goes through memory_repo and the real hashing embedder.
+
+Run from project root: python -m benchmarks.bench_recall --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench_recall_"))
+os.environ["RECALL_ENABLED"] = "1"
+os.environ.setdefault("HISTORY_PAIRS_LIMIT", "5")
+
+FACT = "My sister's wedding is in Lisbon on the 14th of June"
+QUESTION = "When is my sister's wedding and where?"
+FILLER = [
+    "What is a good recipe for a quick dinner with pasta",
+    "Recommend some books about the history of science",
+    "How do I fix a slow laptop that overheats",
+    "Tell me a joke about programmers and coffee",
+    "Which running shoes are good for beginners",
+]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+
+def bench_search(sizes: list[int], queries: int, dim: int) -> None:
+    import numpy as np
+
+    from common.recall import RecallIndex
+
+    rng = np.random.default_rng(1)
+    print(f"search, dim={dim}, top-3, {queries} queries per size")
+    print(f"{'messages':>10} {'p50 ms':>8} {'p99 ms':>8} {'index MB':>9}")
+    for size in sizes:
+        index = RecallIndex(Path(tempfile.mkdtemp(prefix="bench_recall_idx_")), dim=dim, embed=lambda texts: (
+            rng.standard_normal((len(texts), dim)).astype(np.float32)
+        ))
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index._get(1).append(vectors, np.arange(1, size + 1, dtype=np.int64))
+        latencies = []
+        for _ in range(queries):
+            t0 = time.perf_counter()
+            index.search(1, "query", 3, before_id=size - 10)
+            latencies.append(time.perf_counter() - t0)
+        mb = size * dim * 4 / 2**20
+        print(f"{size:>10} {_percentile(latencies, 0.5):>8.2f} {_percentile(latencies, 0.99):>8.2f} {mb:>9.1f}")
+
+
+def bench_embed(count: int) -> None:
+    from common.recall import hashing_embed
+
+    texts = [f"{FILLER[i % len(FILLER)]} number {i}" for i in range(count)]
+    t0 = time.perf_counter()
+    hashing_embed(texts)
+    elapsed = time.perf_counter() - t0
+    print(f"hashing embedder: {count / elapsed:,.0f} messages/s")
+
+
+def bench_append(turns: int) -> None:
+    from common.recall import RecallIndex
+
+    index = RecallIndex(Path(tempfile.mkdtemp(prefix="bench_recall_app_")))
+    latencies = []
+    for i in range(turns):
+        t0 = time.perf_counter()
+        index.add(1, [2 * i + 1, 2 * i + 2], [FILLER[i % len(FILLER)], f"Answer {i}"])
+        latencies.append(time.perf_counter() - t0)
+    print(f"append (one turn, embed + file append): p50 {_percentile(latencies, 0.5):.3f} ms, "
+          f"p99 {_percentile(latencies, 0.99):.3f} ms")
+
+
+def check_planted_fact(turns: int) -> None:
+    from common import memory_repo
+    from common.context_builder import build_messages
+    from common.db import close_connections, init_db
+    from common.openai_client import SYSTEM_PROMPT
+
+    init_db()
+    user_id = 7
+    memory_repo.record_turn(user_id, FACT, "Noted, congratulations to your sister!")
+    for i in range(turns):
+        memory_repo.record_turn(user_id, f"{FILLER[i % len(FILLER)]} ({i})", f"Here is an answer to question {i}.")
+    history = memory_repo.get_context(user_id)
+    recalled = memory_repo.recall(user_id, QUESTION, before_id=history[0]["id"])
+    prompt = "\n".join(m["content"] for m in build_messages(SYSTEM_PROMPT, history, QUESTION, recalled=recalled))
+    close_connections()
+    in_window = any(FACT in m["content"] for m in history)
+    print(f"planted fact {turns} turns back: in window {in_window}, recalled into prompt {FACT in prompt}")
+    assert FACT in prompt, "planted fact not recalled"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--turns", type=int, default=500, help="turns after the planted fact")
+    args = parser.parse_args()
+
+    from common.recall import np
+
+    if np is None:
+        raise SystemExit("numpy не установлен: pip install numpy")
+    bench_search(args.sizes, args.queries, args.dim)
+    bench_embed(10_000)
+    bench_append(1_000)
+    check_planted_fact(args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Saving a turn for users with long histories.
+"before": two add_message-style commits, each followed by the old
+`NOT IN (... ORDER BY id DESC LIMIT ?)` trim on a user_id-only index.
+"after": record_turn (one transaction, id-threshold trim on (user_id, id)).
+
+Run from project root: python -m benchmarks.bench_record_turn --pairs 500 --users 200
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+_LEGACY_SCHEMA = """
+CREATE TABLE messages (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  role TEXT NOT NULL,
+  content TEXT NOT NULL,
+  created_at TEXT NOT NULL
+);
+CREATE INDEX idx_messages_user_id ON messages(user_id);
+"""
+_LEGACY_TRIM = """
+DELETE FROM messages WHERE user_id = ? AND id NOT IN (
+    SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?
+)
+"""
+_INSERT = "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)"
+
+
+def _seed(conn: sqlite3.Connection, users: int, rows_per_user: int) -> None:
+    with conn:
+        conn.executemany(
+            _INSERT,
+            (
+                (u, "user" if i % 2 == 0 else "assistant", f"message {i}", "2024-01-01T00:00:00+00:00")
+                for i in range(rows_per_user)
+                for u in range(users)
+            ),
+        )
+
+
+def run(pairs: int, users: int, turns: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATA_DIR"] = tmp
+        os.environ["HISTORY_PAIRS_LIMIT"] = str(pairs)
+        from common import db, memory_repo
+
+        limit_rows = memory_repo.LIMIT_ROWS
+
+        legacy = sqlite3.connect(os.path.join(tmp, "legacy.db"))
+        legacy.execute("PRAGMA journal_mode=WAL")
+        legacy.execute("PRAGMA synchronous=NORMAL")
+        legacy.executescript(_LEGACY_SCHEMA)
+        _seed(legacy, users, limit_rows)
+        t0 = time.perf_counter()
+        for i in range(turns):
+            user_id = i % users
+            for role in ("user", "assistant"):
+                legacy.execute(_INSERT, (user_id, role, "text", "2024-01-01T00:00:00+00:00"))
+                legacy.commit()
+                legacy.execute(_LEGACY_TRIM, (user_id, user_id, limit_rows))
+                legacy.commit()
+        before = turns / (time.perf_counter() - t0)
+        legacy.close()
+
+        db.init_db()
+        _seed(db.get_connection(), users, limit_rows)
+        t0 = time.perf_counter()
+        for i in range(turns):
+            memory_repo.record_turn(i % users, "text", "text")
+        after = turns / (time.perf_counter() - t0)
+        db.close_connections()
+
+    print(f"history: {limit_rows} rows/user, {users} users")
+    print(f"before (2 commits + NOT IN trim): {before:8.0f} turns/s")
+    print(f"after  (record_turn):             {after:8.0f} turns/s  (x{after / before:.1f})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pairs", type=int, default=500, help="HISTORY_PAIRS_LIMIT for the run")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.pairs, args.users, args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Retry, circuit breaker and hedging against a fault-injecting fake completion server.
+
+1. Flaky upstream (a share of 503s): success rate without and with retries.
+2. 429 with Retry-After: the retry waits at least the requested time.
+3. Upstream down: the breaker opens and later calls fail fast; after the reset
+   timeout a probe closes it again once the upstream recovers; a cancelled probe does not keep
+   it open.
+4. Tail latency (a share of slow replies): p50/p99 without and with hedged requests.
+
+Run from project root: python -m benchmarks.bench_resilience --requests 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+def _pct(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _batch(openai_client, n: int, concurrency: int = 20) -> tuple[int, list[float]]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> tuple[bool, float]:
+        async with sem:
+            t0 = time.perf_counter()
+            ok, _ = await openai_client.achat_completion(f"q{i}", user_id=i)
+            return ok, time.perf_counter() - t0
+
+    results = await asyncio.gather(*(one(i) for i in range(n)))
+    return sum(ok for ok, _ in results), [t for _, t in results]
+
+
+async def run(requests: int) -> None:
+    async with FakeOpenAIServer(latency=0.02, seed=1) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        from common import openai_client
+        from common.resilience import CircuitBreaker, Resilience
+
+        for name in ("common.resilience", "common.openai_client", "common.admission"):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+
+        def use(**kwargs) -> Resilience:
+            breaker = CircuitBreaker(failure_threshold=kwargs.pop("failures", 1000), reset_timeout=kwargs.pop("reset", 30))
+            upstream = Resilience(breaker=breaker, **kwargs)
+            openai_client.router.upstreams[openai_client.router.default_model] = upstream
+            return upstream
+
+        # 1. Flaky upstream
+        srv.fail_rate = 0.3
+        use(max_retries=0)
+        ok_plain, _ = await _batch(openai_client, requests)
+        res = use(max_retries=3)
+        ok_retry, _ = await _batch(openai_client, requests)
+        print(f"30% 503s: success {ok_plain}/{requests} without retries, "
+              f"{ok_retry}/{requests} with 3 retries ({res.retries} retries)")
+        assert ok_retry > ok_plain
+
+        # 2. Retry-After
+        srv.fail_rate, srv.fail_status, srv.retry_after = 1.0, 429, 0.3
+        use(max_retries=1)
+        t0 = time.perf_counter()
+        ok, _ = await openai_client.achat_completion("rate limited")
+        waited = time.perf_counter() - t0
+        print(f"429 Retry-After 0.3s: gave up after {waited:.2f}s (ok={ok})")
+        assert not ok and waited >= 0.3
+
+        # 3. Breaker
+        srv.fail_status, srv.retry_after = 503, None
+        res = use(max_retries=0, failures=5, reset=0.5)
+        before = srv.requests
+        _, latencies = await _batch(openai_client, 50, concurrency=1)
+        sent = srv.requests - before
+        print(f"upstream down: {sent}/50 calls sent, breaker {res.breaker.state}, "
+              f"fast-fail p50 {_pct(latencies[sent:], 0.5) * 1000:.2f} ms")
+        assert sent == 5 and res.breaker.state == "open"
+        srv.fail_rate = 0.0
+        await asyncio.sleep(0.6)
+        ok, _ = await openai_client.achat_completion("probe")
+        print(f"after reset timeout and recovery: probe ok={ok}, breaker {res.breaker.state}")
+        assert ok and res.breaker.state == "closed"
+
+        # 3b. A cancelled half-open probe must not block the breaker for good
+        srv.fail_rate = 1.0
+        await _batch(openai_client, 5, concurrency=1)
+        assert res.breaker.state == "open"
+        srv.fail_rate, srv.latency = 0.0, 0.5
+        await asyncio.sleep(0.6)
+        probe = asyncio.create_task(openai_client.achat_completion("probe to cancel"))
+        await asyncio.sleep(0.1)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        srv.latency = 0.02
+        ok, _ = await openai_client.achat_completion("after cancelled probe")
+        print(f"cancelled half-open probe: next call ok={ok}, breaker {res.breaker.state}")
+        assert ok and res.breaker.state == "closed"
+
+        # 4. Hedging
+        srv.slow_rate, srv.slow_latency = 0.05, 1.0
+        use(max_retries=0, hedge=False)
+        _, plain = await _batch(openai_client, requests)
+        res = use(max_retries=0, hedge=True, hedge_percentile=0.9)
+        await _batch(openai_client, 50)  # warm up the latency window
+        before = srv.requests
+        _, hedged = await _batch(openai_client, requests)
+        extra = srv.requests - before - requests
+        print(f"5% slow replies: p50/p99 {_pct(plain, 0.5):.3f}/{_pct(plain, 0.99):.3f}s without hedging, "
+              f"{_pct(hedged, 0.5):.3f}/{_pct(hedged, 0.99):.3f}s with hedging (+{extra} upstream calls)")
+        assert _pct(hedged, 0.99) < _pct(plain, 0.99)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
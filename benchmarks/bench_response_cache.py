@@ -0,0 +1,150 @@
+"""
+bot_nomem response cache (common/response_cache.py) on a fake compute() that takes --latency s:
+
+1. Checks: concurrent misses for one key share one compute(); a failed or keep()=False answer
+   is returned but not stored; entries expire after ttl; the LRU evicts by entry count and by
+   bytes; the disk tier answers a new cache instance (as after a restart); when the caller
+   computing an answer is cancelled, the callers waiting on it still get an answer (one of
+   them computes it) instead of being cancelled too. A failed check exits with code 1.
+2. Speed: --requests requests over --keys keys with --concurrency in flight: hit ratio,
+   compute() calls and requests/s, memory tier only and with the disk tier.
+
+Run from project root: python -m benchmarks.bench_response_cache --requests 20000 --keys 500
+"""
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common.response_cache import ResponseCache, cache_key
+
+
+class _Upstream:
+    """compute() factory: counts calls, answers after `latency` seconds."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def compute(self, answer: str, ok: bool = True):
+        async def call() -> tuple[bool, str]:
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+            return ok, answer
+
+        return call
+
+
+async def checks(latency: float) -> list[str]:
+    """Failed checks (empty when the cache behaves)."""
+    failures = []
+
+    def check(name: str, ok: bool) -> None:
+        if not ok:
+            failures.append(name)
+
+    up = _Upstream(latency)
+    cache = ResponseCache(ttl=60)
+    results = await asyncio.gather(*(cache.get_or_compute("k", up.compute("a")) for _ in range(20)))
+    check("concurrent misses share one compute()", up.calls == 1 and all(r[0] == (True, "a") for r in results))
+    check("only the leader reports computed=True", sum(r[1] for r in results) == 1)
+    check("stored answer is a memory hit", await cache.get_or_compute("k", up.compute("b")) == ((True, "a"), False))
+
+    up.calls = 0
+    await cache.get_or_compute("failed", up.compute("error text", ok=False))
+    await cache.get_or_compute("fallback", up.compute("other model"), keep=lambda: False)
+    await cache.get_or_compute("failed", up.compute("ok"))
+    await cache.get_or_compute("fallback", up.compute("main model"))
+    check("failed and keep()=False answers are not stored", up.calls == 4)
+
+    short = ResponseCache(ttl=0.05)
+    await short.get_or_compute("k", up.compute("a"))
+    await asyncio.sleep(0.1)
+    check("entries expire after ttl", (await short.get_or_compute("k", up.compute("b")))[0] == (True, "b"))
+
+    small = ResponseCache(ttl=60, max_entries=3)
+    for i in range(5):
+        await small.get_or_compute(f"k{i}", up.compute(f"a{i}"))
+    check("LRU keeps max_entries newest", list(small._entries) == ["k2", "k3", "k4"] and small.evictions == 2)
+    text = "x" * 1000
+    tight = ResponseCache(ttl=60, max_bytes=sys.getsizeof(text) * 2)
+    for i in range(4):
+        await tight.get_or_compute(f"k{i}", up.compute(text))
+    check("LRU keeps within max_bytes", len(tight._entries) == 2 and tight.stats()["bytes"] <= tight.max_bytes)
+
+    with tempfile.TemporaryDirectory(prefix="bench_response_cache_") as tmp:
+        path = Path(tmp) / "responses.db"
+        first = ResponseCache(ttl=60, disk_path=path)
+        await first.get_or_compute("k", up.compute("from disk"))
+        first.close()
+        second = ResponseCache(ttl=60, disk_path=path)
+        up.calls = 0
+        result = await second.get_or_compute("k", up.compute("recomputed"))
+        second.close()
+        check("disk tier survives a new instance", result == ((True, "from disk"), False) and up.calls == 0)
+
+    up.calls = 0
+    cache = ResponseCache(ttl=60)
+    leader = asyncio.create_task(cache.get_or_compute("k", up.compute("a")))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_compute("k", up.compute("a"))) for _ in range(5)]
+    await asyncio.sleep(latency / 2)
+    leader.cancel()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    check(
+        "waiters get an answer when the leader is cancelled",
+        all(not isinstance(r, BaseException) and r[0] == (True, "a") for r in results),
+    )
+    check("one waiter recomputes after the leader is cancelled", up.calls == 2)
+    return failures
+
+
+async def speed(args, disk_path: Path | None) -> dict[str, float]:
+    up = _Upstream(args.latency)
+    cache = ResponseCache(ttl=3600, max_entries=args.keys // 2, disk_path=disk_path)
+    rng = random.Random(1)
+    # Zipf-like popularity: a few questions are asked much more often than the rest
+    keys = [cache_key("model", "system", f"question {int(args.keys * rng.random() ** 3)}") for _ in range(args.requests)]
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(key: str) -> None:
+        async with limit:
+            await cache.get_or_compute(key, up.compute(f"answer for {key}"))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(k) for k in keys))
+    took = time.perf_counter() - t0
+    cache.close()
+    return {**cache.stats(), "calls": up.calls, "per_s": args.requests / took}
+
+
+async def run(args) -> bool:
+    failures = await checks(args.latency)
+    print(f"checks: {'ok' if not failures else 'FAILED'}")
+    for failure in failures:
+        print(f"  failed: {failure}")
+    print(f"\n{args.requests} requests over {args.keys} keys, {args.concurrency} in flight, "
+          f"compute() {args.latency * 1000:.0f} ms, memory tier {args.keys // 2} entries")
+    with tempfile.TemporaryDirectory(prefix="bench_response_cache_") as tmp:
+        for name, disk_path in (("memory", None), ("disk", Path(tmp) / "responses.db")):
+            r = await speed(args, disk_path)
+            print(f"{name:7} hit ratio {r['hit_ratio']:.3f} (memory {r['memory_hits']}, disk {r['disk_hits']}, "
+                  f"coalesced {r['coalesced']})  compute() calls {r['calls']:>5}  {r['per_s']:8.0f} requests/s")
+    return not failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake compute() time, seconds")
+    if not asyncio.run(run(parser.parse_args())):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
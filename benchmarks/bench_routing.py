@@ -0,0 +1,147 @@
+"""
+Model routing (common/routing.py) against a fake completion server where "fast" answers in
+--fast-latency and "strong" in --strong-latency seconds. Traffic: a --short-share of one-line
+questions without history, the rest long prompts with several pairs of history.
+
+1. Single model (strong for everything, as with OPENAI_MODEL alone) vs routing
+   "fast:400:2,strong": where short and long requests went, p50/p95 latency; the check is on
+   short requests' p95 (long ones go to strong either way).
+2. fast down (503s): its breaker opens and short requests fall back to strong; success rate.
+3. fast slows down with OPENAI_ROUTE_MAX_P95 set: once its p95 exceeds the limit (after
+   OPENAI_ROUTE_MIN_SAMPLES calls; passes repeat until then), short requests move to strong.
+   In the next pass fast only gets probes, at most one per OPENAI_ROUTE_PROBE_INTERVAL; the
+   check is on those call counts, not on p95 (a probe would land in any tail percentile).
+
+Run from project root: python -m benchmarks.bench_routing --requests 400
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+os.environ.setdefault("OPENAI_RETRY_BASE_DELAY", "0.01")
+os.environ.setdefault("OPENAI_MAX_IN_FLIGHT", "1000")
+os.environ.setdefault("OPENAI_QUEUE_SIZE", "10000")
+
+ROUTES = [("fast", 400, 2), ("strong", 0, 0)]
+LONG_TEXT = "Please review this paragraph about the quarterly report and its figures in detail. " * 40
+
+
+def _pct(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def _requests(n: int, short_share: float) -> list[tuple[str, list[dict[str, str]]]]:
+    rng = random.Random(1)
+    out = []
+    for i in range(n):
+        if rng.random() < short_share:
+            out.append(("short", [{"role": "system", "content": "Be brief."}, {"role": "user", "content": f"hi {i}"}]))
+        else:
+            history = []
+            for turn in range(4):
+                history += [{"role": "user", "content": LONG_TEXT}, {"role": "assistant", "content": LONG_TEXT}]
+            out.append(("long", [{"role": "system", "content": "Be brief."}, *history, {"role": "user", "content": "?"}]))
+    return out
+
+
+async def _run(openai_client, requests, concurrency: int = 20) -> dict[str, list]:
+    sem = asyncio.Semaphore(concurrency)
+    results: dict[str, list] = {"short": [], "long": [], "ok": []}
+
+    async def one(i: int, kind: str, messages) -> None:
+        async with sem:
+            t0 = time.perf_counter()
+            ok, _ = await openai_client.achat_completion_with_messages(messages, user_id=i)
+            results[kind].append(time.perf_counter() - t0)
+            results["ok"].append(ok)
+
+    await asyncio.gather(*(one(i, kind, m) for i, (kind, m) in enumerate(requests)))
+    return results
+
+
+def _report(name: str, srv: FakeOpenAIServer, results: dict[str, list]) -> tuple[float, int]:
+    """Print a pass; returns (p95 of short requests, calls that went to fast)."""
+    everything = results["short"] + results["long"]
+    short_p95 = _pct(results["short"], 0.95)
+    fast = srv.by_model["fast"]
+    print(
+        f"{name:22} ok {sum(results['ok'])}/{len(results['ok'])}  calls fast {fast:>4} "
+        f"strong {srv.by_model['strong']:>4}  short p50/p95 {_pct(results['short'], 0.5) * 1000:6.0f}/"
+        f"{short_p95 * 1000:6.0f} ms  all p50/p95 {_pct(everything, 0.5) * 1000:6.0f}/"
+        f"{_pct(everything, 0.95) * 1000:6.0f} ms"
+    )
+    srv.by_model.clear()
+    return short_p95, fast
+
+
+async def run(args) -> None:
+    latency = {"fast": args.fast_latency, "strong": args.strong_latency}
+    async with FakeOpenAIServer(model_latency=latency, seed=1) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        from common import openai_client
+        from common.resilience import CircuitBreaker, Resilience
+        from common.routing import ModelRouter
+
+        for name in ("common.resilience", "common.openai_client", "common.routing"):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+        requests = _requests(args.requests, args.short_share)
+        print(f"{args.requests} requests, {args.short_share:.0%} short; fast {args.fast_latency}s, "
+              f"strong {args.strong_latency}s")
+
+        def use(routes, **kwargs) -> ModelRouter:
+            router = ModelRouter(routes=routes, default_model="strong", **kwargs)
+            router.upstreams = {m: Resilience(breaker=CircuitBreaker(name=m)) for m, _, _ in routes}
+            openai_client.router = router
+            return router
+
+        # 1. Single model vs routing (long requests go to strong either way, so all-request p95 barely moves)
+        use([("strong", 0, 0)])
+        single, _ = _report("single model (strong)", srv, await _run(openai_client, requests))
+        use(ROUTES)
+        routed, _ = _report("routed", srv, await _run(openai_client, requests))
+        assert routed < single, "routing did not lower p95 of short requests"
+
+        # 2. fast down: breaker opens, fallback to strong
+        srv.down_models = {"fast"}
+        router = use(ROUTES)
+        results = await _run(openai_client, requests)
+        _report("fast down -> fallback", srv, results)
+        print(f"  fast breaker {router.upstream('fast').breaker.state}")
+        assert all(results["ok"]), "requests failed although strong was up"
+        srv.down_models = set()
+
+        # 3. fast slows down past OPENAI_ROUTE_MAX_P95
+        srv.model_latency = {"fast": args.strong_latency * 2, "strong": args.strong_latency}
+        router = use(ROUTES, max_p95=args.strong_latency * 1.5)
+        for _ in range(20):
+            _report("fast slow, detecting", srv, await _run(openai_client, requests))
+            if not router.healthy("fast"):
+                break
+        assert not router.healthy("fast"), "slow fast model was never marked degraded"
+        t0 = time.monotonic()
+        _, probes = _report("fast slow, detected", srv, await _run(openai_client, requests))
+        allowed = 1 + int((time.monotonic() - t0) / router.probe_interval)
+        print(f"  fast p95 {router.upstream('fast').latency.percentile(0.95, router.min_samples):.2f}s, healthy {router.healthy('fast')}, "
+              f"{probes} probe calls (at most {allowed} in {time.monotonic() - t0:.1f}s)")
+        assert probes <= allowed, "short requests kept going to the slow model"
+        await openai_client.close_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--short-share", type=float, default=0.7)
+    parser.add_argument("--fast-latency", type=float, default=0.05)
+    parser.add_argument("--strong-latency", type=float, default=0.4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
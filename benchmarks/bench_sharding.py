@@ -0,0 +1,135 @@
+"""
+Sharded bot_mem (bot_mem/supervisor.py):
+
+1. Routing: shard_for() gives the same shard for the same user in another interpreter with a
+   different PYTHONHASHSEED, and spreads users evenly over the shards. The limits meant for
+   the whole bot (Telegram global and group rate, OpenAI in-flight cap and queue) are split
+   between the workers, so together they stay within them.
+2. Throughput: the real supervisor (front + N worker processes) polls a fake Telegram Bot API
+   and calls a fake OpenAI server, both in this process. Users send turns back to back;
+   turns/s is reported for each worker count. Workers are separate processes, so scaling
+   needs as many free CPU cores as workers.
+
+Run from project root: python -m benchmarks.bench_sharding --workers 1 2 4 --users 200 --turns 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.fake_telegram import FakeTelegramServer
+from common import config
+from common.sharding import Supervisor, shard_for
+
+TOKEN = "1001:fake-mem"
+_PROBE = "from common.sharding import shard_for; print(','.join(str(shard_for(u, {n})) for u in range({count})))"
+
+
+def check_routing(count: int, shard_counts: list[int]) -> None:
+    for n in shard_counts:
+        here = [shard_for(u, n) for u in range(count)]
+        env = dict(os.environ, PYTHONHASHSEED=str(random.randrange(1, 2**31)))
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(n=n, count=count)], env=env, capture_output=True, text=True, check=True
+        )
+        assert here == [int(x) for x in out.stdout.strip().split(",")], f"routing differs between processes, n={n}"
+        spread = Counter(shard_for(random.randrange(1, 10**10), n) for _ in range(count))
+        sizes = [spread.get(i, 0) for i in range(n)]
+        print(f"routing n={n}: deterministic across processes, users per shard min {min(sizes)} max {max(sizes)}")
+
+
+def check_limits(shard_counts: list[int]) -> None:
+    totals = {
+        "TELEGRAM_GLOBAL_RATE": config.TELEGRAM_GLOBAL_RATE,
+        "TELEGRAM_GROUP_RATE_PER_MIN": config.TELEGRAM_GROUP_RATE_PER_MIN,
+        "OPENAI_MAX_IN_FLIGHT": config.OPENAI_MAX_IN_FLIGHT,
+        "OPENAI_QUEUE_SIZE": config.OPENAI_QUEUE_SIZE,
+    }
+    for n in shard_counts:
+        supervisor = Supervisor(n, env={})
+        envs = [supervisor.worker_env(i) for i in range(n)]
+        for name, total in totals.items():
+            used = sum(float(env[name]) for env in envs)
+            assert used <= total + 1e-9, f"{n} workers use {used} of {name}={total}"
+    print(f"limits split between workers: {', '.join(f'{k}={v}' for k, v in totals.items())}")
+
+
+async def _user(telegram: FakeTelegramServer, user_id: int, turns: int, stats: dict) -> None:
+    for turn in range(turns):
+        telegram.push_message(TOKEN, user_id, f"question {turn} from {user_id}")
+        await telegram.answered(TOKEN, user_id)
+        stats["turns"] += 1
+
+
+async def run_once(workers: int, users: int, turns: int, latency: float) -> float:
+    openai = FakeOpenAIServer(latency=latency, reply="ok")
+    telegram = FakeTelegramServer()
+    await openai.start()
+    await telegram.start()
+    env = dict(
+        os.environ,
+        BOT_MEM_TOKEN=TOKEN,
+        OPENAI_API_KEY="sk-fake",
+        OPENAI_BASE_URL=openai.base_url,
+        TELEGRAM_API_BASE=telegram.base_url,
+        DATA_DIR=tempfile.mkdtemp(prefix="bench_sharding_"),
+        BOT_MEM_WORKERS=str(workers),
+        STREAM_REPLIES="0",
+        TURN_DEBOUNCE_SECONDS="0",
+        OPENAI_MAX_IN_FLIGHT="1000",
+    )
+    front = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bot_mem.supervisor", env=env, stdout=asyncio.subprocess.DEVNULL
+    )
+    # Warm-up: one user per shard, so every worker is up before timing
+    warm = {}
+    uid = 1
+    while len(warm) < workers:
+        warm.setdefault(shard_for(uid, workers), uid)
+        uid += 1
+    stats = {"turns": 0}
+    await asyncio.wait_for(asyncio.gather(*(_user(telegram, u, 1, stats) for u in warm.values())), 60)
+
+    stats["turns"] = 0
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_user(telegram, 1_000_000 + u, turns, stats) for u in range(users)))
+    elapsed = time.perf_counter() - t0
+
+    front.terminate()
+    await front.wait()
+    await telegram.stop()
+    await openai.stop()
+    return stats["turns"] / elapsed
+
+
+async def run(args) -> None:
+    print(f"throughput: {args.users} users x {args.turns} turns, fake OpenAI latency {args.latency}s, "
+          f"{os.cpu_count()} CPU(s)")
+    base = None
+    for workers in args.workers:
+        rate = await run_once(workers, args.users, args.turns, args.latency)
+        base = base or rate
+        print(f"  workers={workers:<3} {rate:8.1f} turns/s  x{rate / base:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake OpenAI latency (s)")
+    parser.add_argument("--routing-users", type=int, default=100_000)
+    args = parser.parse_args()
+    check_routing(args.routing_users, sorted(set(args.workers) | {3, 8}))
+    check_limits(sorted(set(args.workers) | {3, 8}))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Startup time of the entry points, each measured in fresh interpreters (--runs, median):
+
+1. Imports: `python -X importtime -c "import <module>"` for bot_mem.main, bot_nomem.main and
+   bot_mem.admin: total import time and the heaviest direct imports.
+2. Ready: a fresh interpreter imports bot_mem.main / bot_nomem.main and runs the dispatcher
+   startup hook and getMe against a fake Telegram Bot API answering in --rtt seconds. Wall time
+   from process start until polling could begin (ready), until the OpenAI client exists as well
+   (first reply: with a background warm-up the first long poll hides it), and the hook alone.
+
+--out saves the results as JSON; --compare diffs import, ready and first-reply times against an
+earlier JSON and exits with code 1 when one grew by more than --max-regression percent.
+
+Run from project root:
+  python -m benchmarks.bench_startup --out startup.json
+  python -m benchmarks.bench_startup --compare startup.json --max-regression 15
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.baseline import compare, git_commit
+
+IMPORTED = ("bot_mem.main", "bot_nomem.main", "bot_mem.admin")
+BOTS = ("bot_mem", "bot_nomem")
+TOKEN = "1001:fake-startup"
+# Times checked by --compare, lower is better (the startup hook alone is informational: work
+# moves in and out of it)
+COMPARED = {"import_ms": False, "ready_ms": False, "first_reply_ms": False}
+
+
+def _env(data_dir: str) -> dict[str, str]:
+    return {
+        **os.environ,
+        "DATA_DIR": data_dir,
+        "OPENAI_API_KEY": "sk-fake",
+        "METRICS_ENABLED": "0",
+        "MEMORY_MAINTENANCE_INTERVAL": "0",
+    }
+
+
+def _importtime(module: str, env: dict[str, str]) -> tuple[float, dict[str, float]]:
+    """(total ms, direct imports -> cumulative ms) for one `import module` in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    total, children = 0.0, {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header
+        depth = len(name) - len(name.lstrip()) - 1
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative) / 1000
+        elif depth == 2:
+            children[name.strip()] = int(cumulative) / 1000
+    return total, children
+
+
+def measure_imports(args, env: dict[str, str]) -> dict[str, dict]:
+    results = {}
+    for module in IMPORTED:
+        runs = [_importtime(module, env) for _ in range(args.runs)]
+        total = statistics.median(t for t, _ in runs)
+        heaviest = sorted(runs[-1][1].items(), key=lambda kv: -kv[1])[: args.top]
+        results[module] = {"import_ms": round(total, 1)}
+        print(f"{module:15} import {total:7.1f} ms  heaviest: "
+              + ", ".join(f"{name} {ms:.0f}" for name, ms in heaviest))
+    return results
+
+
+async def _ready_once(bot: str, base_url: str, env: dict[str, str]) -> tuple[float, float, float]:
+    """ms from spawn until the child could poll, until it could reply; ms of its startup hook."""
+    started = time.perf_counter()
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.bench_startup", "--child", bot, "--telegram", base_url,
+        env=env, stdout=asyncio.subprocess.PIPE,
+    )
+    hook = json.loads(await proc.stdout.readline())["startup_ms"]
+    ready = (time.perf_counter() - started) * 1000
+    await proc.stdout.readline()
+    first_reply = (time.perf_counter() - started) * 1000
+    await proc.wait()
+    if proc.returncode:
+        raise RuntimeError(f"{bot} child exited with {proc.returncode}")
+    return ready, first_reply, hook
+
+
+async def measure_ready(args, env: dict[str, str]) -> dict[str, dict]:
+    from benchmarks.fake_telegram import FakeTelegramServer
+
+    results = {}
+    async with FakeTelegramServer(latency=args.rtt) as srv:
+        for bot in BOTS:
+            runs = [await _ready_once(bot, srv.base_url, env) for _ in range(args.runs)]
+            ready, first_reply, hook = (statistics.median(r[i] for r in runs) for i in range(3))
+            results[bot] = {
+                "ready_ms": round(ready, 1),
+                "first_reply_ms": round(first_reply, 1),
+                "startup_hook_ms": round(hook, 1),
+            }
+            print(f"{bot:15} ready  {ready:7.1f} ms from process start, first reply {first_reply:7.1f} ms, "
+                  f"startup hook {hook:6.1f} ms (Telegram RTT {args.rtt * 1000:.0f} ms)")
+    return results
+
+
+def child(args) -> None:
+    """
+    One bot start: import, startup hook and getMe (a line on stdout), then the first long poll
+    while the OpenAI client is obtained (a second line); then shuts down.
+    """
+    main = importlib.import_module(f"{args.child}.main")
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from common import openai_client
+
+    async def start() -> None:
+        bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(args.telegram)))
+        dp = main.create_dispatcher()
+        started = time.perf_counter()
+        await dp.emit_startup(bot=bot)
+        await bot.me()
+        print(json.dumps({"startup_ms": (time.perf_counter() - started) * 1000}), flush=True)
+        # What polling does next: the client is built meanwhile (background warm-up) or on first use
+        poll = asyncio.create_task(bot.get_updates(timeout=0))
+        await asyncio.to_thread(openai_client.get_async_client)
+        print(json.dumps({"first_reply_ms": (time.perf_counter() - started) * 1000}), flush=True)
+        await poll
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+    asyncio.run(start())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=4, help="heaviest direct imports to show")
+    parser.add_argument("--rtt", type=float, default=0.1, help="fake Telegram latency per request, seconds")
+    parser.add_argument("--out", type=Path, default=None, help="write results JSON here")
+    parser.add_argument("--compare", type=Path, default=None, help="baseline results JSON")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="percent")
+    parser.add_argument("--child", choices=BOTS, help=argparse.SUPPRESS)
+    parser.add_argument("--telegram", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as data_dir:
+        env = _env(data_dir)
+        results = measure_imports(args, env)
+        for bot, values in asyncio.run(measure_ready(args, env)).items():
+            results[f"{bot}.main"].update(values)
+    report = {"commit": git_commit(), "runs": args.runs, "rtt": args.rtt, "results": results}
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"saved to {args.out}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if not compare(report["results"], baseline["results"], COMPARED, args.max_regression, baseline.get("commit")):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Message storage formats on a generated history (--users x --turns turns, chat-like text):
+
+  v1    old format: content TEXT, created_at ISO-8601 TEXT (written directly); then migrated by
+        init_db() to the current format with zlib and switched to incremental vacuum as by
+        bot_mem.admin vacuum-mode (times reported)
+  none  current format: created_at unix seconds, content stored as is
+  zlib  current format with MEMORY_COMPRESSION=zlib (messages of MEMORY_COMPRESS_MIN_BYTES+)
+
+For each: DB file size, write throughput (record_turn in group commits of 64), cold
+load_context (history cache bypassed, DB pages in the OS cache) and, for the current formats,
+TTL expiry of half the users by the maintenance task and the file size after incremental
+vacuum. Expired users' rows are interleaved with those of active users, so most of the space
+they free stays in half-empty pages that new rows reuse; only wholly free pages are returned.
+Each format runs in its own interpreter, since settings are read at import.
+
+Run from project root: python -m benchmarks.bench_storage --users 2000 --turns 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+_V1_SCHEMA = """
+CREATE TABLE messages (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, role TEXT NOT NULL,
+  content TEXT NOT NULL, created_at TEXT NOT NULL, tokens INTEGER
+);
+CREATE INDEX idx_messages_user_id_id ON messages(user_id, id);
+CREATE TABLE summaries (
+  user_id INTEGER PRIMARY KEY, content TEXT NOT NULL, tokens INTEGER NOT NULL,
+  upto_id INTEGER NOT NULL, updated_at TEXT NOT NULL
+);
+"""
+_WORDS = (
+    "погода завтра будет тёплой и солнечной поэтому можно пойти гулять в парк или поехать за город "
+    "the model answers questions about travel books cooking and programming in python with examples "
+    "мне нужно подготовить отчёт к понедельнику и проверить все расчёты ещё раз перед отправкой "
+    "let me know if you want a shorter version or more details on any of these points please"
+).split()
+_BATCH = 64
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _turns(users: int, turns: int, seed: int = 1):
+    rng = random.Random(seed)
+    for turn in range(turns):
+        for user_id in range(1, users + 1):
+            yield user_id, _text(rng, rng.randint(5, 30)), _text(rng, rng.randint(40, 160))
+
+
+def _size_mb(path: Path) -> float:
+    # Main file only, after moving the WAL into it
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return path.stat().st_size / 2**20
+
+
+def _cold_load_ms(users: int, sample: int) -> float:
+    from common import memory_repo
+
+    user_ids = random.Random(2).sample(range(1, users + 1), min(sample, users))
+    t0 = time.perf_counter()
+    for user_id in user_ids:
+        memory_repo.load_context(user_id)
+    return (time.perf_counter() - t0) / len(user_ids) * 1000
+
+
+def child(mode: str, users: int, turns: int) -> dict:
+    from common import db, memory_repo
+
+    path = db.MEMORY_DB_PATH
+    result = {"mode": mode}
+    t0 = time.perf_counter()
+    if mode == "v1":
+        conn = sqlite3.connect(str(path))
+        conn.executescript(_V1_SCHEMA)
+        rows = []
+        for user_id, question, answer in _turns(users, turns):
+            now = datetime.now(tz=timezone.utc).isoformat()
+            rows += [(user_id, "user", question, now), (user_id, "assistant", answer, now)]
+            if len(rows) >= 2 * _BATCH:
+                conn.executemany("INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)", rows)
+                conn.commit()
+                rows = []
+        conn.executemany("INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+    else:
+        db.init_db()
+        ops = []
+        for user_id, question, answer in _turns(users, turns):
+            ops.append(("record_turn", (user_id, question, answer)))
+            if len(ops) >= _BATCH:
+                memory_repo.write_batch(ops)
+                ops = []
+        memory_repo.write_batch(ops)
+    result["turns_per_s"] = users * turns / (time.perf_counter() - t0)
+    result["size_mb"] = _size_mb(path)
+
+    result["load_ms"] = _cold_load_ms(users, 500)
+    if mode == "v1":
+        t0 = time.perf_counter()
+        db.init_db()
+        result["migrate_s"] = time.perf_counter() - t0
+        result["migrated_mb"] = _size_mb(path)
+        # The one-off switch to incremental vacuum (bot_mem.admin vacuum-mode) rebuilds the file
+        t0 = time.perf_counter()
+        db.enable_incremental_vacuum()
+        result["vacuum_mode_s"] = time.perf_counter() - t0
+        result["vacuum_mode_mb"] = _size_mb(path)
+    if mode != "v1":
+        result.update(asyncio.run(_expire_half(users)))
+        result["after_ttl_mb"] = _size_mb(path)
+    db.close_connections()
+    return result
+
+
+async def _expire_half(users: int) -> dict:
+    from common import db
+    from common.maintenance import Maintenance
+    from common.memory_store import MemoryStore
+
+    # Age every other user by 60 days, then one maintenance pass with a 30-day TTL
+    conn = db.get_connection()
+    conn.execute("UPDATE messages SET created_at = created_at - 60 * 86400 WHERE user_id % 2 = 0")
+    conn.commit()
+    store = MemoryStore()
+    store.start()
+    maintenance = Maintenance(store, ttl_days=30, interval=0)
+    t0 = time.perf_counter()
+    expired, freed = await maintenance.run_once()
+    elapsed = time.perf_counter() - t0
+    assert expired == users // 2, f"expired {expired} of {users // 2} inactive users"
+
+    # A file without auto_vacuum=INCREMENTAL: free pages stay, and the pass must still end
+    conn.execute("PRAGMA auto_vacuum=NONE")
+    conn.execute("VACUUM")
+    conn.execute("DELETE FROM messages WHERE user_id % 4 = 1")
+    conn.commit()
+    assert await store.freelist_pages() > 0
+    _, freed_none = await asyncio.wait_for(Maintenance(store, ttl_days=0, interval=0).run_once(), 10)
+    await store.stop()
+    assert freed_none == 0, f"freed {freed_none} pages without incremental vacuum"
+    return {"expired": expired, "freed_pages": freed, "maintenance_s": elapsed}
+
+
+def run(args) -> None:
+    print(f"{args.users} users x {args.turns} turns ({2 * args.users * args.turns} rows)")
+    for mode in ("v1", "none", "zlib"):
+        tmp = tempfile.mkdtemp(prefix="bench_storage_")
+        env = dict(
+            os.environ,
+            DATA_DIR=tmp,
+            MEMORY_DB_PATH=str(Path(tmp) / "memory.db"),
+            MEMORY_COMPRESSION="none" if mode == "none" else "zlib",
+            HISTORY_PAIRS_LIMIT=str(args.turns),
+            MEMORY_COMPACTION="0",
+            RECALL_ENABLED="0",
+        )
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_storage", "--child", mode,
+             "--users", str(args.users), "--turns", str(args.turns)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        line = (
+            f"{mode:5} size {r['size_mb']:7.1f} MB  write {r['turns_per_s']:8.0f} turns/s  "
+            f"cold load_context {r['load_ms']:6.2f} ms"
+        )
+        if mode == "v1":
+            line += (
+                f"  migration to zlib {r['migrate_s']:5.1f} s -> {r['migrated_mb']:6.1f} MB, "
+                f"vacuum-mode {r['vacuum_mode_s']:5.1f} s -> {r['vacuum_mode_mb']:6.1f} MB"
+            )
+        else:
+            line += (
+                f"  TTL: {r['expired']} users expired, {r['freed_pages']} pages freed in "
+                f"{r['maintenance_s']:4.1f} s -> {r['after_ttl_mb']:6.1f} MB"
+            )
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--child", choices=("v1", "none", "zlib"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(args.child, args.users, args.turns)))
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
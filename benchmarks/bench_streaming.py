@@ -0,0 +1,93 @@
+"""
+Time to first byte: non-streaming completion vs. astream_chat_completion
+against a local streaming stub (first token after --latency, then one
+chunk every --token-interval seconds).
+Then a check: when the final edit of a streamed reply keeps hitting the Telegram flood limit
+after outbound's retries, stream_reply() still returns the answer (so bot_mem saves the turn).
+
+Run from project root: python -m benchmarks.bench_streaming --tokens 200 --token-interval 0.02
+"""
+import argparse
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+MESSAGES = [{"role": "user", "content": "tell me a long story"}]
+
+
+async def run(latency: float, tokens: int, token_interval: float, rounds: int) -> None:
+    async with FakeOpenAIServer(latency=latency, tokens=tokens, token_interval=token_interval) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        from common import openai_client
+
+        await openai_client.achat_completion_with_messages(MESSAGES)  # warm pool
+        full, ttfb, total = [], [], []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            ok, _ = await openai_client.achat_completion_with_messages(MESSAGES)
+            assert ok
+            full.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            first = None
+            async for _ in openai_client.astream_chat_completion(MESSAGES):
+                if first is None:
+                    first = time.perf_counter() - t0
+            total.append(time.perf_counter() - t0)
+            ttfb.append(first)
+        await openai_client.close_clients()
+
+    avg = lambda xs: sum(xs) / len(xs) * 1000  # noqa: E731
+    print(f"non-streaming: first text after {avg(full):8.1f}ms")
+    print(f"streaming:     first text after {avg(ttfb):8.1f}ms, complete after {avg(total):.1f}ms")
+
+
+class _FloodedMessage:
+    """Message whose edits always hit the flood limit; new messages go through."""
+
+    def __init__(self) -> None:
+        self.chat = SimpleNamespace(id=1)
+        self.edits = 0
+
+    async def answer(self, text: str, **kwargs) -> "_FloodedMessage":
+        return self
+
+    async def edit_text(self, text: str) -> None:
+        self.edits += 1
+        method = EditMessageText(text=text, chat_id=self.chat.id, message_id=1)
+        raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+
+
+async def check_final_flood() -> None:
+    from common.streaming import stream_reply
+
+    async def deltas():
+        for word in ("the ", "whole ", "answer"):
+            yield word
+
+    message = _FloodedMessage()
+    result = await stream_reply(message, deltas())
+    assert result == (True, "the whole answer"), result
+    print(f"final edit flooded ({message.edits} attempts): stream_reply returned the answer, turn is saved")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.latency, args.tokens, args.token_interval, args.rounds))
+    asyncio.run(check_final_flood())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Bursty users: upstream calls and history order with the per-user TurnScheduler
+versus handling every message concurrently (the old on_text behaviour).
+Each user sends --burst messages --gap seconds apart; a "completion" takes --latency.
+Then overflow: a user sending more than max_pending messages during one turn has the extra
+ones dropped, counted in stats() and gets a single on_drop notice. And /reset: run_exclusive()
+discards pending messages, waits for the turn in flight and runs before later messages, so
+nothing sent before the reset is saved after it.
+
+Run from project root: python -m benchmarks.bench_turn_scheduler --users 200 --burst 4
+"""
+import argparse
+import asyncio
+import random
+
+from common.turn_scheduler import TurnScheduler
+
+
+class _Bot:
+    """Fake completion + history store: records calls and what each turn saw."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.history: dict[int, list[str]] = {}
+
+    async def turn(self, user_id: int, texts: list[str]) -> None:
+        snapshot = len(self.history.get(user_id, []))
+        self.calls += 1
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        history = self.history.setdefault(user_id, [])
+        if len(history) != snapshot:
+            history.append("<stale context>")
+        history.extend(texts)
+
+
+async def _burst(user_id: int, burst: int, gap: float, send) -> None:
+    for i in range(burst):
+        send(user_id, f"{user_id}:{i}")
+        await asyncio.sleep(gap)
+
+
+def _ordered(bot: _Bot, burst: int) -> int:
+    ok = 0
+    for user_id, history in bot.history.items():
+        if history == [f"{user_id}:{i}" for i in range(burst)]:
+            ok += 1
+    return ok
+
+
+async def run(users: int, burst: int, gap: float, latency: float, debounce: float) -> None:
+    naive = _Bot(latency)
+    tasks = []
+    await asyncio.gather(
+        *(_burst(u, burst, gap, lambda uid, t: tasks.append(asyncio.create_task(naive.turn(uid, [t])))) for u in range(users))
+    )
+    await asyncio.gather(*tasks)
+
+    scheduled = _Bot(latency)
+    scheduler = TurnScheduler(lambda uid, items: scheduled.turn(uid, items), debounce=debounce)
+    await asyncio.gather(*(_burst(u, burst, gap, scheduler.submit) for u in range(users)))
+    await scheduler.drain()
+
+    total = users * burst
+    print(f"{total} messages from {users} users, bursts of {burst}, gap {gap * 1000:.0f}ms")
+    print(f"concurrent per message: upstream calls={naive.calls:5d}, users with ordered history={_ordered(naive, burst)}/{users}")
+    print(f"turn scheduler:         upstream calls={scheduled.calls:5d}, users with ordered history={_ordered(scheduled, burst)}/{users}")
+    print(f"idle user state left: {scheduler.active_users}")
+
+
+async def check_overflow(max_pending: int = 5, extra: int = 7) -> None:
+    bot = _Bot(0.05)
+    notices: list[str] = []
+
+    async def on_drop(user_id: int, item: str) -> None:
+        notices.append(item)
+
+    scheduler = TurnScheduler(lambda uid, items: bot.turn(uid, items), debounce=0.01, max_pending=max_pending, on_drop=on_drop)
+    accepted = [scheduler.submit(1, f"1:{i}") for i in range(max_pending + extra)]
+    await scheduler.drain()
+    await asyncio.sleep(0)
+    stats = scheduler.stats()
+    print(f"overflow: {sum(accepted)} of {len(accepted)} queued, dropped={stats['dropped']}, notices={len(notices)}")
+    assert accepted == [True] * max_pending + [False] * extra
+    assert stats == {"active_users": 0, "dropped": extra} and notices == [f"1:{max_pending}"]
+
+
+async def check_reset(latency: float = 0.1) -> None:
+    bot = _Bot(latency)
+    scheduler = TurnScheduler(lambda uid, items: bot.turn(uid, items), debounce=0.01)
+
+    async def clear() -> None:
+        bot.history[1] = []
+
+    scheduler.submit(1, "1:0")
+    await asyncio.sleep(latency / 4)  # "1:0" is in flight
+    scheduler.submit(1, "1:1")
+    scheduler.submit(1, "1:2")
+    reset = asyncio.create_task(scheduler.run_exclusive(1, clear))
+    await asyncio.sleep(0)
+    scheduler.submit(1, "1:3")  # sent after /reset
+    await reset
+    await scheduler.drain()
+    print(f"reset: history after it {bot.history[1]}, upstream calls {bot.calls}, idle state left {scheduler.active_users}")
+    assert bot.history[1] == ["1:3"] and bot.calls == 2 and scheduler.active_users == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=4)
+    parser.add_argument("--gap", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--debounce", type=float, default=0.3)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.burst, args.gap, args.latency, args.debounce))
+    asyncio.run(check_overflow())
+    asyncio.run(check_reset())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Webhook mode (common/webhook.py) on localhost: the aiohttp app from build_app() with a dispatcher
+whose handler counts messages. Sample updates are POSTed to it:
+
+1. Secret check: the right X-Telegram-Bot-Api-Secret-Token reaches the handler; a wrong or
+   missing one gets 401 and the handler does not run; without a configured secret every
+   update is accepted. is_exposed() refuses an empty secret on a non-loopback host.
+2. Throughput: --updates updates POSTed with --concurrency in flight: updates/s until every
+   handler has run.
+
+Run from project root: python -m benchmarks.bench_webhook --updates 2000
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp import web
+
+from common.webhook import WebhookTarget, build_app, is_exposed
+
+TOKEN = "1001:fake-webhook"
+PATH = "/webhook/bench"
+SECRET = "bench-secret"
+
+
+def _update(update_id: int) -> dict:
+    user = {"id": update_id % 100 + 1, "is_bot": False, "first_name": "user"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": f"message {update_id}",
+        },
+    }
+
+
+class _Server:
+    """build_app() with a counting handler, served on a free localhost port."""
+
+    def __init__(self, secret: str):
+        self.secret = secret
+        self.handled = 0
+        self.url = ""
+        self._runner: web.AppRunner | None = None
+
+    async def __aenter__(self) -> "_Server":
+        router = Router()
+
+        @router.message()
+        async def count(message: Message) -> None:
+            self.handled += 1
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        app = build_app([WebhookTarget("bench", Bot(token=TOKEN), dp, PATH)], secret=self.secret)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}{PATH}"
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._runner.cleanup()
+
+    async def wait_handled(self, count: int, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.handled < count and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+        return self.handled >= count
+
+
+async def _post(session: aiohttp.ClientSession, url: str, update_id: int, secret: str | None) -> int:
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret is not None else {}
+    async with session.post(url, json=_update(update_id), headers=headers) as response:
+        return response.status
+
+
+async def check_secret() -> None:
+    async with _Server(SECRET) as srv, aiohttp.ClientSession() as session:
+        status = await _post(session, srv.url, 1, SECRET)
+        assert status == 200 and await srv.wait_handled(1), f"right secret: {status}, handled {srv.handled}"
+        wrong = await _post(session, srv.url, 2, "wrong")
+        missing = await _post(session, srv.url, 3, None)
+        await asyncio.sleep(0.2)
+        assert wrong == 401 and missing == 401, f"wrong secret {wrong}, missing {missing}"
+        assert srv.handled == 1, f"rejected updates were handled: {srv.handled}"
+        print(f"secret set: right 200 (handled), wrong {wrong}, missing {missing} (not handled)")
+
+    async with _Server("") as srv, aiohttp.ClientSession() as session:
+        status = await _post(session, srv.url, 1, None)
+        assert status == 200 and await srv.wait_handled(1)
+        print(f"no secret: update without header {status} (handled)")
+
+    assert is_exposed("0.0.0.0", "") and is_exposed("bot.example.com", "")
+    assert not is_exposed("127.0.0.1", "") and not is_exposed("::1", "") and not is_exposed("localhost", "")
+    assert not is_exposed("0.0.0.0", SECRET)
+    print("is_exposed: empty secret refused on 0.0.0.0 and host names, allowed on loopback")
+
+
+async def throughput(updates: int, concurrency: int) -> None:
+    async with _Server(SECRET) as srv, aiohttp.ClientSession() as session:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(update_id: int) -> int:
+            async with sem:
+                return await _post(session, srv.url, update_id, SECRET)
+
+        t0 = time.perf_counter()
+        statuses = await asyncio.gather(*(one(i) for i in range(1, updates + 1)))
+        assert await srv.wait_handled(updates), f"handled {srv.handled}/{updates}"
+        took = time.perf_counter() - t0
+        assert all(s == 200 for s in statuses)
+        print(f"{updates} updates, {concurrency} in flight: {updates / took:.0f} updates/s")
+
+
+async def run(args) -> None:
+    await check_secret()
+    await throughput(args.updates, args.concurrency)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Local fake OpenAI chat-completions server (aiohttp) for benchmarks."""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeOpenAIServer:
+    """
+    Minimal /v1/chat/completions stub. A reply of `tokens` chunks is "generated":
+    the first chunk after `latency` seconds, each next one `token_interval` later.
+    Non-streaming requests answer once the whole reply is ready; `stream=true`
+    requests get SSE chunks as they are produced. Use as `async with FakeOpenAIServer() as srv`.
+
+    Fault injection: a `fail_rate` share of requests gets HTTP `fail_status` (with a
+    Retry-After header when `retry_after` is set); a `slow_rate` share takes `slow_latency`
+    instead of `latency`. Per model: `model_latency` overrides `latency`, models in
+    `down_models` always fail. Attributes can be changed while the server runs.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        reply: str = "ok",
+        tokens: int = 1,
+        token_interval: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        fail_rate: float = 0.0,
+        fail_status: int = 503,
+        retry_after: float | None = None,
+        slow_rate: float = 0.0,
+        slow_latency: float = 2.0,
+        seed: int | None = None,
+        model_latency: dict[str, float] | None = None,
+        down_models: set[str] | None = None,
+    ):
+        self.latency = latency
+        self.reply = reply
+        self.tokens = max(1, tokens)
+        self.token_interval = token_interval
+        self.host = host
+        self.port = port
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.model_latency = model_latency or {}
+        self.down_models = down_models or set()
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.by_model: Counter[str] = Counter()
+        self.failures = 0
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _pieces(self) -> list[str]:
+        if self.tokens == 1:
+            return [self.reply]
+        return [f"{self.reply}{i} " for i in range(self.tokens)]
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        model = body.get("model", "fake")
+        self.by_model[model] += 1
+        if model in self.down_models or self._random.random() < self.fail_rate:
+            return self._fault()
+        latency = self.model_latency.get(model, self.latency)
+        if self._random.random() < self.slow_rate:
+            latency = self.slow_latency
+        pieces = self._pieces()
+        if body.get("stream"):
+            return await self._stream(request, model, pieces, latency)
+        await asyncio.sleep(latency + self.token_interval * (len(pieces) - 1))
+        return web.json_response(
+            {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(pieces)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 1, "completion_tokens": len(pieces), "total_tokens": len(pieces) + 1},
+            }
+        )
+
+    def _fault(self) -> web.Response:
+        self.failures += 1
+        headers = {"Retry-After": f"{self.retry_after:g}"} if self.retry_after is not None else None
+        return web.json_response(
+            {"error": {"message": "injected fault", "type": "server_error", "code": None}},
+            status=self.fail_status,
+            headers=headers,
+        )
+
+    async def _stream(
+        self, request: web.Request, model: str, pieces: list[str], latency: float
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(latency)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            chunk = {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeOpenAIServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
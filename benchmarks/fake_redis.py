@@ -0,0 +1,226 @@
+"""Local fake Redis server (RESP2 over asyncio) for the history backend benchmarks."""
+import asyncio
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class _Error(Exception):
+    pass
+
+
+def _reply(value) -> bytes:
+    if isinstance(value, _Error):
+        return b"-%s\r\n" % str(value).encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(_reply(v) for v in value)
+
+
+def _parse(buffer: bytearray) -> list[list[bytes]]:
+    """Take every complete command (array of bulk strings) off the front of buffer."""
+    commands, pos = [], 0
+    while True:
+        end = buffer.find(b"\r\n", pos)
+        if end < 0 or buffer[pos:pos + 1] != b"*":
+            break
+        count, cursor, args = int(buffer[pos + 1:end]), end + 2, []
+        for _ in range(count):
+            line_end = buffer.find(b"\r\n", cursor)
+            if line_end < 0:
+                break
+            size = int(buffer[cursor + 1:line_end])
+            if len(buffer) < line_end + 2 + size + 2:
+                break
+            args.append(bytes(buffer[line_end + 2:line_end + 2 + size]))
+            cursor = line_end + 2 + size + 2
+        if len(args) < count:
+            break
+        commands.append(args)
+        pos = cursor
+    del buffer[:pos]
+    return commands
+
+
+def _index(value: bytes, size: int) -> int:
+    i = int(value)
+    return i + size if i < 0 else i
+
+
+class FakeRedisServer:
+    """
+    The commands the Redis history backend uses: PING, AUTH, SELECT, RPUSH, LTRIM, LRANGE, LLEN,
+    DEL, EXISTS, EXPIRE, TTL, MULTI/EXEC/DISCARD, FLUSHDB; keys expire lazily. Replies to a chunk
+    of pipelined commands go out after `latency` seconds, once per chunk (one network round trip).
+    Counts commands and round trips.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.commands = 0
+        self.round_trips = 0
+        self._lists: dict[bytes, list[bytes]] = {}
+        self._expires: dict[bytes, float] = {}
+        self._server: asyncio.base_events.Server | None = None
+        self._handlers: set[asyncio.Task] = set()
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    def _list(self, key: bytes) -> list[bytes] | None:
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._lists.pop(key, None)
+            self._expires.pop(key, None)
+        return self._lists.get(key)
+
+    def _execute(self, args: list[bytes]):
+        name, args = args[0].upper().decode(), args[1:]
+        self.commands += 1
+        if name == "PING":
+            return "PONG"
+        if name in ("AUTH", "SELECT"):
+            return "OK"
+        if name == "FLUSHDB":
+            self._lists.clear()
+            self._expires.clear()
+            return "OK"
+        if name == "RPUSH":
+            items = self._list(args[0])
+            if items is None:
+                items = self._lists[args[0]] = []
+            items.extend(args[1:])
+            return len(items)
+        if name in ("LTRIM", "LRANGE"):
+            items = self._list(args[0]) or []
+            start = max(0, _index(args[1], len(items)))
+            stop = _index(args[2], len(items))
+            kept = items[start:stop + 1]
+            if name == "LRANGE":
+                return kept
+            if kept:
+                self._lists[args[0]] = kept
+            else:
+                self._lists.pop(args[0], None)
+                self._expires.pop(args[0], None)
+            return "OK"
+        if name == "LLEN":
+            return len(self._list(args[0]) or [])
+        if name in ("DEL", "EXISTS"):
+            found = [key for key in args if self._list(key) is not None]
+            if name == "DEL":
+                for key in found:
+                    self._lists.pop(key)
+                    self._expires.pop(key, None)
+            return len(found)
+        if name == "EXPIRE":
+            if self._list(args[0]) is None:
+                return 0
+            self._expires[args[0]] = time.monotonic() + int(args[1])
+            return 1
+        if name == "TTL":
+            if self._list(args[0]) is None:
+                return -2
+            deadline = self._expires.get(args[0])
+            return -1 if deadline is None else max(0, round(deadline - time.monotonic()))
+        return _Error(f"ERR unknown command '{name}'")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        buffer = bytearray()
+        queued: list[list[bytes]] | None = None  # commands after MULTI
+        aborted = False
+        try:
+            while chunk := await reader.read(65536):
+                buffer += chunk
+                commands = _parse(buffer)
+                if not commands:
+                    continue
+                self.round_trips += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                out = []
+                for command in commands:
+                    name = command[0].upper()
+                    if name == b"MULTI":
+                        queued, aborted = [], False
+                        out.append(_reply("OK"))
+                    elif name == b"EXEC":
+                        if aborted:
+                            out.append(_reply(_Error("EXECABORT Transaction discarded because of previous errors.")))
+                        else:
+                            out.append(_reply([self._execute(c) for c in queued or []]))
+                        queued = None
+                    elif name == b"DISCARD":
+                        queued = None
+                        out.append(_reply("OK"))
+                    elif queued is not None:
+                        if name.decode() not in _KNOWN:
+                            aborted = True
+                            out.append(_reply(_Error(f"ERR unknown command '{name.decode()}'")))
+                        else:
+                            queued.append(command)
+                            out.append(_reply("QUEUED"))
+                    else:
+                        out.append(_reply(self._execute(command)))
+                writer.write(b"".join(out))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        # Clients that did not disconnect: end their handlers before the loop goes away
+        handlers = list(self._handlers)
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    async def __aenter__(self) -> "FakeRedisServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+
+_KNOWN = {
+    "PING", "AUTH", "SELECT", "FLUSHDB", "RPUSH", "LTRIM", "LRANGE", "LLEN", "DEL", "EXISTS", "EXPIRE", "TTL",
+}
+
+
+@contextmanager
+def fake_redis_thread(latency: float = 0.0) -> Iterator[FakeRedisServer]:
+    """FakeRedisServer on its own event loop in a daemon thread, for blocking clients."""
+    loop = asyncio.new_event_loop()
+    server = FakeRedisServer(latency=latency)
+    thread = threading.Thread(target=loop.run_forever, name="fake-redis", daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,216 @@
+"""Local fake Telegram Bot API server (aiohttp) for end-to-end benchmarks."""
+import asyncio
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable
+
+from aiohttp import web
+
+
+class _BotState:
+    def __init__(self) -> None:
+        self.updates: list[dict] = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.arrived = asyncio.Event()
+
+
+class FakeTelegramServer:
+    """
+    Minimal Bot API: getMe, getUpdates (long polling), sendMessage, editMessageText; other
+    methods answer {"ok": true, "result": true}. Serves any number of bot tokens, each with
+    its own update queue. Use with aiogram via TelegramAPIServer.from_base(srv.base_url).
+
+    push_message() enqueues a user message and remembers when it was sent. When the bot
+    writes to that chat, the oldest waiting messages get `first` latency; when the text is
+    a final reply (is_final(text)), they get `done` latency and are considered answered.
+    Messages merged into one reply (debounce) are all answered by it, so a user should
+    wait for answered() before sending the next turn: replies carry no reply-to link.
+
+    Flood limits like Telegram's: more than `chat_limit` sends/edits to one chat or
+    `global_limit` in total within one second get 429 with retry_after (0 disables).
+    Accepted texts are kept per chat in `outputs`. Every request is answered after `latency`
+    seconds (round trip to the real API).
+    """
+
+    def __init__(
+        self,
+        is_final: Callable[[str], bool] = lambda text: True,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        chat_limit: int = 0,
+        global_limit: int = 0,
+        retry_after: int = 1,
+        latency: float = 0.0,
+    ):
+        self.is_final = is_final
+        self.latency = latency
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.retry_after = retry_after
+        self.flood_errors = 0
+        self.outputs: dict[int, list[str]] = defaultdict(list)
+        self._recent: dict[int | None, deque[float]] = defaultdict(deque)
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.first_latencies: list[float] = []
+        self.done_latencies: list[float] = []
+        self.replies: list[str] = []
+        self._bots: dict[str, _BotState] = defaultdict(_BotState)
+        # (token, chat_id) -> [sent_at, got_first_output] of messages not answered yet
+        self._waiting: dict[tuple[str, int], deque[list]] = defaultdict(deque)
+        self._answered: dict[tuple[str, int], asyncio.Event] = {}
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def unanswered(self) -> int:
+        return sum(len(q) for q in self._waiting.values())
+
+    def push_message(self, token: str, user_id: int, text: str) -> None:
+        """Enqueue a private-chat text message from user_id to the bot (call on the server's loop)."""
+        state = self._bots[token]
+        update_id = state.next_update_id
+        state.next_update_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        state.updates.append(
+            {
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+                    "from": user,
+                    "text": text,
+                },
+            }
+        )
+        self._waiting[(token, user_id)].append([time.perf_counter(), False])
+        self._answered.setdefault((token, user_id), asyncio.Event()).clear()
+        state.arrived.set()
+
+    async def answered(self, token: str, user_id: int) -> None:
+        """Wait until every message the user sent has got a final reply."""
+        event = self._answered.get((token, user_id))
+        if event is not None:
+            await event.wait()
+
+    def _bot_output(self, token: str, chat_id: int, text: str) -> None:
+        now = time.perf_counter()
+        waiting = self._waiting.get((token, chat_id))
+        if not waiting:
+            return
+        for entry in waiting:
+            if not entry[1]:
+                entry[1] = True
+                self.first_latencies.append(now - entry[0])
+        if self.is_final(text):
+            self.replies.append(text)
+            while waiting:
+                self.done_latencies.append(now - waiting.popleft()[0])
+            self._answered[(token, chat_id)].set()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        token = request.match_info["token"]
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.can_read_body else {}
+        handler = getattr(self, f"_m_{method}", None)
+        if method in ("sendMessage", "editMessageText") and self._flooded(int(params["chat_id"])):
+            self.flood_errors += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+        result = await handler(token, params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    def _flooded(self, chat_id: int) -> bool:
+        """Count a send to chat_id in the one-second windows; True if it breaks a limit."""
+        now = time.monotonic()
+        checks = [(chat_id, self.chat_limit), (None, self.global_limit)]
+        for key, limit in checks:
+            recent = self._recent[key]
+            while recent and now - recent[0] >= 1.0:
+                recent.popleft()
+            if limit and len(recent) >= limit:
+                return True
+        for key, _ in checks:
+            self._recent[key].append(now)
+        return False
+
+    async def _m_getMe(self, token: str, params: dict) -> dict:
+        bot_id = int(token.split(":", 1)[0])
+        return {"id": bot_id, "is_bot": True, "first_name": f"bot{bot_id}", "username": f"bot{bot_id}_bot"}
+
+    async def _m_getUpdates(self, token: str, params: dict) -> list[dict]:
+        state = self._bots[token]
+        offset = int(params.get("offset", 0) or 0)
+        state.updates = [u for u in state.updates if u["update_id"] >= offset]
+        if not state.updates:
+            state.arrived.clear()
+            try:
+                await asyncio.wait_for(state.arrived.wait(), float(params.get("timeout", 0) or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit", 100) or 100)
+        return state.updates[:limit]
+
+    def _message(self, token: str, chat_id: int, text: str, message_id: int | None = None) -> dict:
+        state = self._bots[token]
+        if message_id is None:
+            message_id = state.next_message_id
+            state.next_message_id += 1
+        bot_id = int(token.split(":", 1)[0])
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": bot_id, "is_bot": True, "first_name": f"bot{bot_id}"},
+            "text": text,
+        }
+
+    async def _m_sendMessage(self, token: str, params: dict) -> dict:
+        chat_id, text = int(params["chat_id"]), params.get("text", "")
+        self.outputs[chat_id].append(text)
+        self._bot_output(token, chat_id, text)
+        return self._message(token, chat_id, text)
+
+    async def _m_editMessageText(self, token: str, params: dict) -> dict:
+        chat_id, text = int(params["chat_id"]), params.get("text", "")
+        self._bot_output(token, chat_id, text)
+        return self._message(token, chat_id, text, int(params["message_id"]))
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        for state in self._bots.values():
+            state.arrived.set()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeTelegramServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
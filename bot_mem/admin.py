@@ -0,0 +1,120 @@
+"""
+Admin CLI for the bot_mem database (MEMORY_DB_PATH; one shard at a time in sharded mode):
+
+  python -m bot_mem.admin export [-o FILE]     all history as NDJSON (stdout by default)
+  python -m bot_mem.admin import FILE          load an export ("-" = stdin), trimmed as usual
+  python -m bot_mem.admin backup DEST          online copy of the database file
+  python -m bot_mem.admin vacuum-mode          switch an older file to auto_vacuum=INCREMENTAL
+
+Export and backup are safe while the bot runs. Import takes the write lock chunk by chunk,
+so bot writes wait up to one chunk; users the bot has cached see imported rows after restart.
+vacuum-mode rewrites the whole file (VACUUM) under an exclusive lock and needs free disk space
+of about the DB size: stop the bot first. New files get the mode at creation.
+Only the SQLite history backend is covered (MEMORY_BACKEND=sqlite).
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path so "common" is importable when running this file directly
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from common.config import MEMORY_BACKEND, MEMORY_DB_PATH
+from common.db import backup, close_connections, enable_incremental_vacuum, init_db
+from common.logging_setup import setup_logging
+from common import memory_repo
+
+logger = logging.getLogger("bot_mem.admin")
+
+# Progress is logged every this many records
+_PROGRESS_EVERY = 1_000_000
+
+
+def _counted(records, action: str):
+    count, started = 0, time.monotonic()
+    for record in records:
+        yield record
+        count += 1
+        if count % _PROGRESS_EVERY == 0:
+            logger.info("%s: %s записей, %.0f записей/с", action, count, count / (time.monotonic() - started))
+
+
+def cmd_export(args) -> None:
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started, count = time.monotonic(), 0
+    try:
+        for record in _counted(memory_repo.export_records(args.page), "Экспорт"):
+            out.write(json.dumps(record, ensure_ascii=False))
+            out.write("\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info("Экспорт завершён: %s записей за %.1f с", count, time.monotonic() - started)
+
+
+def cmd_import(args) -> None:
+    init_db()
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    started = time.monotonic()
+    try:
+        records = (json.loads(line) for line in source if line.strip())
+        counts = memory_repo.import_records(_counted(records, "Импорт"), args.chunk)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    logger.info(
+        "Импорт завершён: %s сообщений, %s сводок за %.1f с",
+        counts["messages"], counts["summaries"], time.monotonic() - started,
+    )
+
+
+def cmd_backup(args) -> None:
+    backup(Path(args.dest), args.pages)
+
+
+def cmd_vacuum_mode(args) -> None:
+    if not enable_incremental_vacuum():
+        logger.info("БД уже в режиме auto_vacuum=INCREMENTAL")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="history as NDJSON: summaries, then messages by id")
+    export.add_argument("-o", "--output", default="-")
+    export.add_argument("--page", type=int, default=5000, help="rows per read")
+    export.set_defaults(run=cmd_export)
+    load = commands.add_parser("import", help="load an export (new ids, HISTORY_PAIRS_LIMIT trimming)")
+    load.add_argument("file")
+    load.add_argument("--chunk", type=int, default=50000, help="rows per transaction")
+    load.set_defaults(run=cmd_import)
+    copy = commands.add_parser("backup", help="online copy of the database file")
+    copy.add_argument("dest")
+    copy.add_argument("--pages", type=int, default=-1, help="pages per step (-1 = one read transaction)")
+    copy.set_defaults(run=cmd_backup)
+    vacuum = commands.add_parser("vacuum-mode", help="switch to auto_vacuum=INCREMENTAL (full rebuild, bot stopped)")
+    vacuum.set_defaults(run=cmd_vacuum_mode)
+    args = parser.parse_args()
+
+    # stdout may carry the export: logs go to stderr
+    setup_logging("bot_mem.admin", stream=sys.stderr)
+    if MEMORY_BACKEND != "sqlite":
+        logger.warning("MEMORY_BACKEND=%s: команды работают только с SQLite-базой %s", MEMORY_BACKEND, MEMORY_DB_PATH)
+    logger.info("БД: %s", MEMORY_DB_PATH)
+    try:
+        args.run(args)
+    except Exception as e:
+        logger.exception("Ошибка команды %s: %s", args.command, e)
+        sys.exit(1)
+    finally:
+        close_connections()
+
+
+if __name__ == "__main__":
+    main()
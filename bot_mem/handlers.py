@@ -1,19 +1,24 @@
 """Handlers for bot with memory: /start, /help, /reset, /context (inline button), text -> OpenAI + save."""
 import logging
+import time
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
-from common.openai_client import chat_completion_with_messages, SYSTEM_PROMPT
-from common.memory_repo import add_message, get_context, clear_user
+from common.compaction import compactor
+from common.config import MEMORY_COMPACTION, STREAM_REPLIES
+from common.openai_client import achat_completion_with_messages, astream_chat_completion, SYSTEM_PROMPT
+from common.context_builder import build_messages
+from common.logging_setup import SAMPLED
+from common.metrics import registry, turn_seconds
+from common.outbound import BULK, outbound
+from common.memory_store import memory_store
+from common.streaming import TELEGRAM_MAX_LEN, chunk_text, stream_reply
+from common.turn_scheduler import TurnScheduler
 
 router = Router(name="mem")
 logger = logging.getLogger(__name__)
 
-# Telegram message length limit
-TELEGRAM_MAX_LEN = 4096
-
-
 HELP_TEXT = """Команды:
 /start — приветствие
 /help — список команд
@@ -26,16 +31,6 @@ HELP_TEXT = """Команды:
 CALLBACK_SHOW_CONTEXT = "show_context"
 
 
-def _build_messages(user_id: int, new_user_text: str) -> list[dict[str, str]]:
-    """[system, ...last 2*N messages from DB..., new user message]. No extra metadata."""
-    out = [{"role": "system", "content": SYSTEM_PROMPT}]
-    history = get_context(user_id)
-    for m in history:
-        out.append({"role": m["role"], "content": m["content"]})
-    out.append({"role": "user", "content": new_user_text})
-    return out
-
-
 def _format_context_for_display(history: list[dict]) -> str:
     """Format as 'User: ...\n\nAssistant: ...'."""
     lines = []
@@ -46,30 +41,10 @@ def _format_context_for_display(history: list[dict]) -> str:
     return "\n\n".join(lines) if lines else ""
 
 
-def _chunk_text(text: str, max_len: int = TELEGRAM_MAX_LEN - 100) -> list[str]:
-    """Split text into chunks not exceeding max_len. Prefer split at \n\n."""
-    if len(text) <= max_len:
-        return [text] if text else []
-    chunks = []
-    remainder = text
-    while remainder:
-        if len(remainder) <= max_len:
-            chunks.append(remainder)
-            break
-        block = remainder[:max_len]
-        last_break = block.rfind("\n\n")
-        if last_break > max_len // 2:
-            chunks.append(remainder[: last_break + 2].rstrip())
-            remainder = remainder[last_break + 2 :].lstrip()
-        else:
-            chunks.append(block)
-            remainder = remainder[max_len:]
-    return chunks
-
-
 @router.message(F.text, F.text == "/start")
 async def cmd_start(message: Message) -> None:
-    await message.answer(
+    await outbound.answer(
+        message,
         "Привет! Я бот с памятью: помню последние сообщения в диалоге.\n\n"
         + HELP_TEXT
     )
@@ -77,19 +52,20 @@ async def cmd_start(message: Message) -> None:
 
 @router.message(F.text, F.text == "/help")
 async def cmd_help(message: Message) -> None:
-    await message.answer(HELP_TEXT)
+    await outbound.answer(message, HELP_TEXT)
 
 
 @router.message(F.text, F.text == "/reset")
 async def cmd_reset(message: Message) -> None:
     user_id = message.from_user.id if message.from_user else 0
     try:
-        clear_user(user_id)
+        # Between turns: messages sent before /reset must not be saved after the clear
+        await turn_scheduler.run_exclusive(user_id, lambda: memory_store.clear_user(user_id))
         logger.info("Контекст очищен для user_id=%s", user_id)
-        await message.answer("История диалога очищена.")
+        await outbound.answer(message, "История диалога очищена.")
     except Exception:
         logger.exception("Ошибка при сбросе контекста для user_id=%s", user_id)
-        await message.answer("Не удалось очистить историю. Попробуйте позже.")
+        await outbound.answer(message, "Не удалось очистить историю. Попробуйте позже.")
 
 
 @router.message(F.text, F.text == "/context")
@@ -97,57 +73,88 @@ async def cmd_context(message: Message) -> None:
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="Показать контекст", callback_data=CALLBACK_SHOW_CONTEXT)]
     ])
-    await message.answer("Нажмите кнопку, чтобы увидеть текущий контекст диалога:", reply_markup=keyboard)
+    await outbound.answer(message, "Нажмите кнопку, чтобы увидеть текущий контекст диалога:", reply_markup=keyboard)
 
 
 @router.callback_query(F.data == CALLBACK_SHOW_CONTEXT)
 async def on_show_context(callback: CallbackQuery) -> None:
     user_id = callback.from_user.id if callback.from_user else 0
     try:
-        history = get_context(user_id)
+        history = await memory_store.get_context(user_id)
         if not history:
-            await callback.message.answer("Контекст пуст. Напишите что-нибудь, чтобы начать диалог.")
+            await outbound.answer(callback.message, "Контекст пуст. Напишите что-нибудь, чтобы начать диалог.")
             await callback.answer()
             return
         text = _format_context_for_display(history)
         if len(text) > TELEGRAM_MAX_LEN:
-            chunks = _chunk_text(text)
+            chunks = chunk_text(text)
             if len(chunks) > 5:
                 # Too many chunks: show last part only
                 tail = "\n\n".join(chunks[-2:]) if len(chunks) >= 2 else chunks[-1]
                 if len(tail) > TELEGRAM_MAX_LEN - 80:
                     tail = tail[-(TELEGRAM_MAX_LEN - 80) :]
-                await callback.message.answer("Контекст длинный, показана последняя часть.\n\n" + tail)
+                await outbound.answer(callback.message, "Контекст длинный, показана последняя часть.\n\n" + tail, BULK)
             else:
-                for chunk in chunks:
-                    await callback.message.answer(chunk)
+                # Bulk output: replies to new messages in this chat may go in between the chunks
+                await outbound.answer_chunks(callback.message, chunks)
         else:
-            await callback.message.answer(text)
+            await outbound.answer(callback.message, text, BULK)
         logger.info("Контекст показан user_id=%s", user_id)
     except Exception as e:
         logger.exception("Ошибка при чтении БД для показа контекста: %s", e)
-        await callback.message.answer("Не удалось загрузить контекст. Попробуйте позже.")
+        await outbound.answer(callback.message, "Не удалось загрузить контекст. Попробуйте позже.")
     await callback.answer()
 
 
-@router.message(F.text)
-async def on_text(message: Message) -> None:
-    if not message.text or not message.text.strip():
-        return
-    user_id = message.from_user.id if message.from_user else 0
-    text_in = message.text.strip()
-    logger.info("Получено сообщение от user_id=%s", user_id)
+async def _process_turn(user_id: int, messages: list[Message]) -> None:
+    """One turn for user: messages sent in a burst are merged into one request; reply to the last one."""
+    message = messages[-1]
+    text_in = "\n\n".join(m.text.strip() for m in messages)
+    if len(messages) > 1:
+        logger.info("Объединено %s сообщений в один запрос user_id=%s", len(messages), user_id, extra=SAMPLED)
+    started = time.perf_counter()
     try:
-        messages = _build_messages(user_id, text_in)
-        success, reply = chat_completion_with_messages(messages)
+        history = await memory_store.get_context(user_id)
+        summary = await memory_store.get_summary(user_id) if MEMORY_COMPACTION else None
+        # Search only what the window does not already carry
+        recalled = await memory_store.recall(user_id, text_in, before_id=history[0].get("id") if history else None)
+        request = build_messages(
+            SYSTEM_PROMPT, history, text_in, summary=summary["content"] if summary else None, recalled=recalled
+        )
+        if STREAM_REPLIES:
+            # Reply is shown while it streams; only the final assembled text is persisted
+            success, reply = await stream_reply(message, astream_chat_completion(request, user_id=user_id))
+        else:
+            success, reply = await achat_completion_with_messages(request, user_id=user_id)
         if success:
-            add_message(user_id, "user", text_in)
-            add_message(user_id, "assistant", reply)
-            logger.info("Запись в БД и ответ отправлен user_id=%s", user_id)
-            await message.answer(reply)
+            await memory_store.record_turn(user_id, text_in, reply)
+            if MEMORY_COMPACTION:
+                compactor.notify(user_id)
+            logger.info("Запись в БД и ответ отправлен user_id=%s", user_id, extra=SAMPLED)
         else:
             logger.error("Ошибка OpenAI для user_id=%s", user_id)
-            await message.answer(reply)
+        if not STREAM_REPLIES:
+            await outbound.answer(message, reply)
     except Exception as e:
         logger.exception("Ошибка при обработке сообщения (БД или OpenAI): %s", e)
-        await message.answer("Произошла ошибка. Попробуйте позже.")
+        await outbound.answer(message, "Произошла ошибка. Попробуйте позже.")
+    finally:
+        turn_seconds.observe(time.perf_counter() - started)
+
+
+async def _notify_dropped(user_id: int, message: Message) -> None:
+    await outbound.answer(message, "Слишком много сообщений подряд: часть из них пропущена. Дождитесь ответа.")
+
+
+# One turn in flight per user; bursts within TURN_DEBOUNCE_SECONDS become one turn
+turn_scheduler = TurnScheduler(_process_turn, on_drop=_notify_dropped)
+registry.add_stats("turn_scheduler", turn_scheduler.stats)
+
+
+@router.message(F.text)
+async def on_text(message: Message) -> None:
+    if not message.text or not message.text.strip():
+        return
+    user_id = message.from_user.id if message.from_user else 0
+    logger.info("Получено сообщение от user_id=%s", user_id, extra=SAMPLED)
+    turn_scheduler.submit(user_id, message)
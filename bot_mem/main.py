@@ -1,4 +1,4 @@
-"""Entry point for Telegram bot with memory (SQLite)."""
+"""Entry point for Telegram bot with memory (SQLite by default, see MEMORY_BACKEND)."""
 import asyncio
 import logging
 import sys
@@ -10,26 +10,87 @@ if str(_root) not in sys.path:
     sys.path.insert(0, str(_root))
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-from common.config import BOT_MEM_TOKEN, validate_bot_mem_config
-from common.logging_setup import setup_logging
-from common.db import init_db
-from bot_mem.handlers import router
+from common.compaction import compactor
+from common.config import (
+    BOT_MEM_TOKEN,
+    MEMORY_COMPACTION,
+    MEMORY_MAINTENANCE_INTERVAL,
+    TELEGRAM_API_BASE,
+    TURN_DRAIN_TIMEOUT,
+    validate_bot_mem_config,
+)
+from common.logging_setup import LogContext, setup_logging
+from common.maintenance import maintenance
+from common.metrics import HandlerTiming, start_metrics_server, stop_metrics_server
+from common.openai_client import close_clients, prepare_clients
+from common.memory_backends import memory_backend
+from common.memory_store import memory_store
+from common.startup import overlap_with_connect, warm_up
+from bot_mem.handlers import router, turn_scheduler
 
+logger = logging.getLogger("bot_mem")
 
-def main() -> None:
-    log = setup_logging("bot_mem")
-    validate_bot_mem_config()
+
+async def on_startup(bot: Bot) -> None:
+    """
+    Dispatcher startup hook (polling, webhook, worker): history storage is opened in a thread (DB
+    schema or Redis PING) while the Telegram connection opens; then storage threads, compactor and
+    maintenance (SQLite only), /metrics. The OpenAI
+    client is built in the background last: a CPU-bound import in another thread would slow the
+    steps above (GIL), while polling mostly waits on the network.
+    """
     try:
-        init_db()
-        log.info("БД инициализирована")
+        await overlap_with_connect(bot, memory_backend.open)
+        logger.info("Хранилище истории %s готово", memory_backend.name)
     except Exception as e:
-        log.exception("Ошибка инициализации БД: %s", e)
-        sys.exit(1)
+        logger.exception("Ошибка инициализации хранилища истории %s: %s", memory_backend.name, e)
+        raise
+    memory_store.start()
+    if MEMORY_COMPACTION:
+        compactor.start()
+    if MEMORY_MAINTENANCE_INTERVAL > 0 and memory_backend.extras:
+        maintenance.start()
+    await start_metrics_server()
+    warm_up(prepare_clients)
+
+
+async def on_shutdown() -> None:
+    """Dispatcher shutdown hook: finish queued turns, flush pending writes, close clients and storage."""
+    await turn_scheduler.drain(TURN_DRAIN_TIMEOUT)
+    await compactor.stop()
+    await maintenance.stop()
+    await memory_store.stop()
+    await close_clients()
+    memory_backend.close()
+    await stop_metrics_server()
+
 
-    bot = Bot(token=BOT_MEM_TOKEN)
+def create_dispatcher() -> Dispatcher:
+    """Dispatcher with the bot_mem router and lifecycle hooks."""
     dp = Dispatcher()
+    dp.update.outer_middleware(LogContext("bot_mem"))
+    dp.update.outer_middleware(HandlerTiming("bot_mem"))
     dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+
+def create_bot() -> Bot:
+    """Bot for BOT_MEM_TOKEN; talks to TELEGRAM_API_BASE when set."""
+    if TELEGRAM_API_BASE:
+        return Bot(token=BOT_MEM_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE)))
+    return Bot(token=BOT_MEM_TOKEN)
+
+
+def main() -> None:
+    log = setup_logging("bot_mem")
+    validate_bot_mem_config()
+    bot = create_bot()
+    dp = create_dispatcher()
 
     async def run() -> None:
         try:
@@ -0,0 +1,80 @@
+"""Entry point for sharded bot_mem: a front process polls Telegram and routes updates to worker processes."""
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+# Add project root to path so "common" is importable when running this file directly
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from aiogram import Dispatcher
+
+from common.config import BOT_MEM_WORKERS, validate_bot_mem_config
+from common.logging_setup import LogContext, setup_logging
+from common.metrics import registry, start_metrics_server, stop_metrics_server
+from common.sharding import RouteToWorker, Supervisor, check_layout
+from bot_mem.handlers import router
+from bot_mem.main import create_bot
+
+logger = logging.getLogger("bot_mem.supervisor")
+
+
+def worker_count() -> int:
+    """BOT_MEM_WORKERS, or the CPU count when it is 0."""
+    return BOT_MEM_WORKERS or os.cpu_count() or 1
+
+
+def create_front_dispatcher(supervisor: Supervisor) -> Dispatcher:
+    """
+    Dispatcher that routes every update to its user's worker. bot_mem's router is attached only
+    so allowed_updates match bot_mem; RouteToWorker never passes updates on to it.
+    """
+    dp = Dispatcher()
+    dp.update.outer_middleware(LogContext("bot_mem.front"))
+    dp.update.outer_middleware(RouteToWorker(supervisor))
+    dp.include_router(router)
+
+    async def on_startup() -> None:
+        await supervisor.start()
+        await start_metrics_server()
+
+    async def on_shutdown() -> None:
+        await supervisor.stop()
+        await stop_metrics_server()
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    registry.add_stats("bot_mem_shards", supervisor.stats)
+    return dp
+
+
+def main() -> None:
+    log = setup_logging("bot_mem.supervisor")
+    validate_bot_mem_config()
+    workers = worker_count()
+    if not check_layout(workers):
+        sys.exit(1)
+    bot = create_bot()
+    dp = create_front_dispatcher(Supervisor(workers))
+
+    async def run() -> None:
+        try:
+            log.info("Старт бота bot_mem: %s воркеров", workers)
+            await dp.start_polling(bot)
+        finally:
+            await bot.session.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        log.info("Остановка по Ctrl+C")
+    except Exception as e:
+        log.exception("Fatal: %s", e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
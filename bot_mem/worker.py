@@ -0,0 +1,74 @@
+"""Worker process of sharded bot_mem: handles the updates the supervisor routes to it over stdin."""
+import asyncio
+import json
+import logging
+import signal
+import sys
+from pathlib import Path
+
+# Add project root to path so "common" is importable when running this file directly
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from aiogram import Bot, Dispatcher
+
+from bot_mem.main import create_bot, create_dispatcher
+from common.config import BOT_MEM_SHARD, MEMORY_DB_PATH, validate_bot_mem_config
+from common.logging_setup import setup_logging
+
+logger = logging.getLogger("bot_mem.worker")
+
+# Longest update line accepted from the supervisor
+_MAX_LINE = 16 * 1024 * 1024
+
+
+async def _feed(dp: Dispatcher, bot: Bot, line: bytes) -> None:
+    try:
+        await dp.feed_raw_update(bot, json.loads(line))
+    except Exception as e:
+        logger.exception("Ошибка обработки обновления в воркере %s: %s", BOT_MEM_SHARD, e)
+
+
+async def serve() -> None:
+    """
+    Read updates (one JSON per line) until stdin is closed or SIGTERM, handling each as a task
+    like polling does; then wait for them and run the dispatcher's shutdown (drains turns).
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=_MAX_LINE)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    loop.add_signal_handler(signal.SIGTERM, reader.feed_eof)
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot)
+    logger.info("Воркер %s запущен, БД %s", BOT_MEM_SHARD, MEMORY_DB_PATH)
+    tasks: set[asyncio.Task] = set()
+    try:
+        while line := await reader.readline():
+            task = asyncio.create_task(_feed(dp, bot, line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        try:
+            await dp.emit_shutdown(bot=bot)
+        finally:
+            await bot.session.close()
+    logger.info("Воркер %s остановлен", BOT_MEM_SHARD)
+
+
+def main() -> None:
+    setup_logging(f"bot_mem.worker{BOT_MEM_SHARD}")
+    validate_bot_mem_config()
+    try:
+        asyncio.run(serve())
+    except Exception as e:
+        logger.exception("Fatal: %s", e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,19 @@ import logging
 from aiogram import Router, F
 from aiogram.types import Message
 
-from common.openai_client import chat_completion, SYSTEM_PROMPT
+from common.config import RESPONSE_CACHE_ENABLED, STREAM_REPLIES
+from common.context_builder import build_messages
+from common.logging_setup import SAMPLED
+from common.openai_client import (
+    SYSTEM_PROMPT,
+    achat_completion_with_messages,
+    answered_by,
+    astream_chat_completion,
+)
+from common.outbound import outbound
+from common.response_cache import cache_key, response_cache
+from common.routing import router as model_router
+from common.streaming import stream_reply
 
 router = Router(name="nomem")
 logger = logging.getLogger(__name__)
@@ -18,7 +30,8 @@ HELP_TEXT = """Команды:
 
 @router.message(F.text, F.text == "/start")
 async def cmd_start(message: Message) -> None:
-    await message.answer(
+    await outbound.answer(
+        message,
         "Привет! Я бот без памяти: каждый запрос обрабатывается отдельно.\n\n"
         + HELP_TEXT
     )
@@ -26,7 +39,7 @@ async def cmd_start(message: Message) -> None:
 
 @router.message(F.text, F.text == "/help")
 async def cmd_help(message: Message) -> None:
-    await message.answer(HELP_TEXT)
+    await outbound.answer(message, HELP_TEXT)
 
 
 @router.message(F.text)
@@ -35,11 +48,30 @@ async def on_text(message: Message) -> None:
         return
     user_id = message.from_user.id if message.from_user else 0
     text_in = message.text.strip()
-    logger.info("Получено сообщение от user_id=%s", user_id)
-    success, text = chat_completion(text_in, system_prompt=SYSTEM_PROMPT)
+    logger.info("Получено сообщение от user_id=%s", user_id, extra=SAMPLED)
+
+    messages = build_messages(SYSTEM_PROMPT, [], text_in)
+
+    async def compute() -> tuple[bool, str]:
+        if STREAM_REPLIES:
+            return await stream_reply(message, astream_chat_completion(messages, user_id=user_id))
+        return await achat_completion_with_messages(messages, user_id=user_id)
+
+    if RESPONSE_CACHE_ENABLED:
+        # Hits and coalesced duplicates get the text; only the caller that computed it has streamed it.
+        # Keyed by the model the prompt routes to; an answer from a fallback model is not stored.
+        model = model_router.primary_model(messages)
+        key = cache_key(model, SYSTEM_PROMPT, text_in)
+        (success, text), computed = await response_cache.get_or_compute(
+            key, compute, keep=lambda: answered_by.get() == model
+        )
+        answered = computed and STREAM_REPLIES
+    else:
+        success, text = await compute()
+        answered = STREAM_REPLIES
     if success:
-        logger.info("Ответ отправлен user_id=%s", user_id)
-        await message.answer(text)
+        logger.info("Ответ отправлен user_id=%s", user_id, extra=SAMPLED)
     else:
         logger.error("Ошибка OpenAI для user_id=%s", user_id)
-        await message.answer(text)
+    if not answered:
+        await outbound.answer(message, text)
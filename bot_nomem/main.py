@@ -11,17 +11,48 @@ if str(_root) not in sys.path:
 
 from aiogram import Bot, Dispatcher
 
-from common.config import BOT_NOMEM_TOKEN, validate_bot_nomem_config
-from common.logging_setup import setup_logging
+from common.config import BOT_NOMEM_TOKEN, RESPONSE_CACHE_ENABLED, validate_bot_nomem_config
+from common.logging_setup import LogContext, setup_logging
+from common.metrics import HandlerTiming, start_metrics_server, stop_metrics_server
+from common.openai_client import close_clients, prepare_clients
+from common.response_cache import response_cache
+from common.startup import warm_up
 from bot_nomem.handlers import router
 
+logger = logging.getLogger("bot_nomem")
+
+
+async def on_startup() -> None:
+    """Dispatcher startup hook: OpenAI client built in the background while polling connects; /metrics when METRICS_ENABLED."""
+    await start_metrics_server()
+    warm_up(prepare_clients)
+
+
+async def on_shutdown() -> None:
+    """Dispatcher shutdown hook: close clients, the response cache and /metrics."""
+    await close_clients()
+    if RESPONSE_CACHE_ENABLED:
+        logger.info("Кэш ответов: %s", response_cache.stats())
+    response_cache.close()
+    await stop_metrics_server()
+
+
+def create_dispatcher() -> Dispatcher:
+    """Dispatcher with the bot_nomem router and lifecycle hooks."""
+    dp = Dispatcher()
+    dp.update.outer_middleware(LogContext("bot_nomem"))
+    dp.update.outer_middleware(HandlerTiming("bot_nomem"))
+    dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
 
 def main() -> None:
     log = setup_logging("bot_nomem")
     validate_bot_nomem_config()
     bot = Bot(token=BOT_NOMEM_TOKEN)
-    dp = Dispatcher()
-    dp.include_router(router)
+    dp = create_dispatcher()
 
     async def run() -> None:
         try:
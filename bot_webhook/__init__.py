@@ -0,0 +1 @@
+# Webhook server hosting both bots in one process
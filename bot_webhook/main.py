@@ -0,0 +1,77 @@
+"""Entry point for webhook mode: bot_mem and/or bot_nomem behind one aiohttp server."""
+import sys
+from pathlib import Path
+
+# Add project root to path so "common" is importable when running this file directly
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from aiogram import Bot
+
+from common.config import (
+    BOT_MEM_TOKEN,
+    BOT_MEM_WORKERS,
+    BOT_NOMEM_TOKEN,
+    WEBHOOK_BOTS,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH_MEM,
+    WEBHOOK_PATH_NOMEM,
+    validate_bot_mem_config,
+    validate_bot_nomem_config,
+)
+from common.logging_setup import setup_logging
+from common.webhook import WebhookTarget, is_exposed, run_webhook
+
+
+def build_targets(names: tuple[str, ...] = WEBHOOK_BOTS) -> list[WebhookTarget]:
+    """
+    Bots to serve, from WEBHOOK_BOTS ("mem,nomem" by default). Validates their config.
+    With BOT_MEM_WORKERS > 0 bot_mem updates are routed to sharded worker processes.
+    """
+    targets = []
+    if "mem" in names:
+        validate_bot_mem_config()
+        if BOT_MEM_WORKERS:
+            from bot_mem.supervisor import create_front_dispatcher, worker_count
+            from common.sharding import Supervisor, check_layout
+
+            if not check_layout(worker_count()):
+                sys.exit(1)
+            dispatcher = create_front_dispatcher(Supervisor(worker_count()))
+        else:
+            from bot_mem.main import create_dispatcher
+
+            dispatcher = create_dispatcher()
+        targets.append(WebhookTarget("bot_mem", Bot(token=BOT_MEM_TOKEN), dispatcher, WEBHOOK_PATH_MEM))
+    if "nomem" in names:
+        from bot_nomem.main import create_dispatcher
+
+        validate_bot_nomem_config()
+        targets.append(WebhookTarget("bot_nomem", Bot(token=BOT_NOMEM_TOKEN), create_dispatcher(), WEBHOOK_PATH_NOMEM))
+    return targets
+
+
+def main() -> None:
+    log = setup_logging("bot_webhook")
+    if is_exposed():
+        log.error(
+            "WEBHOOK_SECRET не задан, а WEBHOOK_HOST=%s доступен не только локально: задайте секрет "
+            "или слушайте 127.0.0.1 за прокси",
+            WEBHOOK_HOST,
+        )
+        sys.exit(1)
+    targets = build_targets()
+    if not targets:
+        log.error("WEBHOOK_BOTS не содержит ни mem, ни nomem")
+        sys.exit(1)
+    try:
+        run_webhook(targets)
+    except Exception as e:
+        log.exception("Fatal: %s", e)
+        sys.exit(1)
+    log.info("Webhook-сервер остановлен")
+
+
+if __name__ == "__main__":
+    main()
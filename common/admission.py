@@ -0,0 +1,149 @@
+"""Admission control for upstream calls: max in flight, bounded fair wait queue, early load shedding."""
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from common.config import (
+    OPENAI_MAX_IN_FLIGHT,
+    OPENAI_MAX_QUEUED_PER_USER,
+    OPENAI_QUEUE_SIZE,
+    OPENAI_QUEUE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Request was shed: reason is "queue_full", "user_queue_full" or "timeout"."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    At most max_in_flight calls run at once. Others wait in per-user FIFO queues served
+    round-robin, so one user cannot take every freed slot. A request is rejected at once
+    when the total queue holds max_queue waiters or the user already has max_queued_per_user
+    waiting, and gives up after max_wait seconds in the queue.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = OPENAI_MAX_IN_FLIGHT,
+        max_queue: int = OPENAI_QUEUE_SIZE,
+        max_wait: float = OPENAI_QUEUE_TIMEOUT,
+        max_queued_per_user: int = OPENAI_MAX_QUEUED_PER_USER,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_queued_per_user = max_queued_per_user
+        self.in_flight = 0
+        self.queued = 0
+        self._waiters: dict[int, deque[asyncio.Future]] = {}
+        self._turns: deque[int] = deque()
+        self.admitted = 0
+        self.shed: dict[str, int] = {"queue_full": 0, "user_queue_full": 0, "timeout": 0}
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+
+    @asynccontextmanager
+    async def slot(self, user_id: int) -> AsyncIterator[None]:
+        """Hold one upstream slot for the duration of the block; raises Overloaded."""
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, user_id: int) -> None:
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            self._admitted(0.0)
+            return
+        if self.queued >= self.max_queue:
+            self._shed("queue_full", user_id)
+        waiters = self._waiters.get(user_id)
+        if waiters is not None and len(waiters) >= self.max_queued_per_user:
+            self._shed("user_queue_full", user_id)
+
+        future = asyncio.get_running_loop().create_future()
+        if waiters is None:
+            waiters = self._waiters[user_id] = deque()
+            self._turns.append(user_id)
+        waiters.append(future)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            self._forget(user_id, future)
+            self._shed("timeout", user_id)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled: pass it on
+                self.release()
+            else:
+                self._forget(user_id, future)
+            raise
+        self._admitted(time.monotonic() - started)
+
+    def release(self) -> None:
+        """Free a slot and hand it to the next user in round-robin order."""
+        self.in_flight -= 1
+        while self._turns and self.in_flight < self.max_in_flight:
+            user_id = self._turns.popleft()
+            waiters = self._waiters[user_id]
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._turns.append(user_id)
+            else:
+                del self._waiters[user_id]
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed["queue_full"],
+            "shed_user_queue_full": self.shed["user_queue_full"],
+            "shed_timeout": self.shed["timeout"],
+            "wait_seconds_sum": self.wait_seconds_sum,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+    def _admitted(self, waited: float) -> None:
+        self.admitted += 1
+        self.wait_seconds_sum += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def _forget(self, user_id: int, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(user_id)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self.queued -= 1
+        if not waiters:
+            del self._waiters[user_id]
+            self._turns.remove(user_id)
+
+    def _shed(self, reason: str, user_id: int) -> None:
+        self.shed[reason] += 1
+        logger.warning(
+            "Перегрузка (%s): запрос user_id=%s отклонён, в работе %s, в очереди %s",
+            reason, user_id, self.in_flight, self.queued,
+        )
+        raise Overloaded(reason)
+
+
+# Process-wide limiter for OpenAI calls from both bots
+admission = AdmissionController()
@@ -0,0 +1,143 @@
+"""Rolling summarization for bot_mem: turns older than the window are folded into a per-user summary."""
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from common.admission import admission
+from common.config import MEMORY_COMPACT_AFTER_PAIRS, MEMORY_SUMMARY_MAX_TOKENS, OPENAI_MODEL
+from common.context_builder import build_messages
+from common.memory_store import MemoryStore, memory_store
+from common.metrics import registry
+from common.tokens import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You keep the long-term memory of a chat between a user and an assistant. "
+    "Merge the previous summary and the new dialogue into one updated summary. "
+    "Keep every durable fact about the user (name, preferences, plans, numbers, decisions) "
+    "and open questions; drop small talk. Plain text, at most {max_words} words."
+)
+
+# summarize(previous_summary, [(role, content), ...], user_id) -> new summary, or None on failure
+Summarizer = Callable[[str | None, list[tuple[str, str]], int], Awaitable[str | None]]
+
+
+async def openai_summarize(previous: str | None, turns: list[tuple[str, str]], user_id: int = 0) -> str | None:
+    """Default summarizer: one completion through the usual OpenAI path (admission, retries)."""
+    from common.openai_client import achat_completion_with_messages
+
+    dialogue = "\n".join(f"{'User' if role == 'user' else 'Assistant'}: {content}" for role, content in turns)
+    prompt = (f"Previous summary:\n{previous}\n\n" if previous else "") + f"New dialogue:\n{dialogue}"
+    system = SUMMARY_SYSTEM_PROMPT.format(max_words=MEMORY_SUMMARY_MAX_TOKENS * 3 // 4)
+    success, reply = await achat_completion_with_messages(build_messages(system, [], prompt), user_id=user_id)
+    return reply if success else None
+
+
+class Compactor:
+    """
+    notify(user_id) after each saved turn; every `after_pairs` turns the user is queued for a
+    check. One background task works the queue: if at least `after_pairs` pairs lie beyond the
+    user's window, it summarizes them together with the previous summary and stores the result,
+    deleting the folded rows. It is low priority: it waits while the upstream limiter has a queue
+    or is more than `spare_fraction` busy, and never runs on a user's request path.
+    """
+
+    # Per-user turn counters are dropped when this many users are tracked (counts just restart)
+    _MAX_TRACKED = 100_000
+
+    def __init__(
+        self,
+        store: MemoryStore = memory_store,
+        summarize: Summarizer = openai_summarize,
+        after_pairs: int = MEMORY_COMPACT_AFTER_PAIRS,
+        max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS,
+        spare_fraction: float = 0.5,
+        busy_sleep: float = 1.0,
+    ):
+        self.store = store
+        self.summarize = summarize
+        self.after_pairs = after_pairs
+        self.max_tokens = max_tokens
+        self.spare_fraction = spare_fraction
+        self.busy_sleep = busy_sleep
+        self.compacted = 0
+        self.failed = 0
+        self._turns: dict[int, int] = {}
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._queued: set[int] = set()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="memory-compactor")
+
+    async def stop(self) -> None:
+        """Stop the worker; users still queued are compacted after their next turns."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def notify(self, user_id: int) -> None:
+        """A turn was saved for user_id."""
+        turns = self._turns.get(user_id, 0) + 1
+        if turns < self.after_pairs:
+            if len(self._turns) >= self._MAX_TRACKED:
+                self._turns.clear()
+            self._turns[user_id] = turns
+            return
+        self._turns.pop(user_id, None)
+        if user_id not in self._queued:
+            self._queued.add(user_id)
+            self._queue.put_nowait(user_id)
+
+    async def wait_idle(self) -> None:
+        """Wait until every queued user has been processed."""
+        await self._queue.join()
+
+    def stats(self) -> dict[str, int]:
+        return {"compacted": self.compacted, "failed": self.failed, "queued": len(self._queued)}
+
+    async def compact_user(self, user_id: int) -> bool:
+        """Fold the user's rows beyond the window into the summary; False if not needed or failed."""
+        summary, rows = await self.store.compaction_candidates(user_id)
+        if len(rows) < 2 * self.after_pairs:
+            return False
+        previous = summary["content"] if summary else None
+        text = await self.summarize(previous, [(role, content) for _, role, content in rows], user_id)
+        if not text or not text.strip():
+            self.failed += 1
+            logger.warning("Не удалось обновить сводку user_id=%s", user_id)
+            return False
+        text = truncate_to_tokens(text.strip(), self.max_tokens, OPENAI_MODEL)
+        await self.store.compact(user_id, text, rows[-1][0])
+        self.compacted += 1
+        logger.info("Сводка user_id=%s обновлена: свёрнуто %s сообщений", user_id, len(rows))
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            user_id = await self._queue.get()
+            try:
+                await self._wait_for_spare_capacity()
+                await self.compact_user(user_id)
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Ошибка сжатия истории user_id=%s: %s", user_id, e)
+            finally:
+                self._queued.discard(user_id)
+                self._queue.task_done()
+
+    async def _wait_for_spare_capacity(self) -> None:
+        # Interactive turns first: yield while users queue for upstream slots or most are busy
+        while admission.queued or admission.in_flight >= admission.max_in_flight * self.spare_fraction:
+            await asyncio.sleep(self.busy_sleep)
+
+
+# Process-wide compactor for bot_mem; started in bot_mem/main.py when MEMORY_COMPACTION is on
+compactor = Compactor()
+registry.add_stats("compaction", compactor.stats)
@@ -3,11 +3,12 @@ import os
 import sys
 from pathlib import Path
 
-from dotenv import load_dotenv
-
-# Load .env from project root (parent of common/)
+# Load .env from project root (parent of common/); without the file python-dotenv is not imported
 _root = Path(__file__).resolve().parent.parent
-load_dotenv(_root / ".env")
+if (_root / ".env").is_file():
+    from dotenv import load_dotenv
+
+    load_dotenv(_root / ".env")
 
 
 def get_env(key: str, default: str | None = None) -> str:
@@ -46,8 +47,10 @@ OPENAI_MODEL = get_env("OPENAI_MODEL", "gpt-4")
 # Bot tokens (new names)
 BOT_NOMEM_TOKEN = get_env("BOT_NOMEM_TOKEN")
 BOT_MEM_TOKEN = get_env("BOT_MEM_TOKEN")
+# Bot API server base URL, e.g. a local telegram-bot-api (empty = api.telegram.org)
+TELEGRAM_API_BASE = get_env("TELEGRAM_API_BASE")
+
 
-# Memory bot: max pairs (user+assistant) per user
 def _parse_int(key: str, default: int) -> int:
     try:
         return int(os.getenv(key, str(default)))
@@ -55,8 +58,211 @@ def _parse_int(key: str, default: int) -> int:
         return default
 
 
+def _parse_float(key: str, default: float) -> float:
+    try:
+        return float(os.getenv(key, str(default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def _parse_bool(key: str, default: bool) -> bool:
+    value = get_env(key)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _parse_int_map(key: str) -> dict[str, int]:
+    """Parse "name:123,other:456" into {"name": 123, "other": 456}; bad items are skipped."""
+    out = {}
+    for item in get_env(key).split(","):
+        name, _, value = item.strip().rpartition(":")
+        try:
+            out[name.strip()] = int(value)
+        except ValueError:
+            continue
+    return {k: v for k, v in out.items() if k}
+
+
+def _parse_routes(key: str) -> list[tuple[str, int, int]]:
+    """Parse "small:800:2,big" into [("small", 800, 2), ("big", 0, 0)]; missing or bad limits are 0."""
+    out = []
+    for item in get_env(key).split(","):
+        name, *limits = (part.strip() for part in item.split(":"))
+        if not name:
+            continue
+        values = []
+        for value in (limits + ["0", "0"])[:2]:
+            try:
+                values.append(max(0, int(value or 0)))
+            except ValueError:
+                values.append(0)
+        out.append((name, values[0], values[1]))
+    return out
+
+
+# Memory bot: max pairs (user+assistant) per user
 HISTORY_PAIRS_LIMIT = max(1, _parse_int("HISTORY_PAIRS_LIMIT", 5))
+# In-process LRU cache of per-user history windows (0 disables)
+MEMORY_CACHE_MAX_USERS = max(0, _parse_int("MEMORY_CACHE_MAX_USERS", 10000))
+MEMORY_CACHE_MAX_BYTES = max(0, _parse_int("MEMORY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Fold turns older than the window into a per-user summary in the background (off by default).
+# Runs once COMPACT_AFTER_PAIRS pairs piled up beyond the window; if it keeps failing, pairs beyond
+# COMPACT_MAX_PAIRS are trimmed as without compaction. Summary is capped at SUMMARY_MAX_TOKENS.
+MEMORY_COMPACTION = _parse_bool("MEMORY_COMPACTION", False)
+MEMORY_COMPACT_AFTER_PAIRS = max(1, _parse_int("MEMORY_COMPACT_AFTER_PAIRS", 5))
+MEMORY_COMPACT_MAX_PAIRS = max(MEMORY_COMPACT_AFTER_PAIRS, _parse_int("MEMORY_COMPACT_MAX_PAIRS", 50))
+MEMORY_SUMMARY_MAX_TOKENS = max(50, _parse_int("MEMORY_SUMMARY_MAX_TOKENS", 400))
+# Semantic recall: add the top-k most similar past turns to the prompt (needs numpy; keeps full history).
+# RECALL_EMBEDDER is "module:function" taking list[str] and returning (n, RECALL_DIM) vectors;
+# empty = built-in hashing embedder. RECALL_CACHE_USERS user indexes are kept in memory.
+RECALL_ENABLED = _parse_bool("RECALL_ENABLED", False)
+RECALL_TOP_K = max(0, _parse_int("RECALL_TOP_K", 3))
+RECALL_MIN_SCORE = _parse_float("RECALL_MIN_SCORE", 0.3)
+RECALL_DIM = max(8, _parse_int("RECALL_DIM", 256))
+RECALL_EMBEDDER = get_env("RECALL_EMBEDDER")
+RECALL_CACHE_USERS = max(1, _parse_int("RECALL_CACHE_USERS", 1000))
+# bot_mem turn scheduling: merge messages sent within the debounce window (s), cap queued per user
+TURN_DEBOUNCE_SECONDS = max(0.0, _parse_float("TURN_DEBOUNCE_SECONDS", 0.3))
+TURN_MAX_PENDING = max(1, _parse_int("TURN_MAX_PENDING", 20))
+TURN_DRAIN_TIMEOUT = max(0.0, _parse_float("TURN_DRAIN_TIMEOUT", 30.0))
+# Async memory store: reader threads and max writes per group commit
+MEMORY_READER_THREADS = max(1, _parse_int("MEMORY_READER_THREADS", 2))
+MEMORY_WRITE_BATCH = max(1, _parse_int("MEMORY_WRITE_BATCH", 64))
+# Storage: content compression ("none", "zlib", "zstd" — needs zstandard) for messages of at least
+# COMPRESS_MIN_BYTES; users inactive for TTL_DAYS are deleted (0 = keep forever) by the maintenance
+# task every MAINTENANCE_INTERVAL s (0 = off), which also frees up to VACUUM_PAGES pages per run
+MEMORY_COMPRESSION = get_env("MEMORY_COMPRESSION", "none").lower()
+if MEMORY_COMPRESSION not in ("none", "zlib", "zstd"):
+    MEMORY_COMPRESSION = "none"
+MEMORY_COMPRESS_MIN_BYTES = max(0, _parse_int("MEMORY_COMPRESS_MIN_BYTES", 256))
+MEMORY_TTL_DAYS = max(0.0, _parse_float("MEMORY_TTL_DAYS", 0.0))
+MEMORY_MAINTENANCE_INTERVAL = max(0.0, _parse_float("MEMORY_MAINTENANCE_INTERVAL", 3600.0))
+MEMORY_VACUUM_PAGES = max(1, _parse_int("MEMORY_VACUUM_PAGES", 2000))
+# Sharded bot_mem (bot_mem/supervisor.py): worker processes (0 = CPU count), updates buffered per
+# worker while it is busy or restarting, seconds to wait for a worker to finish on shutdown.
+# BOT_MEM_WORKERS > 0 also makes webhook mode route bot_mem updates to workers.
+BOT_MEM_WORKERS = max(0, _parse_int("BOT_MEM_WORKERS", 0))
+BOT_MEM_WORKER_QUEUE = max(1, _parse_int("BOT_MEM_WORKER_QUEUE", 10000))
+BOT_MEM_WORKER_STOP_TIMEOUT = max(1.0, _parse_float("BOT_MEM_WORKER_STOP_TIMEOUT", 60.0))
+# Set by the supervisor in worker processes: shard index
+BOT_MEM_SHARD = _parse_int("BOT_MEM_SHARD", 0)
+
+# Prompt token budget (system + history + new message); per-model overrides "gpt-4:6000,gpt-4o:60000"
+OPENAI_CONTEXT_TOKENS = max(256, _parse_int("OPENAI_CONTEXT_TOKENS", 6000))
+OPENAI_CONTEXT_TOKENS_BY_MODEL = _parse_int_map("OPENAI_CONTEXT_TOKENS_BY_MODEL")
+
+# Outgoing Telegram messages: global and per-chat rate (msg/s), per-chat burst, group chats (msg/min),
+# retries after a flood-limit (429 RetryAfter) error
+TELEGRAM_GLOBAL_RATE = max(0.1, _parse_float("TELEGRAM_GLOBAL_RATE", 30.0))
+TELEGRAM_CHAT_RATE = max(0.01, _parse_float("TELEGRAM_CHAT_RATE", 1.0))
+TELEGRAM_CHAT_BURST = max(1, _parse_int("TELEGRAM_CHAT_BURST", 3))
+TELEGRAM_GROUP_RATE_PER_MIN = max(1.0, _parse_float("TELEGRAM_GROUP_RATE_PER_MIN", 20.0))
+TELEGRAM_MAX_RETRIES = max(0, _parse_int("TELEGRAM_MAX_RETRIES", 3))
+
+# Streamed replies: placeholder message edited as tokens arrive, at most once per interval (s)
+STREAM_REPLIES = _parse_bool("STREAM_REPLIES", True)
+STREAM_EDIT_INTERVAL = max(0.0, _parse_float("STREAM_EDIT_INTERVAL", 1.0))
+
+# Admission control for OpenAI calls: concurrent calls, wait queue size, max wait (s), waiters per user
+OPENAI_MAX_IN_FLIGHT = max(1, _parse_int("OPENAI_MAX_IN_FLIGHT", 32))
+OPENAI_QUEUE_SIZE = max(0, _parse_int("OPENAI_QUEUE_SIZE", 256))
+OPENAI_QUEUE_TIMEOUT = max(0.0, _parse_float("OPENAI_QUEUE_TIMEOUT", 10.0))
+OPENAI_MAX_QUEUED_PER_USER = max(1, _parse_int("OPENAI_MAX_QUEUED_PER_USER", 2))
+
+# OpenAI retries: attempts after the first, backoff base and cap (s; longer Retry-After is not waited)
+OPENAI_MAX_RETRIES = max(0, _parse_int("OPENAI_MAX_RETRIES", 2))
+OPENAI_RETRY_BASE_DELAY = max(0.0, _parse_float("OPENAI_RETRY_BASE_DELAY", 0.5))
+OPENAI_RETRY_MAX_DELAY = max(0.0, _parse_float("OPENAI_RETRY_MAX_DELAY", 20.0))
+# Circuit breaker: consecutive transient failures to open, seconds before a probe call
+OPENAI_BREAKER_FAILURES = max(1, _parse_int("OPENAI_BREAKER_FAILURES", 5))
+OPENAI_BREAKER_RESET = max(0.0, _parse_float("OPENAI_BREAKER_RESET", 30.0))
+# Hedged requests: second attempt when the first is slower than this latency percentile
+OPENAI_HEDGE_ENABLED = _parse_bool("OPENAI_HEDGE_ENABLED", False)
+OPENAI_HEDGE_PERCENTILE = min(0.999, max(0.5, _parse_float("OPENAI_HEDGE_PERCENTILE", 0.95)))
+OPENAI_HEDGE_MIN_SAMPLES = max(1, _parse_int("OPENAI_HEDGE_MIN_SAMPLES", 20))
+
+# Model routing (empty = every call uses OPENAI_MODEL): "model:max_prompt_tokens:max_history_pairs,..."
+# cheapest/fastest first, 0 or omitted = no limit, e.g. "gpt-4o-mini:800:2,gpt-4". A request goes to the
+# first model it fits that is healthy: breaker closed, rolling error rate <= ROUTE_MAX_ERROR_RATE and
+# p95 latency <= ROUTE_MAX_P95 seconds (0 = latency ignored); otherwise to the next fitting model.
+OPENAI_ROUTES = _parse_routes("OPENAI_ROUTES")
+OPENAI_ROUTE_MAX_ERROR_RATE = min(1.0, max(0.0, _parse_float("OPENAI_ROUTE_MAX_ERROR_RATE", 0.5)))
+OPENAI_ROUTE_MAX_P95 = max(0.0, _parse_float("OPENAI_ROUTE_MAX_P95", 0.0))
+# A degraded (not open) model still gets one request per this many seconds, so its stats can recover
+OPENAI_ROUTE_PROBE_INTERVAL = max(0.1, _parse_float("OPENAI_ROUTE_PROBE_INTERVAL", 5.0))
+# Attempts a model needs before its error rate and p95 count (fewer: treated as healthy)
+OPENAI_ROUTE_MIN_SAMPLES = max(1, _parse_int("OPENAI_ROUTE_MIN_SAMPLES", 20))
+
+# OpenAI HTTP connection pool (one long-lived client per process)
+OPENAI_MAX_CONNECTIONS = max(1, _parse_int("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = max(0, _parse_int("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+OPENAI_KEEPALIVE_EXPIRY = max(0.0, _parse_float("OPENAI_KEEPALIVE_EXPIRY", 30.0))
+OPENAI_HTTP2 = _parse_bool("OPENAI_HTTP2", False)
+
+# bot_nomem response cache (keyed by model + system prompt + normalized question)
+RESPONSE_CACHE_ENABLED = _parse_bool("RESPONSE_CACHE_ENABLED", False)
+RESPONSE_CACHE_TTL = max(1.0, _parse_float("RESPONSE_CACHE_TTL", 3600.0))
+RESPONSE_CACHE_MAX_ENTRIES = max(1, _parse_int("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+RESPONSE_CACHE_MAX_BYTES = max(1, _parse_int("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+RESPONSE_CACHE_DISK = _parse_bool("RESPONSE_CACHE_DISK", False)
+RESPONSE_CACHE_DISK_MAX_ENTRIES = max(1, _parse_int("RESPONSE_CACHE_DISK_MAX_ENTRIES", 100000))
+
+# Webhook mode (bot_webhook/main.py): listen address, public URL, secret, per-bot paths
+WEBHOOK_HOST = get_env("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = _parse_int("WEBHOOK_PORT", 8080)
+WEBHOOK_BASE_URL = get_env("WEBHOOK_BASE_URL")
+WEBHOOK_SECRET = get_env("WEBHOOK_SECRET")
+WEBHOOK_PATH_MEM = get_env("WEBHOOK_PATH_MEM", "/webhook/mem")
+WEBHOOK_PATH_NOMEM = get_env("WEBHOOK_PATH_NOMEM", "/webhook/nomem")
+WEBHOOK_BOTS = tuple(b.strip() for b in get_env("WEBHOOK_BOTS", "mem,nomem").split(",") if b.strip())
+WEBHOOK_SHUTDOWN_TIMEOUT = max(0.0, _parse_float("WEBHOOK_SHUTDOWN_TIMEOUT", 30.0))
+
+# Path to SQLite DB (data/ created automatically; DATA_DIR can point elsewhere)
+DATA_DIR = Path(get_env("DATA_DIR")) if get_env("DATA_DIR") else _root / "data"
+MEMORY_DB_PATH = Path(get_env("MEMORY_DB_PATH")) if get_env("MEMORY_DB_PATH") else DATA_DIR / "memory.db"
+
+# SQLite tuning for long-lived connections
+SQLITE_CACHE_SIZE_KB = max(0, _parse_int("SQLITE_CACHE_SIZE_KB", 16384))
+SQLITE_MMAP_SIZE = max(0, _parse_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_SYNCHRONOUS = get_env("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    SQLITE_SYNCHRONOUS = "NORMAL"
+
+# Metrics: GET /metrics (Prometheus text format) on a separate port, off by default
+METRICS_ENABLED = _parse_bool("METRICS_ENABLED", False)
+METRICS_HOST = get_env("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _parse_int("METRICS_PORT", 9100)
+
+# Logging: "text" ([LEVEL] name: message) or "json" (one object per line with request_id / user_id).
+# Records go through a queue of LOG_QUEUE_SIZE (0 = write synchronously) to a writer thread; when it
+# is full, "drop" loses INFO/DEBUG lines (warnings and errors still wait), "block" waits for all.
+# LOG_SAMPLE_RATE is the share of requests whose per-message INFO lines are kept (1 = all).
+LOG_FORMAT = get_env("LOG_FORMAT", "text").lower()
+if LOG_FORMAT not in ("text", "json"):
+    LOG_FORMAT = "text"
+LOG_QUEUE_SIZE = max(0, _parse_int("LOG_QUEUE_SIZE", 10000))
+LOG_QUEUE_POLICY = get_env("LOG_QUEUE_POLICY", "drop").lower()
+if LOG_QUEUE_POLICY not in ("drop", "block"):
+    LOG_QUEUE_POLICY = "drop"
+LOG_SAMPLE_RATE = min(1.0, max(0.0, _parse_float("LOG_SAMPLE_RATE", 1.0)))
 
-# Path to SQLite DB (data/ created automatically)
-DATA_DIR = _root / "data"
-MEMORY_DB_PATH = DATA_DIR / "memory.db"
+# bot_mem history storage: "sqlite" (MEMORY_DB_PATH; the only one with summaries, recall, TTL
+# maintenance and the admin CLI), "memory" (in the process, lost on restart: tests and ephemeral
+# runs) or "redis" (capped list per user on a Redis-protocol server at REDIS_URL, shared by
+# replicas; keys "<REDIS_KEY_PREFIX>:<user_id>" expire after MEMORY_TTL_DAYS without writes).
+# REDIS_TIMEOUT: seconds for connecting and for each reply.
+MEMORY_BACKEND = get_env("MEMORY_BACKEND", "sqlite").lower()
+if MEMORY_BACKEND not in ("sqlite", "memory", "redis"):
+    MEMORY_BACKEND = "sqlite"
+REDIS_URL = get_env("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_KEY_PREFIX = get_env("REDIS_KEY_PREFIX", "bot_mem")
+REDIS_TIMEOUT = max(0.1, _parse_float("REDIS_TIMEOUT", 5.0))
+# Summaries (MEMORY_COMPACTION) and recall live in SQLite: turned off with the other backends
+MEMORY_SQLITE_ONLY_OFF = tuple(
+    name
+    for name, on in (("MEMORY_COMPACTION", MEMORY_COMPACTION), ("RECALL_ENABLED", RECALL_ENABLED))
+    if on and MEMORY_BACKEND != "sqlite"
+)
+if MEMORY_SQLITE_ONLY_OFF:
+    MEMORY_COMPACTION = RECALL_ENABLED = False
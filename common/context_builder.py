@@ -0,0 +1,98 @@
+"""Token-budget prompt builder: system prompt + summary + recalled turns + newest history that fits + new message."""
+from typing import Any
+
+from common.config import OPENAI_CONTEXT_TOKENS, OPENAI_CONTEXT_TOKENS_BY_MODEL, OPENAI_MODEL
+from common.tokens import MESSAGE_OVERHEAD, count_tokens, truncate_to_tokens
+
+TRUNCATED_SUFFIX = "\n… (обрезано)"
+# Header of the system message carrying the summary of turns folded by compaction
+SUMMARY_PREFIX = "Summary of the earlier conversation with this user:\n"
+# Header of the system message carrying past turns found by semantic recall
+RECALL_PREFIX = "Relevant earlier messages from this conversation:"
+
+
+def context_budget(model: str | None = None) -> int:
+    """Prompt token budget for model (per-model override or OPENAI_CONTEXT_TOKENS)."""
+    model = model or OPENAI_MODEL
+    return OPENAI_CONTEXT_TOKENS_BY_MODEL.get(model, OPENAI_CONTEXT_TOKENS)
+
+
+def message_tokens(message: dict[str, Any], model: str | None = None) -> int:
+    """Tokens of one message incl. format overhead; uses cached "tokens" when present."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message["content"], model)
+    return tokens + MESSAGE_OVERHEAD
+
+
+def build_messages(
+    system_prompt: str,
+    history: list[dict[str, Any]],
+    new_user_text: str,
+    model: str | None = None,
+    budget: int | None = None,
+    summary: str | None = None,
+    recalled: list[list[dict[str, Any]]] | None = None,
+) -> list[dict[str, str]]:
+    """
+    [system, summary?, recalled?, ...newest history that fits..., new user message] within budget
+    tokens. The new message is always sent (cut if it alone exceeds the budget); the summary of
+    older turns comes next (cut to what is left), then recalled turns (best first, whole turns
+    only); history is packed newest-first and never starts with an orphan assistant reply.
+    """
+    model = model or OPENAI_MODEL
+    budget = context_budget(model) if budget is None else budget
+    system = {"role": "system", "content": system_prompt}
+    left = budget - message_tokens(system, model)
+
+    user_tokens = count_tokens(new_user_text, model)
+    if user_tokens + MESSAGE_OVERHEAD > left:
+        keep = left - MESSAGE_OVERHEAD - count_tokens(TRUNCATED_SUFFIX, model)
+        new_user_text = truncate_to_tokens(new_user_text, keep, model).rstrip() + TRUNCATED_SUFFIX
+        user_tokens = count_tokens(new_user_text, model)
+    left -= user_tokens + MESSAGE_OVERHEAD
+
+    summary_message = None
+    if summary and left > MESSAGE_OVERHEAD:
+        content = SUMMARY_PREFIX + summary
+        tokens = count_tokens(content, model)
+        if tokens + MESSAGE_OVERHEAD > left:
+            content = truncate_to_tokens(content, left - MESSAGE_OVERHEAD, model)
+            tokens = count_tokens(content, model)
+        summary_message = {"role": "system", "content": content}
+        left -= tokens + MESSAGE_OVERHEAD
+
+    recall_message = None
+    if recalled:
+        lines = [RECALL_PREFIX]
+        tokens = count_tokens(RECALL_PREFIX, model) + MESSAGE_OVERHEAD
+        for turn in recalled:
+            block = "\n".join(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in turn)
+            cost = count_tokens(block, model) + 1
+            if tokens + cost > left:
+                break
+            lines.append(block)
+            tokens += cost
+        if len(lines) > 1:
+            recall_message = {"role": "system", "content": "\n".join(lines)}
+            left -= tokens
+
+    packed: list[dict[str, Any]] = []
+    for m in reversed(history):
+        cost = message_tokens(m, model)
+        if cost > left:
+            break
+        packed.append(m)
+        left -= cost
+    packed.reverse()
+    if packed and packed[0]["role"] == "assistant":
+        packed.pop(0)
+
+    out = [system]
+    if summary_message:
+        out.append(summary_message)
+    if recall_message:
+        out.append(recall_message)
+    out.extend({"role": m["role"], "content": m["content"]} for m in packed)
+    out.append({"role": "user", "content": new_user_text})
+    return out
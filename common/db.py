@@ -1,50 +1,294 @@
-"""SQLite initialization and schema migration for memory DB."""
+"""SQLite initialization, schema migration, content codec and long-lived connections for memory DB."""
 import logging
 import sqlite3
+import threading
+import time
+import zlib
 from pathlib import Path
 
-from common.config import DATA_DIR, MEMORY_DB_PATH
+from common.config import (
+    DATA_DIR,
+    MEMORY_COMPRESS_MIN_BYTES,
+    MEMORY_COMPRESSION,
+    MEMORY_DB_PATH,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+)
 
 logger = logging.getLogger(__name__)
 
-_SCHEMA = """
-CREATE TABLE IF NOT EXISTS messages (
+try:
+    import zstandard
+except ImportError:  # optional dependency: zstd falls back to zlib without it
+    zstandard = None
+
+# content is TEXT (plain) or BLOB (compressed: codec byte + payload); BLOB affinity keeps either as is.
+# created_at / updated_at are unix seconds.
+_MESSAGES_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER NOT NULL,
   role TEXT NOT NULL,
+  content BLOB NOT NULL,
+  created_at INTEGER NOT NULL,
+  tokens INTEGER
+);
+"""
+_SUMMARIES_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+  user_id INTEGER PRIMARY KEY,
   content TEXT NOT NULL,
-  created_at TEXT NOT NULL
+  tokens INTEGER NOT NULL,
+  upto_id INTEGER NOT NULL,
+  updated_at INTEGER NOT NULL
 );
-CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id);
 """
+_SCHEMA = (
+    _MESSAGES_TABLE.format(name="messages")
+    + """
+DROP INDEX IF EXISTS idx_messages_user_id;
+CREATE INDEX IF NOT EXISTS idx_messages_user_id_id ON messages(user_id, id);
+"""
+    + _SUMMARIES_TABLE.format(name="summaries")
+)
+
+# Codec byte in front of compressed content
+_ZLIB = b"z"
+_ZSTD = b"s"
+# Rows copied per statement when migrating messages to the current format
+_MIGRATE_BATCH = 5000
+
+if MEMORY_COMPRESSION == "zstd" and zstandard is None:
+    logger.warning("MEMORY_COMPRESSION=zstd, но пакет zstandard не установлен — используется zlib")
+    MEMORY_COMPRESSION = "zlib"
+
+
+def encode_content(text: str) -> str | bytes:
+    """
+    Value to store in messages.content: text as is when compression is off, the text is shorter
+    than MEMORY_COMPRESS_MIN_BYTES or would not shrink; otherwise codec byte + compressed UTF-8.
+    """
+    if MEMORY_COMPRESSION == "none" or len(text) < MEMORY_COMPRESS_MIN_BYTES:
+        return text
+    raw = text.encode("utf-8")
+    if MEMORY_COMPRESSION == "zstd":
+        packed = _ZSTD + zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        packed = _ZLIB + zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else text
+
+
+def decode_content(value: str | bytes) -> str:
+    """Text of a messages.content value written by encode_content (any codec, any setting)."""
+    if isinstance(value, str):
+        return value
+    codec, payload = value[:1], value[1:]
+    if codec == _ZLIB:
+        return zlib.decompress(payload).decode("utf-8")
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed message found, install zstandard")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    raise ValueError(f"unknown content codec {codec!r}")
+
+
+# Per-connection tuning, applied once when a connection is opened
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+    f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# Prepared statements kept per connection (sqlite3 caches them by SQL text)
+STATEMENT_CACHE_SIZE = 256
+
+# One connection per thread, reused across calls; all are tracked for close_connections()
+_local = threading.local()
+_lock = threading.Lock()
+_connections: list[sqlite3.Connection] = []
+_generation = 0
 
 
 def ensure_data_dir() -> None:
-    """Create data/ directory if it does not exist."""
+    """Create data/ directory (and the DB file's directory) if it does not exist."""
     try:
         DATA_DIR.mkdir(parents=True, exist_ok=True)
+        MEMORY_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     except OSError as e:
         logger.error("Ошибка при создании каталога data: %s", e)
         raise
 
 
+def _open_connection() -> sqlite3.Connection:
+    """Open a tuned connection to the memory DB."""
+    conn = sqlite3.connect(
+        str(MEMORY_DB_PATH),
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
 def get_connection() -> sqlite3.Connection:
-    """Return a connection to the memory DB. Ensures data dir and schema exist."""
+    """
+    Return this thread's long-lived connection to the memory DB (opened on first use).
+    Do not close it: connections are closed together by close_connections().
+    Schema is created by init_db(), not here.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.generation == _generation:
+        return conn
     ensure_data_dir()
     try:
-        conn = sqlite3.connect(str(MEMORY_DB_PATH))
-        conn.executescript(_SCHEMA)
-        conn.commit()
-        return conn
+        conn = _open_connection()
     except sqlite3.Error as e:
-        logger.error("Ошибка при инициализации БД: %s", e)
+        logger.error("Ошибка при подключении к БД: %s", e)
         raise
+    with _lock:
+        _connections.append(conn)
+        _local.conn = conn
+        _local.generation = _generation
+    return conn
+
+
+def close_connections() -> None:
+    """Close all connections opened by get_connection(). Call on bot shutdown."""
+    global _generation
+    with _lock:
+        _generation += 1
+        conns = list(_connections)
+        _connections.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error("Ошибка при закрытии соединения с БД: %s", e)
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Bring tables created by older versions up to the current schema."""
+    columns = {row[1]: row[2].upper() for row in conn.execute("PRAGMA table_info(messages)")}
+    if "tokens" not in columns:
+        # Cached token count per message; NULL for old rows (counted on read)
+        conn.execute("ALTER TABLE messages ADD COLUMN tokens INTEGER")
+        logger.info("БД: добавлена колонка messages.tokens")
+    if columns.get("created_at") == "TEXT":
+        _migrate_epoch_blobs(conn)
+
+
+def _migrate_epoch_blobs(conn: sqlite3.Connection) -> None:
+    """
+    ISO-text timestamps -> unix seconds, content TEXT -> BLOB affinity (encoded with the current
+    MEMORY_COMPRESSION). Column types need a table rebuild; runs once, in one transaction
+    committed by the caller.
+    """
+    started = time.monotonic()
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute("DROP TABLE IF EXISTS messages_new")
+    conn.execute(_MESSAGES_TABLE.format(name="messages_new"))
+    now = int(time.time())
+    cursor = conn.execute(
+        "SELECT id, user_id, role, content, CAST(strftime('%s', created_at) AS INTEGER), tokens FROM messages"
+    )
+    copied = 0
+    while rows := cursor.fetchmany(_MIGRATE_BATCH):
+        conn.executemany(
+            "INSERT INTO messages_new (id, user_id, role, content, created_at, tokens) VALUES (?, ?, ?, ?, ?, ?)",
+            ((r[0], r[1], r[2], encode_content(decode_content(r[3])), r[4] or now, r[5]) for r in rows),
+        )
+        copied += len(rows)
+    conn.execute("DROP TABLE messages")
+    conn.execute("ALTER TABLE messages_new RENAME TO messages")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user_id_id ON messages(user_id, id)")
+
+    conn.execute("DROP TABLE IF EXISTS summaries_new")
+    conn.execute(_SUMMARIES_TABLE.format(name="summaries_new"))
+    conn.execute(
+        "INSERT INTO summaries_new SELECT user_id, content, tokens, upto_id,"
+        " COALESCE(CAST(strftime('%s', updated_at) AS INTEGER), ?) FROM summaries",
+        (now,),
+    )
+    conn.execute("DROP TABLE summaries")
+    conn.execute("ALTER TABLE summaries_new RENAME TO summaries")
+    logger.info(
+        "БД: формат messages обновлён (время в секундах, сжатие %s), перенесено %s строк за %.1f с",
+        MEMORY_COMPRESSION, copied, time.monotonic() - started,
+    )
+
+
+def _enable_incremental_vacuum(conn: sqlite3.Connection) -> None:
+    """
+    auto_vacuum=INCREMENTAL, so freed pages can be returned in steps (incremental_vacuum). Free
+    on a new file (no tables yet); an existing file needs a full rebuild, which is
+    left to enable_incremental_vacuum() (bot_mem.admin vacuum-mode): only a warning here.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    if conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() is None:
+        # The WAL header is already written, so the mode applies after a VACUUM: instant when empty
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        return
+    logger.warning(
+        "БД без auto_vacuum=INCREMENTAL: свободные страницы не возвращаются ОС. Включить: "
+        "python -m bot_mem.admin vacuum-mode (при остановленном боте, перестройка файла)"
+    )
+
+
+def enable_incremental_vacuum() -> bool:
+    """
+    Switch an existing memory DB to auto_vacuum=INCREMENTAL: a full VACUUM that rewrites the
+    file, holds an exclusive lock throughout (run with the bot stopped) and needs free disk
+    space of about the DB size. False if the mode was already on.
+    """
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    size_mb = MEMORY_DB_PATH.stat().st_size / 1e6 if MEMORY_DB_PATH.exists() else 0.0
+    logger.warning("БД: перестройка файла для incremental vacuum (%.0f МБ, нужно столько же свободного места)", size_mb)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    started = time.monotonic()
+    conn.execute("VACUUM")
+    logger.info("БД: включён incremental vacuum, файл перестроен за %.1f с", time.monotonic() - started)
+    return True
+
+
+def backup(dest: Path, pages: int = -1) -> None:
+    """
+    Online copy of the memory DB to dest (SQLite backup API, on a connection of its own).
+    pages=-1 copies in one read transaction: with WAL the bot keeps writing meanwhile and the copy
+    is the state at its start. pages > 0 copies in steps, but another process's write restarts it.
+    Written to dest.tmp and renamed, so dest is never a partial copy.
+    """
+    tmp = dest.with_name(dest.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    started = time.monotonic()
+    source = _open_connection()
+    target = sqlite3.connect(str(tmp))
+    try:
+        source.backup(target, pages=pages)
+    finally:
+        target.close()
+        source.close()
+    tmp.replace(dest)
+    logger.info("Резервная копия БД: %s (%.1f МБ за %.1f с)", dest, dest.stat().st_size / 2**20, time.monotonic() - started)
 
 
 def init_db() -> None:
-    """Ensure DB file and table exist. Call at bot startup."""
+    """Ensure DB file, schema and WAL mode exist. Call once at bot startup."""
     conn = get_connection()
     try:
-        conn.close()
-    except Exception:
-        pass
+        # Before the schema: on a new file the mode is set for free
+        _enable_incremental_vacuum(conn)
+        conn.executescript(_SCHEMA)
+        _migrate(conn)
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error("Ошибка при инициализации БД: %s", e)
+        raise
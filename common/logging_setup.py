@@ -1,22 +1,213 @@
-"""Unified console logging: [INFO] name: message / [ERROR] name: message."""
+"""
+Unified console logging: [INFO] name: message / [ERROR] name: message, or JSON lines.
+Records are handed to a writer thread through a bounded queue, so a slow stdout does not stall
+the event loop.
+"""
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import random
 import sys
+import zlib
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, TextIO
 
+from common.config import LOG_FORMAT, LOG_QUEUE_POLICY, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE
+from common.metrics import registry
 
-def setup_logging(name: str, level: int = logging.INFO) -> logging.Logger:
+if TYPE_CHECKING:
+    from aiogram.types import TelegramObject
+
+TEXT_FORMAT = "[%(levelname)s] %(name)s: %(message)s"
+
+# Correlation fields of the update being handled (set by LogContext, inherited by tasks it starts:
+# a bot_mem turn worker keeps the id of the update that started it)
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+current_user: ContextVar[int | None] = ContextVar("current_user", default=None)
+
+# extra= for high-volume per-message INFO lines: kept only for LOG_SAMPLE_RATE of requests
+SAMPLED = {"sampled": True}
+
+logger = logging.getLogger(__name__)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, request_id, user_id, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "user_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                out[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False)
+
+
+class _ContextFilter(logging.Filter):
+    """Stamps request_id / user_id; drops SAMPLED lines of requests outside the sample rate."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rid = record.request_id = request_id.get()
+        record.user_id = current_user.get()
+        if self.sample_rate >= 1 or not getattr(record, "sampled", False) or record.levelno > logging.INFO:
+            return True
+        # All lines of one request are kept or dropped together
+        point = zlib.crc32(rid.encode()) / 2**32 if rid else random.random()
+        return point < self.sample_rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
     """
-    Configure root logger for console. Format: "[LEVEL] name: message".
+    QueueHandler with a full-queue policy: "block" waits for room; "drop" loses INFO/DEBUG lines
+    (counted, and reported once there is room again) while warnings and errors still wait.
+    """
+
+    def __init__(self, q: queue.Queue, block: bool):
+        super().__init__(q)
+        self.block = block
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render message and traceback here (args may change later); keep the fields for JSON
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.block or record.levelno >= logging.WARNING:
+            self.queue.put(record)
+        else:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                self._unreported += 1
+                return
+        if self._unreported:
+            notice = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "Пропущено строк лога: %s (очередь логов переполнена)", (self._unreported,), None,
+            )
+            try:
+                self.queue.put_nowait(self.prepare(notice))
+                self._unreported = 0
+            except queue.Full:
+                pass
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room: with a full queue put_nowait would fail and stop() would never return
+        self.queue.put(self._sentinel)
+
+
+_context = _ContextFilter(LOG_SAMPLE_RATE)
+_sink: logging.Handler | None = None
+_queue_handler: _QueueHandler | None = None
+_listener: _QueueListener | None = None
+
+
+def setup_logging(name: str, level: int = logging.INFO, stream: TextIO | None = None) -> logging.Logger:
+    """
+    Configure root logger for console (LOG_FORMAT text or json; stdout unless stream is given).
+    With LOG_QUEUE_SIZE > 0 records go through a bounded queue to a writer thread; stop_logging()
+    (also run at exit) flushes it.
     Use for flow: start, message received, OpenAI request, DB write, responses, errors.
     Returns logger for the given name.
     """
+    global _sink, _queue_handler, _listener
     root = logging.getLogger()
     if root.handlers:
         return logging.getLogger(name)
 
-    handler = logging.StreamHandler(sys.stdout)
+    _sink = logging.StreamHandler(stream or sys.stdout)
+    _sink.setLevel(level)
+    _sink.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    if LOG_QUEUE_SIZE:
+        _queue_handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE), block=LOG_QUEUE_POLICY == "block")
+        _listener = _QueueListener(_queue_handler.queue, _sink, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        handler: logging.Handler = _queue_handler
+    else:
+        handler = _sink
     handler.setLevel(level)
-    formatter = logging.Formatter("[%(levelname)s] %(name)s: %(message)s")
-    handler.setFormatter(formatter)
+    handler.addFilter(_context)
     root.addHandler(handler)
     root.setLevel(level)
     return logging.getLogger(name)
+
+
+def stop_logging() -> None:
+    """Write out every queued record, then log synchronously (late shutdown lines). Idempotent."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    root = logging.getLogger()
+    # Under the handler lock: no emit is half-way through when the sentinel goes in
+    with _queue_handler.lock:
+        root.removeHandler(_queue_handler)
+        _sink.addFilter(_context)
+        root.addHandler(_sink)
+    listener.stop()
+    if _queue_handler.dropped:
+        logger.warning("Всего пропущено строк лога: %s", _queue_handler.dropped)
+    _sink.flush()
+
+
+def log_stats() -> dict[str, int]:
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
+
+
+registry.add_stats("logging", log_stats)
+
+
+class LogContext:
+    """
+    Outer update middleware: request_id ("<bot>:<update_id>") and user_id on every log line.
+    Any callable works as aiogram middleware; without the base class the admin CLI logs without aiogram.
+    """
+
+    def __init__(self, bot: str) -> None:
+        self.bot = bot
+
+    async def __call__(
+        self,
+        handler: Callable[["TelegramObject", dict[str, Any]], Awaitable[Any]],
+        event: "TelegramObject",
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        rid_token = request_id.set(f"{self.bot}:{getattr(event, 'update_id', '')}")
+        user_token = current_user.set(user.id if user else None)
+        try:
+            return await handler(event, data)
+        finally:
+            request_id.reset(rid_token)
+            current_user.reset(user_token)
@@ -0,0 +1,100 @@
+"""Background storage maintenance for bot_mem: expire inactive users, return free pages to the OS."""
+import asyncio
+import logging
+import time
+
+from common.config import MEMORY_MAINTENANCE_INTERVAL, MEMORY_TTL_DAYS, MEMORY_VACUUM_PAGES
+from common.memory_store import MemoryStore, memory_store
+from common.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class Maintenance:
+    """
+    Every `interval` seconds: delete users with no messages for `ttl_days` (in batches of
+    `batch` users, each batch one short write), then run incremental vacuum `vacuum_pages`
+    pages at a time until the free list is empty or a step frees nothing (skipped when the file
+    is not in auto_vacuum=INCREMENTAL mode, where vacuum steps free nothing). All writes go through the store's writer
+    thread between regular writes, so turns are delayed by one batch at most.
+    """
+
+    def __init__(
+        self,
+        store: MemoryStore = memory_store,
+        ttl_days: float = MEMORY_TTL_DAYS,
+        interval: float = MEMORY_MAINTENANCE_INTERVAL,
+        vacuum_pages: int = MEMORY_VACUUM_PAGES,
+        batch: int = 100,
+    ):
+        self.store = store
+        self.ttl_days = ttl_days
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.batch = batch
+        self.expired_users = 0
+        self.vacuumed_pages = 0
+        self.runs = 0
+        self._vacuum_warned = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="memory-maintenance")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict[str, int]:
+        return {"runs": self.runs, "expired_users": self.expired_users, "vacuumed_pages": self.vacuumed_pages}
+
+    async def run_once(self) -> tuple[int, int]:
+        """One maintenance pass; returns (expired users, freed pages)."""
+        expired = 0
+        if self.ttl_days > 0:
+            cutoff = int(time.time() - self.ttl_days * 86400)
+            while user_ids := await self.store.inactive_users(cutoff, self.batch):
+                await self.store.expire_users(user_ids, cutoff)
+                expired += len(user_ids)
+        freed = 0
+        if await self.store.incremental_vacuum_enabled():
+            free = await self.store.freelist_pages()
+            while free > 0:
+                await self.store.incremental_vacuum(self.vacuum_pages)
+                left = await self.store.freelist_pages()
+                if left >= free:
+                    logger.warning("Обслуживание БД: incremental vacuum не освободил страниц, свободно %s", left)
+                    break
+                freed += free - left
+                free = left
+        elif not self._vacuum_warned:
+            self._vacuum_warned = True
+            logger.warning(
+                "Обслуживание БД: auto_vacuum не INCREMENTAL, свободные страницы не возвращаются ОС "
+                "(включить: python -m bot_mem.admin vacuum-mode)"
+            )
+        self.runs += 1
+        self.expired_users += expired
+        self.vacuumed_pages += freed
+        if expired or freed:
+            logger.info("Обслуживание БД: удалено неактивных пользователей %s, освобождено страниц %s", expired, freed)
+        return expired, freed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception("Ошибка обслуживания БД: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+# Process-wide maintenance for bot_mem; started in bot_mem/main.py
+maintenance = Maintenance()
+registry.add_stats("memory_maintenance", maintenance.stats)
@@ -0,0 +1,304 @@
+"""
+bot_mem history storage behind one interface (MEMORY_BACKEND): SQLite via memory_repo, in-process
+memory, or a Redis-protocol server. MemoryStore talks to a backend, not to memory_repo directly.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from common import memory_repo
+from common.config import (
+    MEMORY_BACKEND,
+    MEMORY_SQLITE_ONLY_OFF,
+    MEMORY_TTL_DAYS,
+    OPENAI_MODEL,
+    REDIS_KEY_PREFIX,
+    REDIS_TIMEOUT,
+    REDIS_URL,
+)
+from common.db import close_connections, init_db
+from common.metrics import db_op_seconds
+from common.redis_protocol import RedisConnection
+from common.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+LIMIT_ROWS = memory_repo.LIMIT_ROWS
+# Write operations every backend supports; summaries, expiry and vacuum are SQLite-only (extras)
+HISTORY_OPS = ("add_message", "record_turn", "clear_user", "trim_user")
+
+if MEMORY_SQLITE_ONLY_OFF:
+    logger.warning(
+        "MEMORY_BACKEND=%s: %s работает только с sqlite и отключено", MEMORY_BACKEND, ", ".join(MEMORY_SQLITE_ONLY_OFF)
+    )
+
+
+def _unsupported(op: str, backend: str) -> ValueError:
+    return ValueError(f"операция {op} не поддерживается хранилищем {backend}")
+
+
+def _message(role: str, content: str) -> dict[str, Any]:
+    return {"role": role, "content": content, "tokens": count_tokens(content, OPENAI_MODEL)}
+
+
+def _messages(op: str, args: tuple) -> list[dict[str, Any]]:
+    """New history items of a write op (tokens counted once, at write time); [] for other ops."""
+    if op == "add_message":
+        return [_message(args[1], args[2])]
+    if op == "record_turn":
+        return [_message("user", args[1]), _message("assistant", args[2])]
+    return []
+
+
+class MemoryBackend:
+    """
+    History storage used by MemoryStore. Subclasses implement write_batch() and load_context();
+    both are blocking and called from MemoryStore's writer thread and reader pool.
+    extras: summaries, recall, compaction candidates and TTL maintenance are available (SQLite).
+    atomic_batches: a write_batch() that raised applied nothing, so MemoryStore may replay its
+    ops one by one to isolate a bad one. False when a failed batch may be partly applied.
+    """
+
+    name = "base"
+    extras = False
+    atomic_batches = True
+
+    def open(self) -> None:
+        """Prepare storage (schema, connection check). Called once at startup, in a thread."""
+
+    def close(self) -> None:
+        """Release connections. Called on shutdown after MemoryStore has flushed its writes."""
+
+    def write_batch(self, ops: list[tuple[str, tuple]]) -> None:
+        """Apply ops (see memory_repo.write_batch); all or nothing when atomic_batches."""
+        raise NotImplementedError
+
+    def load_context(self, user_id: int) -> list[dict[str, Any]]:
+        """Last 2*N messages for user, chronological: [{"role", "content", "tokens"}, ...]."""
+        raise NotImplementedError
+
+    def cached_context(self, user_id: int) -> list[dict[str, Any]] | None:
+        """Window answered without I/O (MemoryStore skips the reader pool), or None."""
+        return None
+
+    def get_context(self, user_id: int) -> list[dict[str, Any]]:
+        cached = self.cached_context(user_id)
+        return cached if cached is not None else self.load_context(user_id)
+
+    def add_message(self, user_id: int, role: str, content: str) -> None:
+        self.write_batch([("add_message", (user_id, role, content))])
+
+    def record_turn(self, user_id: int, user_text: str, assistant_text: str) -> None:
+        self.write_batch([("record_turn", (user_id, user_text, assistant_text))])
+
+    def clear_user(self, user_id: int) -> None:
+        self.write_batch([("clear_user", (user_id,))])
+
+    def trim_user(self, user_id: int) -> None:
+        self.write_batch([("trim_user", (user_id,))])
+
+
+class SqliteBackend(MemoryBackend):
+    """MEMORY_DB_PATH through memory_repo: group commit, history cache, summaries, recall."""
+
+    name = "sqlite"
+    extras = True
+
+    def open(self) -> None:
+        init_db()
+
+    def close(self) -> None:
+        close_connections()
+
+    def write_batch(self, ops: list[tuple[str, tuple]]) -> None:
+        memory_repo.write_batch(ops)
+
+    def load_context(self, user_id: int) -> list[dict[str, Any]]:
+        return memory_repo.load_context(user_id)
+
+    def cached_context(self, user_id: int) -> list[dict[str, Any]] | None:
+        return memory_repo.history_cache.get(user_id)
+
+
+class InMemoryBackend(MemoryBackend):
+    """
+    Window per user kept in this process (lost on restart; no TTL): for tests and ephemeral runs.
+    Every read is served from memory, so MemoryStore never needs the reader pool.
+    """
+
+    name = "memory"
+
+    def __init__(self, limit_rows: int = LIMIT_ROWS):
+        self.limit_rows = limit_rows
+        self._windows: dict[int, deque] = {}
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._windows.clear()
+
+    def write_batch(self, ops: list[tuple[str, tuple]]) -> None:
+        for op, _ in ops:
+            if op not in HISTORY_OPS:
+                raise _unsupported(op, self.name)
+        # Token counting outside the lock; nothing is applied before every op is known to be valid
+        prepared = [(op, args, _messages(op, args)) for op, args in ops]
+        with self._lock:
+            for op, args, messages in prepared:
+                if op == "clear_user":
+                    self._windows.pop(args[0], None)
+                elif messages:
+                    window = self._windows.get(args[0])
+                    if window is None:
+                        window = self._windows[args[0]] = deque(maxlen=self.limit_rows)
+                    window.extend(messages)
+                # trim_user: the window is capped on every append already
+
+    def load_context(self, user_id: int) -> list[dict[str, Any]]:
+        with self._lock:
+            window = self._windows.get(user_id)
+            return [dict(m) for m in window] if window else []
+
+    def cached_context(self, user_id: int) -> list[dict[str, Any]]:
+        return self.load_context(user_id)
+
+
+class RedisBackend(MemoryBackend):
+    """
+    Capped list per user on a Redis-protocol server: key "<prefix>:<user_id>", one JSON item per
+    message, newest last. A batch goes out as MULTI ... EXEC in one pipeline (one round trip; no
+    other client's commands run in between); each push is followed by LTRIM to the window and,
+    with MEMORY_TTL_DAYS, EXPIRE. No local cache: replicas sharing the server see each other's writes.
+    One connection per thread (writer thread, reader pool), reopened after a socket error.
+
+    Not all or nothing: Redis does not roll back a transaction when one command fails at run time
+    (e.g. WRONGTYPE on a key of another type), and after a socket error the batch may or may not
+    have been applied. So a failed batch is never replayed (atomic_batches = False): an RPUSH sent
+    twice would duplicate turns. Unsupported ops are rejected before anything is sent.
+    """
+
+    name = "redis"
+    atomic_batches = False
+
+    def __init__(
+        self,
+        url: str = REDIS_URL,
+        prefix: str = REDIS_KEY_PREFIX,
+        timeout: float = REDIS_TIMEOUT,
+        limit_rows: int = LIMIT_ROWS,
+        ttl_seconds: int = int(MEMORY_TTL_DAYS * 86400),
+    ):
+        self.url = url
+        self.prefix = prefix
+        self.timeout = timeout
+        self.limit_rows = limit_rows
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[RedisConnection] = []
+        self._generation = 0
+
+    def open(self) -> None:
+        self._call(lambda conn: conn.execute("PING"))
+
+    def close(self) -> None:
+        with self._lock:
+            self._generation += 1
+            conns = list(self._connections)
+            self._connections.clear()
+        for conn in conns:
+            conn.close()
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    def _connection(self) -> RedisConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+        conn = RedisConnection(self.url, self.timeout)
+        with self._lock:
+            self._connections.append(conn)
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    def _discard(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def _call(self, fn, retry: bool = False):
+        """
+        fn(connection) on this thread's connection. After a socket error (OSError, including
+        timeouts and a closed connection) the reply stream is out of sync, so the connection is
+        dropped; reads (retry=True) are repeated once on a new one, writes are not (they may have
+        been applied). An error reply (RedisError) is permanent: every reply was read, the
+        connection stays usable and nothing is retried.
+        """
+        try:
+            return fn(self._connection())
+        except OSError as e:
+            self._discard()
+            if not retry:
+                logger.error("Ошибка соединения с Redis: %s", e)
+                raise
+        return fn(self._connection())
+
+    def _commands(self, op: str, args: tuple) -> list[tuple]:
+        key = self._key(args[0])
+        if op == "clear_user":
+            return [("DEL", key)]
+        if op == "trim_user":
+            return [("LTRIM", key, -self.limit_rows, -1)]
+        items = [json.dumps(m, ensure_ascii=False) for m in _messages(op, args)]
+        commands = [("RPUSH", key, *items), ("LTRIM", key, -self.limit_rows, -1)]
+        if self.ttl_seconds > 0:
+            commands.append(("EXPIRE", key, self.ttl_seconds))
+        return commands
+
+    def write_batch(self, ops: list[tuple[str, tuple]]) -> None:
+        for op, _ in ops:
+            if op not in HISTORY_OPS:
+                raise _unsupported(op, self.name)
+        started = time.perf_counter()
+        commands = [("MULTI",)]
+        for op, args in ops:
+            commands.extend(self._commands(op, args))
+        commands.append(("EXEC",))
+        self._call(lambda conn: conn.pipeline(commands))
+        db_op_seconds.labels(ops[0][0] if len(ops) == 1 else "write_batch").observe(time.perf_counter() - started)
+
+    def load_context(self, user_id: int) -> list[dict[str, Any]]:
+        started = time.perf_counter()
+        items = self._call(lambda conn: conn.execute("LRANGE", self._key(user_id), -self.limit_rows, -1), retry=True)
+        db_op_seconds.labels("load_context").observe(time.perf_counter() - started)
+        history = []
+        for item in items:
+            m = json.loads(item)
+            if m.get("tokens") is None:
+                m["tokens"] = count_tokens(m["content"], OPENAI_MODEL)
+            history.append(m)
+        return history
+
+
+_BACKENDS = {"sqlite": SqliteBackend, "memory": InMemoryBackend, "redis": RedisBackend}
+
+
+def create_backend(name: str = MEMORY_BACKEND) -> MemoryBackend:
+    """Backend by MEMORY_BACKEND name with settings from config."""
+    try:
+        return _BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"неизвестное хранилище истории: {name}") from None
+
+
+# Process-wide backend used by memory_store; opened/closed in bot_mem/main.py
+memory_backend = create_backend()
@@ -1,30 +1,400 @@
-"""CRUD for user message history: add_message, get_context, clear_user, trim_user."""
+"""CRUD for user message history: add_message, record_turn, get_context, clear_user, trim_user, summaries, export/import."""
 import logging
-from datetime import datetime, timezone
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator
+from datetime import datetime
 from typing import Any
 
-from common.config import HISTORY_PAIRS_LIMIT
-from common.db import ensure_data_dir, get_connection
+from common.config import (
+    HISTORY_PAIRS_LIMIT,
+    MEMORY_CACHE_MAX_BYTES,
+    MEMORY_CACHE_MAX_USERS,
+    MEMORY_COMPACT_MAX_PAIRS,
+    MEMORY_COMPACTION,
+    OPENAI_MODEL,
+    RECALL_MIN_SCORE,
+    RECALL_TOP_K,
+)
+from common.db import decode_content, encode_content, get_connection
+from common.metrics import db_op_seconds, registry
+from common.recall import recall_index
+from common.tokens import count_tokens
 
 logger = logging.getLogger(__name__)
 
 LIMIT_ROWS = HISTORY_PAIRS_LIMIT * 2  # N pairs = 2*N rows
+# Rows kept in DB: with compaction, turns beyond the window wait there until folded into the summary;
+# with recall, nothing is trimmed (None): the whole history is searchable
+KEEP_ROWS = None if recall_index is not None else LIMIT_ROWS + (MEMORY_COMPACT_MAX_PAIRS * 2 if MEMORY_COMPACTION else 0)
+
+# SQL kept constant so sqlite3 reuses the prepared statements on the long-lived connection
+_INSERT_SQL = "INSERT INTO messages (user_id, role, content, created_at, tokens) VALUES (?, ?, ?, ?, ?)"
+_SELECT_CONTEXT_SQL = """
+SELECT id, role, content, tokens FROM messages
+WHERE user_id = ?
+ORDER BY id DESC
+LIMIT ?
+"""
+_DELETE_USER_SQL = "DELETE FROM messages WHERE user_id = ?"
+_DELETE_SUMMARY_SQL = "DELETE FROM summaries WHERE user_id = ?"
+_SELECT_SUMMARY_SQL = "SELECT content, tokens FROM summaries WHERE user_id = ?"
+_SELECT_SUMMARY_UPTO_SQL = "SELECT upto_id FROM summaries WHERE user_id = ?"
+# Rows older than the user's window and not yet in the summary, oldest first: what compaction folds
+_SELECT_BEYOND_WINDOW_SQL = """
+SELECT id, role, content FROM messages WHERE user_id = ? AND id > ? AND id < (
+    SELECT id FROM messages WHERE user_id = ?
+    ORDER BY id DESC LIMIT 1 OFFSET ?
+)
+ORDER BY id
+"""
+_UPSERT_SUMMARY_SQL = """
+INSERT INTO summaries (user_id, content, tokens, upto_id, updated_at) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+  content = excluded.content, tokens = excluded.tokens,
+  upto_id = excluded.upto_id, updated_at = excluded.updated_at
+"""
+_DELETE_UPTO_SQL = "DELETE FROM messages WHERE user_id = ? AND id <= ?"
+# Export pages by key (id / user_id > last seen): each page is a short read, no snapshot is held
+_EXPORT_MESSAGES_SQL = (
+    "SELECT id, user_id, role, content, created_at, tokens FROM messages WHERE id > ? ORDER BY id LIMIT ?"
+)
+_EXPORT_SUMMARIES_SQL = (
+    "SELECT user_id, content, tokens, upto_id, updated_at FROM summaries WHERE user_id > ? ORDER BY user_id LIMIT ?"
+)
+# Next AUTOINCREMENT id is this + 1 (inside a write transaction nobody else can take it)
+_LAST_ID_SQL = """
+SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'messages'), 0),
+           COALESCE((SELECT MAX(id) FROM messages), 0))
+"""
+_SET_SUMMARY_UPTO_SQL = "UPDATE summaries SET upto_id = ? WHERE user_id = ?"
+# Users whose newest message is older than the cutoff: max id per user comes from the index alone
+_SELECT_INACTIVE_SQL = """
+SELECT m.user_id FROM (
+    SELECT user_id, MAX(id) AS last_id FROM messages GROUP BY user_id
+) AS t JOIN messages AS m ON m.id = t.last_id
+WHERE m.created_at < ?
+LIMIT ?
+"""
+_SELECT_LAST_CREATED_SQL = "SELECT created_at FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT 1"
+# Delete everything older than the user's LIMIT_ROWS-th newest row (index seek on (user_id, id))
+_TRIM_SQL = """
+DELETE FROM messages WHERE user_id = ? AND id < (
+    SELECT id FROM messages WHERE user_id = ?
+    ORDER BY id DESC LIMIT 1 OFFSET ?
+)
+"""
+
+
+# Rough per-message overhead of the cached dict on top of the content string
+_ENTRY_OVERHEAD = 200
+
+
+class HistoryCache:
+    """
+    Bounded LRU of per-user history windows (last LIMIT_ROWS messages), write-through.
+    Evicts least recently used users when max_users or max_bytes is exceeded.
+    Thread-safe: a DB load racing with a write for the same user is not cached.
+    """
+
+    def __init__(self, max_users: int, max_bytes: int, limit_rows: int = LIMIT_ROWS):
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.limit_rows = limit_rows
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[int, deque] = OrderedDict()
+        self._sizes: dict[int, int] = {}
+        self._bytes = 0
+        self._loading: dict[int, int] = {}
+        self._stale: set[int] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_users > 0 and self.max_bytes > 0
+
+    def get(self, user_id: int) -> list[dict[str, Any]] | None:
+        """Return a copy of the cached window or None on miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return [dict(m) for m in entry]
+
+    def begin_load(self, user_id: int) -> None:
+        """Mark that a DB read for user_id is in flight."""
+        with self._lock:
+            self._loading[user_id] = self._loading.get(user_id, 0) + 1
+
+    def finish_load(self, user_id: int, rows: list[dict[str, Any]] | None) -> None:
+        """Store rows read from DB unless a write for this user happened meanwhile."""
+        with self._lock:
+            left = self._loading.get(user_id, 1) - 1
+            stale = user_id in self._stale
+            if left:
+                self._loading[user_id] = left
+            else:
+                self._loading.pop(user_id, None)
+                self._stale.discard(user_id)
+            if rows is None or stale or not self.enabled:
+                return
+            self._drop(user_id)
+            entry = deque((dict(m) for m in rows), maxlen=self.limit_rows)
+            self._entries[user_id] = entry
+            self._sizes[user_id] = 0
+            self._resize(user_id)
+
+    def append(self, user_id: int, messages: list[dict[str, Any]]) -> None:
+        """Write-through: extend the cached window if the user is cached."""
+        with self._lock:
+            if user_id in self._loading:
+                self._stale.add(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            entry.extend(dict(m) for m in messages)
+            self._entries.move_to_end(user_id)
+            self._resize(user_id)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            if user_id in self._loading:
+                self._stale.add(user_id)
+            self._drop(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "users": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _drop(self, user_id: int) -> None:
+        if self._entries.pop(user_id, None) is not None:
+            self._bytes -= self._sizes.pop(user_id, 0)
+
+    def _resize(self, user_id: int) -> None:
+        size = sum(sys.getsizeof(m["content"]) + _ENTRY_OVERHEAD for m in self._entries[user_id])
+        self._bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+        while self._entries and (len(self._entries) > self.max_users or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+
+class SummaryCache:
+    """
+    LRU of per-user summaries: {"content", "tokens"} or None when the user has none (cached
+    too, so users without a summary cost no query). Writes overwrite; a DB load only fills a
+    missing entry, so a load racing with a compaction never puts back an older summary.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._entries: OrderedDict[int, dict[str, Any] | None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, user_id: int) -> tuple[bool, dict[str, Any] | None]:
+        """(found, summary)."""
+        with self._lock:
+            if user_id not in self._entries:
+                return False, None
+            self._entries.move_to_end(user_id)
+            return True, self._entries[user_id]
+
+    def put(self, user_id: int, summary: dict[str, Any] | None, loaded: bool = False) -> None:
+        if not self.max_users:
+            return
+        with self._lock:
+            if loaded and user_id in self._entries:
+                return
+            self._entries[user_id] = summary
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+history_cache = HistoryCache(MEMORY_CACHE_MAX_USERS, MEMORY_CACHE_MAX_BYTES)
+summary_cache = SummaryCache(MEMORY_CACHE_MAX_USERS)
+registry.add_stats("history_cache", history_cache.stats)
+
+_load_seconds = db_op_seconds.labels("load_context")
+
+
+def cache_stats() -> dict[str, int]:
+    """Hit/miss/eviction counters and current size of the history cache."""
+    return history_cache.stats()
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def _trim(conn, user_id: int) -> None:
+    """Trim user history inside the caller's transaction (KEEP_ROWS newest rows stay)."""
+    if KEEP_ROWS is not None:
+        conn.execute(_TRIM_SQL, (user_id, user_id, KEEP_ROWS - 1))
+
+
+def _message(role: str, content: str) -> dict[str, Any]:
+    """History item with its token count computed once, at write time."""
+    return {"role": role, "content": content, "tokens": count_tokens(content, OPENAI_MODEL)}
+
+
+def _insert(conn, user_id: int, messages: list[dict[str, Any]]) -> None:
+    """Insert messages and set their "id" (needed by the recall index)."""
+    created_at = _now()
+    for m in messages:
+        m["id"] = conn.execute(
+            _INSERT_SQL, (user_id, m["role"], encode_content(m["content"]), created_at, m["tokens"])
+        ).lastrowid
+
+
+def _add_message_tx(conn, user_id: int, role: str, content: str) -> list[dict[str, Any]]:
+    messages = [_message(role, content)]
+    _insert(conn, user_id, messages)
+    _trim(conn, user_id)
+    return messages
+
+
+def _record_turn_tx(conn, user_id: int, user_text: str, assistant_text: str) -> list[dict[str, Any]]:
+    messages = [_message("user", user_text), _message("assistant", assistant_text)]
+    _insert(conn, user_id, messages)
+    _trim(conn, user_id)
+    return messages
+
+
+def _clear_user_tx(conn, user_id: int) -> None:
+    conn.execute(_DELETE_USER_SQL, (user_id,))
+    conn.execute(_DELETE_SUMMARY_SQL, (user_id,))
+
+
+def _compact_tx(conn, user_id: int, content: str, upto_id: int) -> list[dict[str, Any]] | None:
+    """
+    Store the new summary and delete the rows it covers (id <= upto_id; kept when recall is on). Skipped when row
+    upto_id is gone (history was reset while the summary was being written).
+    Returns [summary] on success for _after_commit, None when skipped.
+    """
+    if conn.execute("SELECT 1 FROM messages WHERE user_id = ? AND id = ?", (user_id, upto_id)).fetchone() is None:
+        return None
+    tokens = count_tokens(content, OPENAI_MODEL)
+    conn.execute(_UPSERT_SUMMARY_SQL, (user_id, content, tokens, upto_id, _now()))
+    if recall_index is None:
+        # With recall the folded rows stay searchable; upto_id marks them as summarized
+        conn.execute(_DELETE_UPTO_SQL, (user_id, upto_id))
+    return [{"content": content, "tokens": tokens}]
+
+
+def _expire_users_tx(conn, user_ids: list[int], cutoff: int) -> list[int]:
+    """Delete users whose newest message is still older than cutoff (re-checked here); returns them."""
+    expired = []
+    for user_id in user_ids:
+        row = conn.execute(_SELECT_LAST_CREATED_SQL, (user_id,)).fetchone()
+        if row is not None and row[0] < cutoff:
+            _clear_user_tx(conn, user_id)
+            expired.append(user_id)
+    return expired
+
+
+def _incremental_vacuum_tx(conn, pages: int) -> None:
+    # sqlite3 steps a result-less PRAGMA once, and each step frees one page: step it per page
+    for _ in range(min(pages, conn.execute("PRAGMA freelist_count").fetchone()[0])):
+        conn.execute("PRAGMA incremental_vacuum(1)")
+
+
+def _forget_user(user_id: int) -> None:
+    history_cache.invalidate(user_id)
+    summary_cache.put(user_id, None)
+    if recall_index is not None:
+        recall_index.drop(user_id)
+
+
+def _after_commit(op: str, args: tuple, written: list[Any] | None) -> None:
+    """Apply a committed write to the history and summary caches."""
+    if op == "expire_users":
+        for user_id in written:
+            _forget_user(user_id)
+    elif op == "compact":
+        # Folded rows are older than the cached window: only the summary changes
+        if written:
+            summary_cache.put(args[0], written[0])
+    elif written:
+        history_cache.append(args[0], written)
+        if recall_index is not None:
+            _index_messages(args[0], written)
+    elif op == "clear_user":
+        _forget_user(args[0])
+
+
+def _index_messages(user_id: int, messages: list[dict[str, Any]]) -> None:
+    # Rows are committed already: an indexing failure only makes them unsearchable
+    try:
+        recall_index.add(user_id, [m["id"] for m in messages], [m["content"] for m in messages])
+    except Exception as e:
+        logger.error("Ошибка индексации сообщений для поиска user_id=%s: %s", user_id, e)
+
+
+# Write operations by name: used by the public functions and by write_batch()
+_WRITE_OPS = {
+    "add_message": _add_message_tx,
+    "record_turn": _record_turn_tx,
+    "clear_user": _clear_user_tx,
+    "trim_user": _trim,
+    "compact": _compact_tx,
+    "expire_users": _expire_users_tx,
+    "incremental_vacuum": _incremental_vacuum_tx,
+}
+
+
+def write_batch(ops: list[tuple[str, tuple]]) -> None:
+    """
+    Apply several write operations in one transaction (group commit).
+    ops: [("record_turn", (user_id, user_text, assistant_text)), ("clear_user", (user_id,)), ...].
+    Either all are committed or none; the cache is updated after commit.
+    """
+    started = time.perf_counter()
+    conn = get_connection()
+    with conn:
+        written = [_WRITE_OPS[op](conn, *args) for op, args in ops]
+    db_op_seconds.labels(ops[0][0] if len(ops) == 1 else "write_batch").observe(time.perf_counter() - started)
+    for (op, args), rows in zip(ops, written):
+        _after_commit(op, args, rows)
 
 
 def add_message(user_id: int, role: str, content: str) -> None:
     """Append one message and trim user history to last N pairs."""
-    ensure_data_dir()
     try:
-        conn = get_connection()
-        try:
-            conn.execute(
-                "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-                (user_id, role, content, datetime.now(tz=timezone.utc).isoformat()),
-            )
-            conn.commit()
-        finally:
-            conn.close()
-        trim_user(user_id)
+        write_batch([("add_message", (user_id, role, content))])
+    except Exception as e:
+        logger.error("Ошибка при записи в БД: %s", e)
+        raise
+
+
+def record_turn(user_id: int, user_text: str, assistant_text: str) -> None:
+    """Save a user message and the assistant reply, then trim, in one transaction."""
+    try:
+        write_batch([("record_turn", (user_id, user_text, assistant_text))])
     except Exception as e:
         logger.error("Ошибка при записи в БД: %s", e)
         raise
@@ -33,41 +403,42 @@ def add_message(user_id: int, role: str, content: str) -> None:
 def get_context(user_id: int) -> list[dict[str, Any]]:
     """
     Return last 2*N messages for user in chronological order.
-    Each dict: {"role": "user"|"assistant", "content": "..."}.
+    Each dict: {"role": "user"|"assistant", "content": "...", "tokens": int}.
+    Served from the history cache when the user is cached.
     """
-    ensure_data_dir()
+    cached = history_cache.get(user_id)
+    if cached is not None:
+        return cached
+    return load_context(user_id)
+
+
+def load_context(user_id: int) -> list[dict[str, Any]]:
+    """Read the user's window from DB (no cache lookup) and put it into the cache."""
+    history = None
+    history_cache.begin_load(user_id)
     try:
+        started = time.perf_counter()
         conn = get_connection()
-        try:
-            cur = conn.execute(
-                """
-                SELECT role, content FROM messages
-                WHERE user_id = ?
-                ORDER BY id DESC
-                LIMIT ?
-                """,
-                (user_id, LIMIT_ROWS),
-            )
-            rows = cur.fetchall()
-        finally:
-            conn.close()
+        rows = conn.execute(_SELECT_CONTEXT_SQL, (user_id, LIMIT_ROWS)).fetchall()
+        _load_seconds.observe(time.perf_counter() - started)
         # Reverse to chronological order
-        return [{"role": r[0], "content": r[1]} for r in reversed(rows)]
+        history = []
+        for r in reversed(rows):
+            content = decode_content(r[2])
+            tokens = r[3] if r[3] is not None else count_tokens(content, OPENAI_MODEL)
+            history.append({"id": r[0], "role": r[1], "content": content, "tokens": tokens})
+        return history
     except Exception as e:
         logger.error("Ошибка при чтении БД: %s", e)
         raise
+    finally:
+        history_cache.finish_load(user_id, history)
 
 
 def clear_user(user_id: int) -> None:
     """Delete all messages for the given user."""
-    ensure_data_dir()
     try:
-        conn = get_connection()
-        try:
-            conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
-            conn.commit()
-        finally:
-            conn.close()
+        write_batch([("clear_user", (user_id,))])
     except Exception as e:
         logger.error("Ошибка при очистке контекста пользователя: %s", e)
         raise
@@ -75,22 +446,220 @@ def clear_user(user_id: int) -> None:
 
 def trim_user(user_id: int) -> None:
     """Keep only the last N pairs (2*N rows) for this user. Delete older rows."""
-    ensure_data_dir()
     try:
-        conn = get_connection()
-        try:
-            conn.execute(
-                """
-                DELETE FROM messages WHERE user_id = ? AND id NOT IN (
-                    SELECT id FROM messages WHERE user_id = ?
-                    ORDER BY id DESC LIMIT ?
-                )
-                """,
-                (user_id, user_id, LIMIT_ROWS),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        write_batch([("trim_user", (user_id,))])
     except Exception as e:
         logger.error("Ошибка при обрезке контекста пользователя: %s", e)
         raise
+
+
+def get_summary(user_id: int) -> dict[str, Any] | None:
+    """User's summary of folded older turns ({"content", "tokens"}) or None; cached."""
+    found, summary = summary_cache.lookup(user_id)
+    if found:
+        return summary
+    return load_summary(user_id)
+
+
+def load_summary(user_id: int) -> dict[str, Any] | None:
+    """Read the user's summary from DB (no cache lookup) and put it into the cache."""
+    try:
+        started = time.perf_counter()
+        row = get_connection().execute(_SELECT_SUMMARY_SQL, (user_id,)).fetchone()
+        db_op_seconds.labels("load_summary").observe(time.perf_counter() - started)
+    except Exception as e:
+        logger.error("Ошибка при чтении сводки из БД: %s", e)
+        raise
+    summary = {"content": row[0], "tokens": row[1]} if row else None
+    summary_cache.put(user_id, summary, loaded=True)
+    return summary
+
+
+def compaction_candidates(user_id: int) -> tuple[dict[str, Any] | None, list[tuple[int, str, str]]]:
+    """(current summary, [(id, role, content), ...] rows older than the window, oldest first)."""
+    conn = get_connection()
+    upto = conn.execute(_SELECT_SUMMARY_UPTO_SQL, (user_id,)).fetchone()
+    rows = conn.execute(_SELECT_BEYOND_WINDOW_SQL, (user_id, upto[0] if upto else 0, user_id, LIMIT_ROWS - 1)).fetchall()
+    return load_summary(user_id), [(r[0], r[1], decode_content(r[2])) for r in rows]
+
+
+def compact(user_id: int, content: str, upto_id: int) -> None:
+    """Replace the user's summary with content and delete the rows it covers (id <= upto_id)."""
+    try:
+        write_batch([("compact", (user_id, content, upto_id))])
+    except Exception as e:
+        logger.error("Ошибка при сохранении сводки: %s", e)
+        raise
+
+
+def recall(
+    user_id: int, text: str, before_id: int | None = None, k: int = RECALL_TOP_K, min_score: float = RECALL_MIN_SCORE
+) -> list[list[dict[str, Any]]]:
+    """
+    Past turns most similar to text (recall index), best first, each [user msg, assistant reply]
+    in chronological order. Only messages with id < before_id (older than the window) are searched.
+    """
+    if recall_index is None or k <= 0:
+        return []
+    started = time.perf_counter()
+    hits = [(mid, score) for mid, score in recall_index.search(user_id, text, k, before_id) if score >= min_score]
+    if not hits:
+        return []
+    wanted = {i for mid, _ in hits for i in (mid - 1, mid, mid + 1)}
+    placeholders = ",".join("?" * len(wanted))
+    rows = get_connection().execute(
+        f"SELECT id, role, content, tokens FROM messages WHERE user_id = ? AND id IN ({placeholders})",
+        (user_id, *wanted),
+    ).fetchall()
+    db_op_seconds.labels("recall").observe(time.perf_counter() - started)
+    by_id = {r[0]: {"role": r[1], "content": decode_content(r[2]), "tokens": r[3]} for r in rows}
+    turns, seen = [], set()
+    for mid, _ in hits:
+        hit = by_id.get(mid)
+        if hit is None:
+            continue
+        # A turn is the user message and the reply stored right after it
+        first = mid if hit["role"] == "user" else mid - 1
+        if first in seen:
+            continue
+        seen.add(first)
+        turn = [by_id[i] for i in (first, first + 1) if i in by_id and (i < before_id if before_id else True)]
+        if turn:
+            turns.append(turn)
+    return turns
+
+
+def inactive_users(cutoff: int, limit: int) -> list[int]:
+    """Up to limit users whose newest message was written before cutoff (unix seconds)."""
+    started = time.perf_counter()
+    rows = get_connection().execute(_SELECT_INACTIVE_SQL, (cutoff, limit)).fetchall()
+    db_op_seconds.labels("inactive_users").observe(time.perf_counter() - started)
+    return [r[0] for r in rows]
+
+
+def expire_users(user_ids: list[int], cutoff: int) -> None:
+    """Delete the history and summary of users still inactive since cutoff."""
+    write_batch([("expire_users", (user_ids, cutoff))])
+
+
+def freelist_pages() -> int:
+    """Free pages in the DB file (returned to the OS by incremental_vacuum)."""
+    return get_connection().execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def incremental_vacuum_enabled() -> bool:
+    """auto_vacuum=INCREMENTAL on the DB file; otherwise incremental_vacuum frees nothing."""
+    return get_connection().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def incremental_vacuum(pages: int) -> None:
+    """Return up to `pages` free pages to the OS (needs auto_vacuum=INCREMENTAL, see db.init_db)."""
+    write_batch([("incremental_vacuum", (pages,))])
+
+
+def export_records(page: int = 5000) -> Iterator[dict[str, Any]]:
+    """
+    Every summary, then every message in id order, as NDJSON-ready dicts ("type": "summary" /
+    "message"). Keyset pagination keeps memory bounded and lets writers run between pages.
+    """
+    conn = get_connection()
+    last = 0
+    while rows := conn.execute(_EXPORT_SUMMARIES_SQL, (last, page)).fetchall():
+        for r in rows:
+            yield {"type": "summary", "user_id": r[0], "content": r[1], "tokens": r[2], "upto_id": r[3], "updated_at": r[4]}
+        last = rows[-1][0]
+    last = 0
+    while rows := conn.execute(_EXPORT_MESSAGES_SQL, (last, page)).fetchall():
+        for r in rows:
+            yield {
+                "type": "message", "id": r[0], "user_id": r[1], "role": r[2],
+                "content": decode_content(r[3]), "created_at": r[4], "tokens": r[5],
+            }
+        last = rows[-1][0]
+
+
+def _epoch(value: Any) -> int:
+    """created_at of an export: unix seconds, or ISO text from databases of the old format."""
+    if isinstance(value, str) and not value.isdigit():
+        return int(datetime.fromisoformat(value).timestamp())
+    return int(value) if value is not None else _now()
+
+
+def _import_messages(conn, rows: list[dict[str, Any]], folded: dict[int, int], upto: dict[int, int]) -> None:
+    """
+    One transaction: insert rows (new ids, file order), note the new id of the last row each
+    summary had folded, trim the users to KEEP_ROWS.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        base = conn.execute(_LAST_ID_SQL).fetchone()[0]
+        conn.executemany(
+            _INSERT_SQL,
+            ((r["user_id"], r["role"], encode_content(r["content"]), _epoch(r.get("created_at")), r.get("tokens"))
+             for r in rows),
+        )
+        if conn.execute(_LAST_ID_SQL).fetchone()[0] != base + len(rows):
+            raise RuntimeError("messages ids are not consecutive, import aborted")
+        for i, r in enumerate(rows):
+            r["id"], old_id = base + 1 + i, r.get("id")
+            if old_id is not None and old_id <= folded.get(r["user_id"], 0):
+                upto[r["user_id"]] = r["id"]
+        for user_id in {r["user_id"] for r in rows}:
+            _trim(conn, user_id)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if recall_index is not None:
+        by_user: dict[int, list[dict[str, Any]]] = {}
+        for r in rows:
+            by_user.setdefault(r["user_id"], []).append(r)
+        for user_id, messages in by_user.items():
+            _index_messages(user_id, messages)
+
+
+def _import_summaries(conn, summaries: list[dict[str, Any]]) -> None:
+    # upto_id is set once the folded rows have their new ids
+    with conn:
+        conn.executemany(
+            _UPSERT_SUMMARY_SQL,
+            ((r["user_id"], r["content"], r["tokens"], 0, _epoch(r.get("updated_at"))) for r in summaries),
+        )
+
+
+def import_records(records: Iterable[dict[str, Any]], chunk: int = 50000) -> dict[str, int]:
+    """
+    Load export_records() output: messages get new ids (appended after existing rows) in
+    transactions of `chunk` rows, users are trimmed to KEEP_ROWS as on normal writes; summaries
+    replace the users' current ones, their upto_id mapped to the new ids. For a live DB the bot's
+    caches do not see the rows until its users' windows are reloaded. Returns counts.
+    """
+    conn = get_connection()
+    folded: dict[int, int] = {}  # user -> upto_id of the imported summary (old ids)
+    upto: dict[int, int] = {}  # user -> the same row's new id
+    counts = {"messages": 0, "summaries": 0}
+    summaries: list[dict[str, Any]] = []
+    rows: list[dict[str, Any]] = []
+    for record in records:
+        if record.get("type") == "summary":
+            summaries.append(record)
+            folded[record["user_id"]] = record["upto_id"]
+            if len(summaries) >= chunk:
+                _import_summaries(conn, summaries)
+                counts["summaries"] += len(summaries)
+                summaries = []
+            continue
+        rows.append(record)
+        if len(rows) >= chunk:
+            _import_messages(conn, rows, folded, upto)
+            counts["messages"] += len(rows)
+            rows = []
+    if summaries:
+        _import_summaries(conn, summaries)
+        counts["summaries"] += len(summaries)
+    if rows:
+        _import_messages(conn, rows, folded, upto)
+        counts["messages"] += len(rows)
+    with conn:
+        conn.executemany(_SET_SUMMARY_UPTO_SQL, ((new_id, user_id) for user_id, new_id in upto.items()))
+    return counts
@@ -0,0 +1,193 @@
+"""Async facade over the history backend: reads on a small thread pool, writes via one group-committing writer thread."""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from common import memory_repo
+from common.config import MEMORY_READER_THREADS, MEMORY_WRITE_BATCH
+from common.memory_backends import MemoryBackend, memory_backend
+
+logger = logging.getLogger(__name__)
+
+# Sentinel that stops the writer thread after pending writes are flushed
+_STOP = object()
+
+
+class MemoryStore:
+    """
+    Same operations as memory_repo, awaitable from aiogram handlers without blocking the loop.
+    Cached windows are returned directly; cache misses go to the reader pool.
+    Writes queue to a single writer thread that commits everything pending in one batch.
+    History goes through backend; summaries, recall and maintenance need backend.extras (SQLite).
+    """
+
+    def __init__(
+        self,
+        readers: int = MEMORY_READER_THREADS,
+        batch_size: int = MEMORY_WRITE_BATCH,
+        backend: MemoryBackend = memory_backend,
+    ):
+        self.backend = backend
+        self.readers = readers
+        self.batch_size = batch_size
+        self._reader_pool: ThreadPoolExecutor | None = None
+        self._writer: threading.Thread | None = None
+        self._queue: queue.Queue = queue.Queue()
+
+    @property
+    def started(self) -> bool:
+        return self._writer is not None
+
+    def start(self) -> None:
+        """Start reader pool and writer thread. Call once after backend.open()."""
+        if self.started:
+            return
+        self._reader_pool = ThreadPoolExecutor(self.readers, thread_name_prefix="memory-reader")
+        self._writer = threading.Thread(target=self._writer_loop, name="memory-writer", daemon=True)
+        self._writer.start()
+
+    async def stop(self) -> None:
+        """Flush pending writes and stop threads. Call on bot shutdown."""
+        if not self.started:
+            return
+        self._queue.put(_STOP)
+        await asyncio.to_thread(self._writer.join)
+        self._writer = None
+        self._reader_pool.shutdown(wait=True)
+        self._reader_pool = None
+
+    async def get_context(self, user_id: int) -> list[dict[str, Any]]:
+        """Last 2*N messages for user, chronological (see memory_repo.get_context)."""
+        cached = self.backend.cached_context(user_id)
+        if cached is not None:
+            return cached
+        self._check_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, self.backend.load_context, user_id)
+
+    async def get_summary(self, user_id: int) -> dict[str, Any] | None:
+        """Summary of the user's older turns (see memory_repo.get_summary); None without extras."""
+        if not self.backend.extras:
+            return None
+        found, summary = memory_repo.summary_cache.lookup(user_id)
+        if found:
+            return summary
+        self._check_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, memory_repo.load_summary, user_id)
+
+    async def compaction_candidates(self, user_id: int) -> tuple[dict[str, Any] | None, list[tuple[int, str, str]]]:
+        self._check_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, memory_repo.compaction_candidates, user_id)
+
+    async def recall(self, user_id: int, text: str, before_id: int | None = None) -> list[list[dict[str, Any]]]:
+        """Past turns similar to text (see memory_repo.recall); empty when recall is off."""
+        if memory_repo.recall_index is None or not self.backend.extras:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, memory_repo.recall, user_id, text, before_id)
+
+    async def compact(self, user_id: int, content: str, upto_id: int) -> None:
+        await self._write("compact", (user_id, content, upto_id))
+
+    async def record_turn(self, user_id: int, user_text: str, assistant_text: str) -> None:
+        await self._write("record_turn", (user_id, user_text, assistant_text))
+
+    async def add_message(self, user_id: int, role: str, content: str) -> None:
+        await self._write("add_message", (user_id, role, content))
+
+    async def clear_user(self, user_id: int) -> None:
+        await self._write("clear_user", (user_id,))
+
+    async def trim_user(self, user_id: int) -> None:
+        await self._write("trim_user", (user_id,))
+
+    async def inactive_users(self, cutoff: int, limit: int) -> list[int]:
+        self._check_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, memory_repo.inactive_users, cutoff, limit)
+
+    async def expire_users(self, user_ids: list[int], cutoff: int) -> None:
+        await self._write("expire_users", (user_ids, cutoff))
+
+    async def freelist_pages(self) -> int:
+        self._check_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, memory_repo.freelist_pages)
+
+    async def incremental_vacuum_enabled(self) -> bool:
+        self._check_started()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, memory_repo.incremental_vacuum_enabled)
+
+    async def incremental_vacuum(self, pages: int) -> None:
+        await self._write("incremental_vacuum", (pages,))
+
+    def _check_started(self) -> None:
+        if not self.started:
+            raise RuntimeError("MemoryStore не запущен: вызовите start() после открытия хранилища")
+
+    async def _write(self, op: str, args: tuple) -> None:
+        self._check_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((op, args, future, loop))
+        await future
+
+    def _writer_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch: list) -> None:
+        try:
+            self.backend.write_batch([(op, args) for op, args, _, _ in batch])
+            for _, _, future, loop in batch:
+                loop.call_soon_threadsafe(_resolve, future, None)
+            return
+        except Exception as e:
+            if len(batch) == 1 or not self.backend.atomic_batches:
+                # Without atomic batches the failed group may be partly applied: replaying it
+                # could write the same turn twice, so every operation in it fails
+                if len(batch) == 1:
+                    logger.error("Ошибка при записи в БД: %s", e)
+                else:
+                    logger.error("Ошибка групповой записи в хранилище %s, без повтора: %s", self.backend.name, e)
+                for _, _, future, loop in batch:
+                    loop.call_soon_threadsafe(_resolve, future, e)
+                return
+            logger.error("Ошибка групповой записи в БД, повтор по одной операции: %s", e)
+        # Nothing was applied; one bad operation must not fail the whole group: retry each on its own
+        for item in batch:
+            self._commit([item])
+
+
+def _resolve(future: asyncio.Future, error: Exception | None) -> None:
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+
+# Process-wide store used by bot_mem handlers; started/stopped in bot_mem/main.py
+memory_store = MemoryStore()
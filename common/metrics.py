@@ -0,0 +1,247 @@
+"""In-process metrics (counters, histograms, scrape-time gauges) in the Prometheus text format."""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+from common.config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+if TYPE_CHECKING:
+    from aiogram.types import TelegramObject
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers SQLite ops (sub-ms) up to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._by_values: dict[tuple, object] = {}  # raw label values -> child, skips str() on lookup
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        """Child for these label values; bind it once and reuse it on hot paths."""
+        child = self._by_values.get(values)
+        if child is None:
+            key = tuple(str(v) for v in values)
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+                self._by_values[values] = child
+        return child
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: tuple[str, ...], child) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _render_child(self, key, child: _CounterChild) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {child.value:g}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, key, child: _HistogramChild) -> list[str]:
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip((*self.buckets, float("inf")), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            bucket_labels = _labels(self.labelnames, key, 'le="' + le + '"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        labels = _labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total:g}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics plus stats() callbacks of other components, exposed as gauges at scrape time."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._stats: dict[str, Callable[[], dict[str, float]]] = {}
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_stats(self, prefix: str, stats: Callable[[], dict[str, float]]) -> None:
+        """Expose stats() as gauges named <prefix>_<key> (costs nothing until scraped)."""
+        self._stats[prefix] = stats
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for prefix, stats in self._stats.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.error("Ошибка сбора метрик %s: %s", prefix, e)
+                continue
+            for key, value in values.items():
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Shared instruments (label values are bounded: models, outcomes, op and bot names)
+openai_request_seconds = registry.histogram(
+    "openai_request_seconds", "OpenAI call time seen by the bot (queue wait and retries included)", ("model", "outcome")
+)
+openai_tokens_total = registry.counter("openai_tokens_total", "Tokens reported in completion usage", ("model", "kind"))
+db_op_seconds = registry.histogram("db_op_seconds", "SQLite operation latency", ("op",))
+handler_seconds = registry.histogram("handler_seconds", "Telegram update handling time", ("bot",))
+turn_seconds = registry.histogram("turn_seconds", "bot_mem turn time: history, model reply, save", ())
+
+
+class HandlerTiming:
+    """
+    Outer update middleware: observes handler_seconds{bot=...} for every update.
+    Not a BaseMiddleware subclass, so storage code importing metrics does not load aiogram.
+    """
+
+    def __init__(self, bot: str) -> None:
+        self._histogram = handler_seconds.labels(bot)
+
+    async def __call__(
+        self,
+        handler: Callable[["TelegramObject", dict[str, Any]], Awaitable[Any]],
+        event: "TelegramObject",
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self._histogram.observe(time.perf_counter() - started)
+
+
+async def _handle_metrics(_: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+_runner: "web.AppRunner | None" = None
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+    """Serve GET /metrics when METRICS_ENABLED; idempotent (several bots in one process share it)."""
+    global _runner
+    if not METRICS_ENABLED or _runner is not None:
+        return
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+
+
+async def stop_metrics_server() -> None:
+    global _runner
+    runner, _runner = _runner, None
+    if runner is not None:
+        await runner.cleanup()
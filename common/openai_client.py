@@ -1,32 +1,249 @@
-"""OpenAI client wrapper: one model, timeouts and errors handled, minimal tokens."""
+"""
+OpenAI client wrapper: routed models, timeouts and errors handled, minimal tokens.
+The SDK (a large import) is loaded with the first client, not with this module.
+"""
+import importlib.util
 import logging
+import threading
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, TypeVar
 
-from openai import OpenAI
-from openai import APITimeoutError, APIConnectionError, APIStatusError
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
-from common.config import OPENAI_API_KEY, OPENAI_MODEL
+from common.config import (
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_HTTP2,
+)
+from common.admission import Overloaded, admission
+from common.context_builder import build_messages
+from common.metrics import openai_request_seconds, openai_tokens_total, registry
+from common.resilience import CircuitOpen, upstream
+from common.routing import router
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 # Default timeout in seconds
 DEFAULT_TIMEOUT = 60.0
-# Max chars per message content before sending to OpenAI (minimize tokens)
-MAX_CHARS = 4000
 
 # Single short system prompt for both bots
 SYSTEM_PROMPT = "You are a helpful assistant. Reply concisely."
 
+# Reply when the request is shed by admission control instead of waiting for the upstream
+BUSY_REPLY = "Сейчас слишком много запросов. Попробуйте через минуту."
+
+# Reply while the circuit breaker is open (upstream unhealthy, call not attempted)
+UNAVAILABLE_REPLY = "Сервис временно недоступен. Попробуйте через минуту."
+
+registry.add_stats("openai_admission", admission.stats)
+registry.add_stats("openai_upstream", upstream.stats)
+
+# Process-wide clients: created on first use, reused by all handlers, closed by close_clients()
+_client: "OpenAI | None" = None
+_async_client: "AsyncOpenAI | None" = None
+# Held while a client is built: startup builds it in a thread, a first request may race it
+_client_lock = threading.Lock()
+
+
+def _http_options() -> dict:
+    """Connection pool settings shared by sync and async HTTP clients."""
+    import httpx
 
-def _truncate(text: str, max_len: int = MAX_CHARS) -> str:
-    """Trim message content to max_len; suffix if truncated."""
-    if len(text) <= max_len:
-        return text
-    return text[: max_len - 20].rstrip() + "\n… (обрезано)"
+    http2 = OPENAI_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("OPENAI_HTTP2 включён, но пакет h2 не установлен — используется HTTP/1.1")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+    return {"limits": limits, "http2": http2}
 
 
-def get_client() -> OpenAI:
-    """Return configured OpenAI client."""
-    return OpenAI(api_key=OPENAI_API_KEY or None)
+def get_client() -> "OpenAI":
+    """Return the process-wide OpenAI client (created lazily, keeps its connection pool)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import DefaultHttpxClient, OpenAI
+
+                _client = OpenAI(
+                    api_key=OPENAI_API_KEY or None,
+                    max_retries=0,  # retries are done by common.resilience
+                    http_client=DefaultHttpxClient(**_http_options()),
+                )
+    return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Return the process-wide AsyncOpenAI client (created lazily, keeps its connection pool)."""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+                _async_client = AsyncOpenAI(
+                    api_key=OPENAI_API_KEY or None,
+                    max_retries=0,  # retries are done by common.resilience
+                    http_client=DefaultAsyncHttpxClient(**_http_options()),
+                )
+    return _async_client
+
+
+def prepare_clients() -> None:
+    """
+    Import the SDK and build the async client ahead of the first request. Blocking: bots run it
+    in a thread at startup while polling connects. A failure only defers the work to that request.
+    """
+    try:
+        get_async_client()
+    except Exception as e:
+        logger.warning("Клиент OpenAI не подготовлен при старте (будет создан при первом запросе): %s", e)
+
+
+async def close_clients() -> None:
+    """Close shared clients and their connection pools. Call on bot shutdown."""
+    global _client, _async_client
+    # Under the lock: a client still being built at startup is closed too, not leaked
+    with _client_lock:
+        client, _client = _client, None
+        async_client, _async_client = _async_client, None
+    if async_client is not None:
+        await async_client.close()
+    if client is not None:
+        client.close()
+
+
+# Model that produced the last successful completion (or opened the stream) in this context:
+# callers see which route answered, e.g. to cache only answers of the model they keyed by
+answered_by: ContextVar[str | None] = ContextVar("answered_by", default=None)
+
+
+class _Routing:
+    """
+    Model choice for one request (see common.routing): each call goes to the next candidate
+    while breakers are open. `model` is the model the call went to, for metrics.
+    """
+
+    def __init__(self, messages: list[dict[str, str]], model: str | None):
+        self.model = model or router.default_model
+        self._candidates = router.candidates(messages, model)
+
+    async def acall(self, make_call: Callable[[str], Awaitable[T]], hedge: bool | None = None) -> T:
+        error: CircuitOpen | None = None
+        for name, reason in self._candidates:
+            self.model = name
+            try:
+                result = await router.upstream(name).acall(lambda: make_call(name), hedge=hedge)
+            except CircuitOpen as e:
+                error = e
+                continue
+            except Exception:
+                router.record(name, reason)
+                raise
+            router.record(name, reason)
+            answered_by.set(name)
+            return result
+        raise error
+
+    def call(self, make_call: Callable[[str], T]) -> T:
+        error: CircuitOpen | None = None
+        for name, reason in self._candidates:
+            self.model = name
+            try:
+                result = router.upstream(name).call(lambda: make_call(name))
+            except CircuitOpen as e:
+                error = e
+                continue
+            except Exception:
+                router.record(name, reason)
+                raise
+            router.record(name, reason)
+            answered_by.set(name)
+            return result
+        raise error
+
+
+class CompletionError(Exception):
+    """Upstream failure while streaming; user_message is safe to show to the user."""
+
+    def __init__(self, user_message: str):
+        super().__init__(user_message)
+        self.user_message = user_message
+
+
+def _response_text(response) -> str:
+    """Extract assistant text from a chat completion response."""
+    text = (
+        response.choices[0].message.content
+        if response.choices and response.choices[0].message
+        else ""
+    )
+    return (text or "").strip() or "Нет ответа от модели."
+
+
+def _outcome(e: Exception | None) -> str:
+    """Metrics label for how a call ended."""
+    if e is None:
+        return "ok"
+    if isinstance(e, Overloaded):
+        return "overloaded"
+    if isinstance(e, CircuitOpen):
+        return "circuit_open"
+    # Loaded already: an SDK error means a client exists
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if isinstance(e, APITimeoutError):
+        return "timeout"
+    if isinstance(e, APIConnectionError):
+        return "connection"
+    if isinstance(e, APIStatusError):
+        return f"status_{e.status_code}"
+    return "error"
+
+
+def _observe(model: str, started: float, error: Exception | None) -> None:
+    openai_request_seconds.labels(model, _outcome(error)).observe(time.perf_counter() - started)
+
+
+def _record_usage(model: str, usage) -> None:
+    """Count prompt/completion tokens from the response `usage` field (absent on some backends)."""
+    if usage is None:
+        return
+    openai_tokens_total.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+    openai_tokens_total.labels(model, "completion").inc(usage.completion_tokens or 0)
+
+
+def _error_reply(e: Exception) -> str:
+    """Log an OpenAI error and return a user-friendly message for it."""
+    if isinstance(e, Overloaded):
+        return BUSY_REPLY
+    if isinstance(e, CircuitOpen):
+        logger.warning("OpenAI недоступен (circuit breaker открыт), запрос не отправлен")
+        return UNAVAILABLE_REPLY
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if isinstance(e, APITimeoutError):
+        logger.error("OpenAI timeout: %s", e)
+        return "Сервис ответил слишком долго. Попробуйте позже."
+    if isinstance(e, APIConnectionError):
+        logger.error("OpenAI connection error: %s", e)
+        return "Ошибка соединения с сервисом. Проверьте интернет и попробуйте снова."
+    if isinstance(e, APIStatusError):
+        logger.error("OpenAI API error (status): %s", e)
+        return "Временная ошибка сервиса. Попробуйте позже."
+    logger.exception("OpenAI unexpected error: %s", e)
+    return "Произошла ошибка при запросе. Попробуйте позже."
 
 
 def chat_completion(
@@ -37,80 +254,114 @@ def chat_completion(
 ) -> tuple[bool, str]:
     """
     Send user message to OpenAI and return (success, text).
+    Transient errors are retried with backoff (see common.resilience).
     On error: (False, user-friendly message); errors are logged.
     """
-    prompt = system_prompt or SYSTEM_PROMPT
-    content = _truncate(user_message)
+    messages = build_messages(system_prompt or SYSTEM_PROMPT, [], user_message, model=model)
+    return chat_completion_with_messages(messages, model=model, timeout=timeout)
+
+
+def chat_completion_with_messages(
+    messages: list[dict[str, str]],
+    model: str | None = None,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> tuple[bool, str]:
+    """
+    Send pre-built messages (e.g. system + history + user) to OpenAI.
+    messages: list of {"role": "system"|"user"|"assistant", "content": "..."}, already fitted to
+    the token budget (see common.context_builder). Returns (success, assistant_reply_or_error_message).
+    """
     client = get_client()
-    model = model or OPENAI_MODEL or "gpt-4"
+    routing = _Routing(messages, model)
+    started, error = time.perf_counter(), None
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": content},
-            ],
-            timeout=timeout,
-        )
-        text = (
-            response.choices[0].message.content
-            if response.choices and response.choices[0].message
-            else ""
+        response = routing.call(
+            lambda name: client.chat.completions.create(model=name, messages=messages, timeout=timeout)
         )
-        return True, text.strip() or "Нет ответа от модели."
-    except APITimeoutError as e:
-        logger.error("OpenAI timeout: %s", e)
-        return False, "Сервис ответил слишком долго. Попробуйте позже."
-    except APIConnectionError as e:
-        logger.error("OpenAI connection error: %s", e)
-        return False, "Ошибка соединения с сервисом. Проверьте интернет и попробуйте снова."
-    except APIStatusError as e:
-        logger.error("OpenAI API error (status): %s", e)
-        return False, "Временная ошибка сервиса. Попробуйте позже."
+        _record_usage(routing.model, response.usage)
+        return True, _response_text(response)
     except Exception as e:
-        logger.exception("OpenAI unexpected error: %s", e)
-        return False, "Произошла ошибка при запросе. Попробуйте позже."
+        error = e
+        return False, _error_reply(e)
+    finally:
+        _observe(routing.model, started, error)
 
 
-def _truncate_messages(messages: list[dict[str, str]]) -> list[dict[str, str]]:
-    """Ensure each message content is at most MAX_CHARS (for API)."""
-    return [{"role": m["role"], "content": _truncate(m["content"])} for m in messages]
+async def achat_completion(
+    user_message: str,
+    system_prompt: str | None = None,
+    model: str | None = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    user_id: int = 0,
+) -> tuple[bool, str]:
+    """Async version of chat_completion: does not block the event loop."""
+    messages = build_messages(system_prompt or SYSTEM_PROMPT, [], user_message, model=model)
+    return await achat_completion_with_messages(messages, model=model, timeout=timeout, user_id=user_id)
 
 
-def chat_completion_with_messages(
+async def achat_completion_with_messages(
     messages: list[dict[str, str]],
     model: str | None = None,
     timeout: float = DEFAULT_TIMEOUT,
+    user_id: int = 0,
 ) -> tuple[bool, str]:
     """
-    Send pre-built messages (e.g. system + history + user) to OpenAI.
-    messages: list of {"role": "system"|"user"|"assistant", "content": "..."}
-    Content is truncated to MAX_CHARS per message. Returns (success, assistant_reply_or_error_message).
+    Async version of chat_completion_with_messages on the shared AsyncOpenAI client.
+    Goes through admission control: when overloaded returns (False, BUSY_REPLY) right away.
+    Transient errors are retried, slow calls may be hedged (see common.resilience).
     """
-    trimmed = _truncate_messages(messages)
-    client = get_client()
-    model = model or OPENAI_MODEL or "gpt-4"
+    client = get_async_client()
+    routing = _Routing(messages, model)
+    started, error = time.perf_counter(), None
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=trimmed,
-            timeout=timeout,
-        )
-        text = (
-            response.choices[0].message.content
-            if response.choices and response.choices[0].message
-            else ""
-        )
-        return True, text.strip() or "Нет ответа от модели."
-    except APITimeoutError as e:
-        logger.error("OpenAI timeout: %s", e)
-        return False, "Сервис ответил слишком долго. Попробуйте позже."
-    except APIConnectionError as e:
-        logger.error("OpenAI connection error: %s", e)
-        return False, "Ошибка соединения с сервисом. Проверьте интернет и попробуйте снова."
-    except APIStatusError as e:
-        logger.error("OpenAI API error (status): %s", e)
-        return False, "Временная ошибка сервиса. Попробуйте позже."
+        async with admission.slot(user_id):
+            response = await routing.acall(
+                lambda name: client.chat.completions.create(model=name, messages=messages, timeout=timeout)
+            )
+        _record_usage(routing.model, response.usage)
+        return True, _response_text(response)
+    except Exception as e:
+        error = e
+        return False, _error_reply(e)
+    finally:
+        _observe(routing.model, started, error)
+
+
+async def astream_chat_completion(
+    messages: list[dict[str, str]],
+    model: str | None = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    user_id: int = 0,
+) -> AsyncIterator[str]:
+    """
+    Stream assistant reply deltas for pre-built messages. Holds an admission slot while streaming.
+    On error raises CompletionError (logged, with a user-friendly message; BUSY_REPLY when shed).
+    """
+    client = get_async_client()
+    routing = _Routing(messages, model)
+    started, error = time.perf_counter(), None
+    try:
+        async with admission.slot(user_id):
+            # Only opening the stream is retried: once text was shown it cannot be taken back
+            stream = await routing.acall(
+                lambda name: client.chat.completions.create(
+                    model=name,
+                    messages=messages,
+                    timeout=timeout,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                hedge=False,
+            )
+            async with stream:
+                async for chunk in stream:
+                    # With include_usage the last chunk has no choices, only usage
+                    _record_usage(routing.model, getattr(chunk, "usage", None))
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
     except Exception as e:
-        logger.exception("OpenAI unexpected error: %s", e)
-        return False, "Произошла ошибка при запросе. Попробуйте позже."
+        error = e
+        raise CompletionError(_error_reply(e)) from e
+    finally:
+        _observe(routing.model, started, error)
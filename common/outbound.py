@@ -0,0 +1,288 @@
+"""Outbound Telegram calls: per-chat and global rate limits, RetryAfter handling, priorities."""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from common.config import (
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GROUP_RATE_PER_MIN,
+    TELEGRAM_MAX_RETRIES,
+)
+from common.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Priorities: lower goes first. Replies to what the user just sent beat bulk output (context dumps)
+INTERACTIVE = 0
+BULK = 1
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` saved up."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def give_back(self) -> None:
+        """Return a token taken for a call that never went out."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class _PriorityGate:
+    """Waiters are released by (priority, arrival): at most one holder (lock) or one per token (rate)."""
+
+    def __init__(self) -> None:
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return len({id(w[2]) for w in self._waiters if not w[2].done()})
+
+    def boost(self, future: asyncio.Future, priority: int) -> None:
+        """Move a waiter up to priority (the old entry is skipped once the future is done)."""
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+
+    async def _wait(self, priority: int, future: asyncio.Future | None = None) -> None:
+        future = future or asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled: the grant is unused, pass it on
+                self._hand_back()
+            else:
+                self._waiters = [w for w in self._waiters if w[2] is not future]
+                heapq.heapify(self._waiters)
+            raise
+
+    def _pop(self) -> asyncio.Future | None:
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                return future
+        return None
+
+    def _grant(self) -> None:
+        raise NotImplementedError
+
+    def _hand_back(self) -> None:
+        """Undo a grant whose waiter was cancelled before using it, then grant the next waiter."""
+        raise NotImplementedError
+
+
+class _ChatLane(_PriorityGate):
+    """
+    One call at a time per chat, so its messages go out in order; plus the chat's rate bucket.
+    While the holder waits for a global token, a more urgent waiter lends it its priority.
+    """
+
+    def __init__(self, bucket: TokenBucket):
+        super().__init__()
+        self.bucket = bucket
+        self.busy = False
+        self.blocked_until = 0.0
+        # Holder's wait in the global queue: (gate, future, priority)
+        self.global_wait: tuple["_GlobalRate", asyncio.Future, int] | None = None
+
+    async def acquire(self, priority: int) -> None:
+        if not self.busy and not self._waiters:
+            self.busy = True
+            return
+        if self.global_wait is not None and priority < self.global_wait[2]:
+            gate, future, _ = self.global_wait
+            gate.boost(future, priority)
+            self.global_wait = (gate, future, priority)
+        await self._wait(priority)
+
+    def release(self) -> None:
+        self.busy = False
+        self._grant()
+
+    def _grant(self) -> None:
+        future = self._pop()
+        if future is not None:
+            self.busy = True
+            future.set_result(None)
+
+    def _hand_back(self) -> None:
+        self.release()
+
+
+class _GlobalRate(_PriorityGate):
+    """Global token bucket; when tokens run out, waiters get them by priority as they refill."""
+
+    def __init__(self, bucket: TokenBucket):
+        super().__init__()
+        self.bucket = bucket
+        self._pump: asyncio.Task | None = None
+
+    async def acquire(self, priority: int, lane: _ChatLane) -> None:
+        if not self._waiters and self.bucket.delay() == 0:
+            self.bucket.take()
+            return
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._refill())
+        future = asyncio.get_running_loop().create_future()
+        lane.global_wait = (self, future, priority)
+        try:
+            await self._wait(priority, future)
+        finally:
+            lane.global_wait = None
+
+    async def _refill(self) -> None:
+        while self._waiters:
+            delay = self.bucket.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            self._grant()
+
+    def _grant(self) -> None:
+        future = self._pop()
+        if future is not None:
+            self.bucket.take()
+            future.set_result(None)
+
+    def _hand_back(self) -> None:
+        # The token was spent on a waiter that sends nothing: the next one gets it
+        self.bucket.give_back()
+        self._grant()
+
+
+class Outbound:
+    """
+    Every bot call that writes to a chat goes through call(): calls to one chat run one at a
+    time in priority-then-arrival order (so one kind of output never reorders), each takes a
+    token from the chat's bucket (TELEGRAM_CHAT_RATE/s, TELEGRAM_CHAT_BURST; groups
+    TELEGRAM_GROUP_RATE_PER_MIN/min) and from the global one (TELEGRAM_GLOBAL_RATE/s), and
+    TelegramRetryAfter pauses the chat for the time Telegram asked and retries.
+    """
+
+    # Idle chat lanes are swept when this many (or twice the survivors of the last sweep) exist
+    _SWEEP_MIN = 1024
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        chat_burst: int = TELEGRAM_CHAT_BURST,
+        group_rate_per_min: float = TELEGRAM_GROUP_RATE_PER_MIN,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_min / 60
+        self.max_retries = max_retries
+        self._global: _GlobalRate | None = None
+        self._lanes: dict[int, _ChatLane] = {}
+        self._sweep_at = self._SWEEP_MIN
+        self.sent = 0
+        self.retry_after = 0
+        self.failed = 0
+
+    async def call(
+        self, chat_id: int, method: Callable[[], Awaitable[T]], priority: int = INTERACTIVE, retry: bool = True
+    ) -> T:
+        """
+        Run method() (a bot call to chat_id) within the limits. With retry=False a RetryAfter
+        is raised at once (still pausing the chat): for updates that a later call supersedes.
+        """
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            if len(self._lanes) >= self._sweep_at:
+                self._sweep()
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            lane = self._lanes[chat_id] = _ChatLane(TokenBucket(rate, self.chat_burst))
+        if self._global is None:
+            # No saved-up burst: limits are per second, so any burst would exceed them
+            self._global = _GlobalRate(TokenBucket(self.global_rate, 1))
+        await lane.acquire(priority)
+        try:
+            attempt = 0
+            while True:
+                await asyncio.sleep(max(lane.blocked_until - time.monotonic(), lane.bucket.delay()))
+                if lane.bucket.delay():
+                    continue
+                lane.bucket.take()
+                try:
+                    await self._global.acquire(priority, lane)
+                except asyncio.CancelledError:
+                    lane.bucket.give_back()
+                    raise
+                try:
+                    result = await method()
+                    self.sent += 1
+                    return result
+                except TelegramRetryAfter as e:
+                    self.retry_after += 1
+                    lane.blocked_until = time.monotonic() + e.retry_after
+                    if not retry or attempt >= self.max_retries:
+                        self.failed += 1
+                        raise
+                    attempt += 1
+                    logger.warning("Telegram flood limit chat_id=%s, повтор через %s с", chat_id, e.retry_after)
+        finally:
+            lane.release()
+
+    async def answer(self, message: Message, text: str, priority: int = INTERACTIVE, **kwargs) -> Message:
+        """message.answer(text) through the limits."""
+        return await self.call(message.chat.id, lambda: message.answer(text, **kwargs), priority)
+
+    async def answer_chunks(self, message: Message, chunks: list[str], priority: int = BULK) -> list[Message]:
+        """Send chunks in order; interactive replies to the same chat may go in between."""
+        return [await self.answer(message, chunk, priority) for chunk in chunks]
+
+    async def edit(self, message: Message, text: str, priority: int = INTERACTIVE, retry: bool = True) -> Message:
+        """message.edit_text(text) through the limits."""
+        return await self.call(message.chat.id, lambda: message.edit_text(text), priority, retry)
+
+    def _sweep(self) -> None:
+        # Idle lanes with a full bucket behave exactly like new ones: drop them
+        now = time.monotonic()
+        for chat_id, lane in list(self._lanes.items()):
+            lane.bucket.delay()
+            if not lane.busy and lane.blocked_until <= now and lane.bucket.tokens >= lane.bucket.burst:
+                del self._lanes[chat_id]
+        self._sweep_at = max(self._SWEEP_MIN, 2 * len(self._lanes))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "sent": self.sent,
+            "retry_after": self.retry_after,
+            "failed": self.failed,
+            "chats_active": len(self._lanes),
+            "waiting_chat": sum(lane.waiting for lane in self._lanes.values()),
+            "waiting_global": self._global.waiting if self._global else 0,
+        }
+
+
+# Process-wide limiter for both bots' outgoing messages
+outbound = Outbound()
+registry.add_stats("telegram_outbound", outbound.stats)
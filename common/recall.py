@@ -0,0 +1,179 @@
+"""Semantic recall for bot_mem: per-user NumPy vector index of message embeddings, persisted under DATA_DIR."""
+import importlib
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+
+from common.config import DATA_DIR, RECALL_CACHE_USERS, RECALL_DIM, RECALL_EMBEDDER, RECALL_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# numpy is only loaded when recall is on (it is a noticeable part of startup otherwise)
+np = None
+if RECALL_ENABLED:
+    try:
+        import numpy as np
+    except ImportError:  # optional dependency: recall is disabled without it
+        pass
+
+RECALL_DIR = DATA_DIR / "recall"
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# embed(texts) -> float array of shape (len(texts), RECALL_DIM)
+Embedder = Callable[[list[str]], "np.ndarray"]
+
+
+def recall_available() -> bool:
+    """RECALL_ENABLED and numpy importable (logged once by the caller when not)."""
+    return RECALL_ENABLED and np is not None
+
+
+def hashing_embed(texts: list[str], dim: int = RECALL_DIM) -> "np.ndarray":
+    """
+    Local embedder: signed feature hashing of lower-cased words and word bigrams, L2-normalized.
+    crc32 is stable across processes, so persisted vectors stay comparable after restarts.
+    """
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD_RE.findall(text.lower())
+        features = words + [a + " " + b for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(out[row], hashes % dim, signs)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    np.divide(out, norms, out=out, where=norms > 0)
+    return out
+
+
+def load_embedder(spec: str = RECALL_EMBEDDER) -> Embedder:
+    """"package.module:function" from RECALL_EMBEDDER, or hashing_embed when empty."""
+    if not spec:
+        return hashing_embed
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+class _UserVectors:
+    """One user's vectors (float32, unit length) and message ids, with spare capacity for appends."""
+
+    __slots__ = ("vectors", "ids", "size", "lock")
+
+    def __init__(self, vectors: "np.ndarray", ids: "np.ndarray"):
+        self.vectors = vectors
+        self.ids = ids
+        self.size = len(ids)
+        self.lock = threading.Lock()
+
+    def append(self, vectors: "np.ndarray", ids: "np.ndarray") -> None:
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids), 64)
+            grown_vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_vectors[: self.size] = self.vectors[: self.size]
+            grown_ids[: self.size] = self.ids[: self.size]
+            self.vectors, self.ids = grown_vectors, grown_ids
+        self.vectors[self.size:needed] = vectors
+        self.ids[self.size:needed] = ids
+        self.size = needed
+
+
+class RecallIndex:
+    """
+    Per-user vector index. On disk: <dir>/<user_id>.vec (raw float16 rows, half the size) and
+    <user_id>.ids (raw int64 message ids), appended on every write. In memory: LRU of loaded
+    users as float32, so a search is one matrix-vector product without conversion.
+    Thread-safe: writes come from the memory writer thread, searches from reader threads.
+    """
+
+    def __init__(self, path: Path = RECALL_DIR, dim: int = RECALL_DIM, max_users: int = RECALL_CACHE_USERS,
+                 embed: Embedder | None = None):
+        self.path = path
+        self.dim = dim
+        self.max_users = max_users
+        self._embed = embed
+        self._users: OrderedDict[int, _UserVectors] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, texts: list[str]) -> "np.ndarray":
+        if self._embed is None:
+            self._embed = load_embedder()
+        vectors = np.asarray(self._embed(texts), dtype=np.float32)
+        if vectors.shape != (len(texts), self.dim):
+            raise ValueError(f"embedder returned shape {vectors.shape}, expected ({len(texts)}, {self.dim})")
+        return vectors
+
+    def add(self, user_id: int, ids: list[int], texts: list[str]) -> None:
+        """Embed texts of newly stored messages and append them to the user's index."""
+        vectors = self.embed(texts)
+        id_array = np.asarray(ids, dtype=np.int64)
+        entry = self._get(user_id)
+        with entry.lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self._file(user_id, "vec"), "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            with open(self._file(user_id, "ids"), "ab") as f:
+                f.write(id_array.tobytes())
+            entry.append(vectors, id_array)
+
+    def search(self, user_id: int, text: str, k: int, before_id: int | None = None) -> list[tuple[int, float]]:
+        """Top-k (message_id, cosine score) for text, best first; only ids < before_id when given."""
+        entry = self._get(user_id)
+        query = self.embed([text])[0]
+        with entry.lock:
+            size, vectors, ids = entry.size, entry.vectors, entry.ids
+        if size == 0 or k <= 0:
+            return []
+        scores = vectors[:size] @ query
+        if before_id is not None:
+            scores[ids[:size] >= before_id] = -np.inf
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def drop(self, user_id: int) -> None:
+        """Forget the user's index (history was cleared)."""
+        with self._lock:
+            self._users.pop(user_id, None)
+            for kind in ("vec", "ids"):
+                self._file(user_id, kind).unlink(missing_ok=True)
+
+    def size(self, user_id: int) -> int:
+        return self._get(user_id).size
+
+    def _file(self, user_id: int, kind: str) -> Path:
+        return self.path / f"{user_id}.{kind}"
+
+    def _get(self, user_id: int) -> _UserVectors:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = self._load(user_id)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            return entry
+
+    def _load(self, user_id: int) -> _UserVectors:
+        vec_file, ids_file = self._file(user_id, "vec"), self._file(user_id, "ids")
+        if not vec_file.exists() or not ids_file.exists():
+            return _UserVectors(np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64))
+        vectors = np.fromfile(vec_file, dtype=np.float16)
+        ids = np.fromfile(ids_file, dtype=np.int64)
+        # A crash between the two appends leaves one file longer: keep the common prefix
+        rows = min(len(vectors) // self.dim, len(ids))
+        return _UserVectors(vectors[: rows * self.dim].reshape(rows, self.dim).astype(np.float32), ids[:rows].copy())
+
+
+# Process-wide index used by memory_repo when recall is on (RECALL_ENABLED and numpy installed)
+recall_index = RecallIndex() if recall_available() else None
+if RECALL_ENABLED and np is None:
+    logger.warning("RECALL_ENABLED включён, но numpy не установлен — поиск по истории отключён")
@@ -0,0 +1,97 @@
+"""Minimal blocking client for the Redis protocol (RESP2): commands and pipelines, no dependency."""
+import socket
+import ssl
+from typing import Any
+from urllib.parse import unquote, urlsplit
+
+
+class RedisError(Exception):
+    """Error reply from the server; the connection stays usable."""
+
+
+def _encode(command: tuple) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _read_reply(reader) -> Any:
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("соединение с Redis закрыто")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RedisError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        if size < 0:
+            return None
+        data = reader.read(size + 2)
+        if len(data) != size + 2:
+            raise ConnectionError("соединение с Redis закрыто")
+        return data[:-2]
+    if kind == b"*":
+        size = int(body)
+        return None if size < 0 else [_read_reply(reader) for _ in range(size)]
+    raise ConnectionError(f"неожиданный ответ Redis: {line[:32]!r}")
+
+
+class RedisConnection:
+    """
+    One connection to redis://[user:password@]host[:port][/db] (rediss:// for TLS).
+    Bulk replies come back as bytes. After a socket error or timeout the reply stream is out of
+    sync: close the connection and open a new one.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        if parts.scheme not in ("redis", "rediss"):
+            raise ValueError(f"REDIS_URL: неподдерживаемая схема {parts.scheme!r}")
+        sock = socket.create_connection((parts.hostname or "127.0.0.1", parts.port or 6379), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if parts.scheme == "rediss":
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        setup = []
+        if parts.password:
+            password = unquote(parts.password)
+            setup.append(("AUTH", unquote(parts.username), password) if parts.username else ("AUTH", password))
+        db = parts.path.strip("/")
+        if db and db != "0":
+            setup.append(("SELECT", db))
+        if setup:
+            self.pipeline(setup)
+
+    def execute(self, *command) -> Any:
+        return self.pipeline([command])[0]
+
+    def pipeline(self, commands: list[tuple]) -> list[Any]:
+        """
+        Send all commands in one write and read all replies (one round trip). Raises the first
+        error reply, also one inside an EXEC result, after every reply was read (the connection
+        stays in sync). Inside EXEC the other commands have run regardless: Redis does not roll back.
+        """
+        self._sock.sendall(b"".join(_encode(c) for c in commands))
+        replies = [_read_reply(self._reader) for _ in commands]
+        for reply in replies:
+            for item in reply if isinstance(reply, list) else (reply,):
+                if isinstance(item, RedisError):
+                    raise item
+        return replies
+
+    def close(self) -> None:
+        try:
+            self._reader.close()
+            self._sock.close()
+        except OSError:
+            pass
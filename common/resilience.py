@@ -0,0 +1,289 @@
+"""Resilience for upstream calls: retry with jittered backoff, circuit breaker, hedged requests."""
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from common.config import (
+    OPENAI_BREAKER_FAILURES,
+    OPENAI_BREAKER_RESET,
+    OPENAI_HEDGE_ENABLED,
+    OPENAI_HEDGE_MIN_SAMPLES,
+    OPENAI_HEDGE_PERCENTILE,
+    OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE_DELAY,
+    OPENAI_RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth retrying: rate limit, request timeout, lock conflict, server errors
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class CircuitOpen(Exception):
+    """Upstream is considered unhealthy: the call was not attempted."""
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Transient upstream failure (also counts against the circuit breaker)."""
+    openai = sys.modules.get("openai")
+    if openai is None:
+        # SDK not loaded yet (it is imported with the first client): e cannot be one of its errors
+        return False
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code in RETRYABLE_STATUSES
+
+
+def retry_after(e: BaseException) -> float | None:
+    """Seconds the upstream asked us to wait (retry-after-ms / Retry-After headers), if any."""
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # HTTP-date form is not used by OpenAI; fall back to backoff
+    return None
+
+
+def backoff_delay(attempt: int, base: float = OPENAI_RETRY_BASE_DELAY, cap: float = OPENAI_RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Closed: calls pass, consecutive transient failures are counted. After failure_threshold
+    of them the breaker opens and calls fail fast with CircuitOpen for reset_timeout seconds.
+    Then one probe call is let through (half-open): success closes the breaker, failure reopens it,
+    and a cancelled probe (hedge loser, shutdown) lets the next call probe instead.
+    """
+
+    def __init__(
+        self,
+        name: str = "openai",
+        failure_threshold: int = OPENAI_BREAKER_FAILURES,
+        reset_timeout: float = OPENAI_BREAKER_RESET,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Raise CircuitOpen unless a call may go upstream now; True if the call is the half-open probe."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        raise CircuitOpen(self.name)
+
+    def release_probe(self) -> None:
+        """The probe ended without an outcome (cancelled): stay half-open for the next call."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Circuit breaker %s закрыт", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning("Circuit breaker %s открыт после %s ошибок", self.name, self.failures)
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def record(self, e: BaseException | None) -> None:
+        """Update state from an attempt outcome; only transient errors count as failures."""
+        if e is None:
+            self.record_success()
+        elif is_retryable(e):
+            self.record_failure()
+        elif self._probing:
+            # Non-transient error (e.g. 400) still proves the upstream answers
+            self.record_success()
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies; percentile() is the hedging threshold (and routing's p95)."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = OPENAI_HEDGE_MIN_SAMPLES) -> float | None:
+        """q-th latency of the window, or None with fewer than min_samples samples."""
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float | None) -> T:
+    """
+    Run call(); if it has not finished after `delay` seconds, start a second call()
+    and return whichever succeeds first (the other is cancelled). delay=None disables hedging.
+    """
+    first = asyncio.ensure_future(call())
+    if delay is None:
+        return await first
+    try:
+        return await asyncio.wait_for(asyncio.shield(first), delay)
+    except asyncio.TimeoutError:
+        pass
+    except BaseException:
+        first.cancel()
+        raise
+    logger.debug("Hedged-запрос: первый ответ дольше %.2f с", delay)
+    pending = {first, asyncio.ensure_future(call())}
+    error: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class Resilience:
+    """Retry + circuit breaker (+ optional hedging) around one upstream."""
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker | None = None,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        hedge: bool = OPENAI_HEDGE_ENABLED,
+        hedge_percentile: float = OPENAI_HEDGE_PERCENTILE,
+    ):
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker()
+        # Recent attempts, True = transient failure: the error rate seen by model routing
+        self._failures: deque[bool] = deque(maxlen=200)
+        self.retries = 0
+
+    def _retry_delay(self, e: BaseException, attempt: int) -> float | None:
+        """Delay before the next attempt, or None to give up."""
+        if attempt >= self.max_retries or not is_retryable(e):
+            return None
+        wait = retry_after(e)
+        if wait is None:
+            return backoff_delay(attempt)
+        # Honour Retry-After (plus a little jitter) unless it is longer than we are willing to wait
+        return wait + random.uniform(0, OPENAI_RETRY_BASE_DELAY) if wait <= OPENAI_RETRY_MAX_DELAY else None
+
+    def _attempt_done(self, e: BaseException | None, started: float) -> None:
+        self.breaker.record(e)
+        self._failures.append(e is not None and is_retryable(e))
+        if e is None:
+            self.latency.add(time.monotonic() - started)
+
+    def error_rate(self, min_samples: int) -> float:
+        """Share of transient failures among recent attempts (0 with fewer than min_samples)."""
+        if len(self._failures) < min_samples:
+            return 0.0
+        return sum(self._failures) / len(self._failures)
+
+    async def acall(self, call: Callable[[], Awaitable[T]], hedge: bool | None = None) -> T:
+        """Await call() with retries; hedge=None uses the configured default (streams pass False)."""
+        hedge = self.hedge if hedge is None else hedge
+        attempt = 0
+        while True:
+            probe = self.breaker.allow()
+            started = time.monotonic()
+            delay = self.latency.percentile(self.hedge_percentile) if hedge else None
+            try:
+                result = await hedged(call, delay)
+            except Exception as e:
+                self._attempt_done(e, started)
+                wait = self._retry_delay(e, attempt)
+                if wait is None:
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning("OpenAI: %s, повтор %s через %.2f с", type(e).__name__, attempt, wait)
+                await asyncio.sleep(wait)
+                continue
+            except BaseException:
+                # Cancelled (hedge loser, client gone, admission timeout, shutdown): no outcome,
+                # so a half-open breaker lets the next call probe
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self._attempt_done(None, started)
+            return result
+
+    def call(self, call: Callable[[], T]) -> T:
+        """Blocking variant of acall for the sync client (no hedging)."""
+        attempt = 0
+        while True:
+            probe = self.breaker.allow()
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                self._attempt_done(e, started)
+                wait = self._retry_delay(e, attempt)
+                if wait is None:
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning("OpenAI: %s, повтор %s через %.2f с", type(e).__name__, attempt, wait)
+                time.sleep(wait)
+                continue
+            except BaseException:
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self._attempt_done(None, started)
+            return result
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "breaker_open": float(self.breaker.state != "closed"),
+            "breaker_rejected": self.breaker.rejected,
+            "retries": self.retries,
+        }
+
+
+# Process-wide resilience state for the OpenAI upstream
+upstream = Resilience()
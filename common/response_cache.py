@@ -0,0 +1,252 @@
+"""Response cache for stateless replies: in-memory LRU with TTL, optional SQLite tier, single-flight."""
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+from common.config import (
+    DATA_DIR,
+    RESPONSE_CACHE_DISK,
+    RESPONSE_CACHE_DISK_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+)
+from common.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL,
+  expires_at REAL NOT NULL,
+  used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_used_at ON responses(used_at);
+"""
+# Disk tier is pruned (expired + least recently used over the cap) every N writes
+_DISK_PRUNE_EVERY = 100
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace and case so trivially different questions share an entry."""
+    return " ".join(text.split()).casefold()
+
+
+def cache_key(model: str, system_prompt: str, user_text: str) -> str:
+    raw = "\0".join((model, system_prompt, normalize_prompt(user_text)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite table under DATA_DIR that survives restarts. Accessed from worker threads."""
+
+    def __init__(self, path: Path, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_DISK_SCHEMA)
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            return row[0] if row else None
+
+    def put(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now + ttl, now),
+                )
+                self._writes += 1
+                if self._writes % _DISK_PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                    conn.execute(
+                        """
+                        DELETE FROM responses WHERE key IN (
+                            SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?
+                        )
+                        """,
+                        (self.max_entries,),
+                    )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ResponseCache:
+    """
+    Cache of successful (True, text) replies keyed by cache_key().
+    Memory tier: LRU bounded by max_entries and max_bytes, entries expire after ttl.
+    Concurrent misses for the same key share one upstream call; if the caller running it is
+    cancelled, the waiters do not fail with it but retry, and one of them computes the answer.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        disk_path: Path | None = None,
+        disk_max_entries: int = RESPONSE_CACHE_DISK_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._disk = _DiskTier(disk_path, disk_max_entries) if disk_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[tuple[bool, str]]],
+        keep: Callable[[], bool] | None = None,
+    ) -> tuple[tuple[bool, str], bool]:
+        """
+        Return ((success, text), computed). computed is True only for the caller that
+        ran compute() itself; cache hits and coalesced waiters get computed=False.
+        keep() is asked after a successful compute(); False shares the answer with coalesced
+        waiters but does not store it (e.g. it came from another model than the key's).
+        """
+        text = self._get_memory(key)
+        if text is not None:
+            self.memory_hits += 1
+            return (True, text), False
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight), False
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+            # The leader was cancelled (its user left), not us: start over, one waiter computes
+            self.coalesced -= 1
+            return await self.get_or_compute(key, compute, keep)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            text = await self._get_disk(key)
+            if text is not None:
+                self.disk_hits += 1
+                self._put_memory(key, text)
+                result, computed = (True, text), False
+            else:
+                self.misses += 1
+                result, computed = await compute(), True
+                if result[0] and (keep is None or keep()):
+                    self._put_memory(key, result[1])
+                    await self._put_disk(key, result[1])
+            future.set_result(result)
+            return result, computed
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody is waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict[str, float]:
+        hits = self.memory_hits + self.disk_hits + self.coalesced
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    def _get_memory(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, text = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def _put_memory(self, key: str, text: str) -> None:
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, text)
+        self._bytes += sys.getsizeof(text)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= sys.getsizeof(entry[1])
+
+    async def _get_disk(self, key: str) -> str | None:
+        if self._disk is None:
+            return None
+        try:
+            return await asyncio.to_thread(self._disk.get, key)
+        except sqlite3.Error as e:
+            logger.error("Ошибка чтения дискового кэша ответов: %s", e)
+            return None
+
+    async def _put_disk(self, key: str, text: str) -> None:
+        if self._disk is None:
+            return
+        try:
+            await asyncio.to_thread(self._disk.put, key, text, self.ttl)
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи в дисковый кэш ответов: %s", e)
+
+
+# Process-wide cache used by bot_nomem (only when RESPONSE_CACHE_ENABLED)
+response_cache = ResponseCache(disk_path=DATA_DIR / "response_cache.db" if RESPONSE_CACHE_DISK else None)
+registry.add_stats("response_cache", response_cache.stats)
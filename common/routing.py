@@ -0,0 +1,144 @@
+"""Model routing for OpenAI calls: per-request model choice by prompt size and model health."""
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from typing import NamedTuple
+
+from common.config import (
+    OPENAI_MODEL,
+    OPENAI_ROUTE_MAX_ERROR_RATE,
+    OPENAI_ROUTE_MAX_P95,
+    OPENAI_ROUTE_MIN_SAMPLES,
+    OPENAI_ROUTE_PROBE_INTERVAL,
+    OPENAI_ROUTES,
+)
+from common.context_builder import message_tokens
+from common.metrics import registry
+from common.resilience import CircuitBreaker, Resilience, upstream
+
+logger = logging.getLogger(__name__)
+
+openai_route_total = registry.counter(
+    "openai_route_total", "Model routing decisions (primary: first fitting model, fallback: a later one)",
+    ("model", "reason"),
+)
+
+
+class Route(NamedTuple):
+    model: str
+    max_tokens: int  # 0 = no limit
+    max_pairs: int  # 0 = no limit
+
+    def fits(self, tokens: int, pairs: int) -> bool:
+        return (not self.max_tokens or tokens <= self.max_tokens) and (not self.max_pairs or pairs <= self.max_pairs)
+
+
+class ModelRouter:
+    """
+    Routes are ordered cheapest/fastest first. A request may go to every route it fits (prompt
+    tokens and history pairs within the route's limits); it is tried on healthy ones first, in
+    order, then degraded ones, then those with an open breaker (which fail fast with CircuitOpen,
+    so the caller moves on). Each model has its own retry state and circuit breaker; OPENAI_MODEL
+    keeps the process-wide `upstream`. Without OPENAI_ROUTES the only route is OPENAI_MODEL.
+    A degraded model is tried first by at most one request per probe_interval seconds, so its
+    error rate and p95 can recover without a fixed share of traffic paying its latency.
+    """
+
+    def __init__(
+        self,
+        routes: list[tuple[str, int, int]] = OPENAI_ROUTES,
+        default_model: str = OPENAI_MODEL or "gpt-4",
+        max_error_rate: float = OPENAI_ROUTE_MAX_ERROR_RATE,
+        max_p95: float = OPENAI_ROUTE_MAX_P95,
+        probe_interval: float = OPENAI_ROUTE_PROBE_INTERVAL,
+        min_samples: int = OPENAI_ROUTE_MIN_SAMPLES,
+    ):
+        self.routes = [Route(*r) for r in routes] or [Route(default_model, 0, 0)]
+        self.default_model = default_model
+        self.max_error_rate = max_error_rate
+        self.max_p95 = max_p95
+        self.probe_interval = probe_interval
+        # Own threshold: tuning hedging (OPENAI_HEDGE_MIN_SAMPLES) must not change routing health
+        self.min_samples = min_samples
+        self.probes = 0
+        self._last_probe: dict[str, float] = {}
+        self._probe_lock = threading.Lock()
+        self.upstreams: dict[str, Resilience] = {default_model: upstream}
+
+    def upstream(self, model: str) -> Resilience:
+        """Retry / breaker state of one model (created on first use)."""
+        resilience = self.upstreams.get(model)
+        if resilience is None:
+            resilience = self.upstreams[model] = Resilience(breaker=CircuitBreaker(name=f"openai:{model}"))
+        return resilience
+
+    def healthy(self, model: str) -> bool:
+        resilience = self.upstream(model)
+        if resilience.breaker.state == "open" or resilience.error_rate(self.min_samples) > self.max_error_rate:
+            return False
+        p95 = resilience.latency.percentile(0.95, self.min_samples) if self.max_p95 else None
+        return p95 is None or p95 <= self.max_p95
+
+    def _take_probe(self, model: str) -> bool:
+        """True for at most one caller per probe_interval seconds and model (sync clients use threads)."""
+        now = time.monotonic()
+        with self._probe_lock:
+            if now - self._last_probe.get(model, float("-inf")) < self.probe_interval:
+                return False
+            self._last_probe[model] = now
+            self.probes += 1
+            return True
+
+    def _fitting(self, messages: list[dict[str, str]]) -> list[str]:
+        tokens = sum(message_tokens(m, self.default_model) for m in messages)
+        pairs = sum(1 for m in messages if m["role"] == "assistant")
+        return [r.model for r in self.routes if r.fits(tokens, pairs)] or [self.routes[-1].model]
+
+    def primary_model(self, messages: list[dict[str, str]]) -> str:
+        """Model these messages route to when it is healthy (their tier), regardless of current health."""
+        if len(self.routes) == 1:
+            return self.routes[0].model
+        return self._fitting(messages)[0]
+
+    def candidates(self, messages: list[dict[str, str]], model: str | None = None) -> Iterator[tuple[str, str]]:
+        """(model, reason) in the order to try; an explicit model is used as is."""
+        if model:
+            yield model, "explicit"
+            return
+        if len(self.routes) == 1:
+            yield self.routes[0].model, "primary"
+            return
+        fitting = self._fitting(messages)
+        healthy, degraded, down = [], [], []
+        for name in fitting:
+            if self.upstream(name).breaker.state == "open":
+                down.append(name)
+            elif self.healthy(name) or self._take_probe(name):
+                healthy.append(name)
+            else:
+                degraded.append(name)
+        for name in healthy + degraded + down:
+            yield name, "primary" if name == fitting[0] else "fallback"
+
+    def record(self, model: str, reason: str) -> None:
+        """Count a decision once the call was actually sent to model."""
+        openai_route_total.labels(model, reason).inc()
+        if reason == "fallback":
+            logger.debug("Маршрутизация: запрос отправлен в резервную модель %s", model)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            f"route{i}_{key}": value
+            for i, route in enumerate(self.routes)
+            for key, value in (
+                ("breaker_open", float(self.upstream(route.model).breaker.state != "closed")),
+                ("error_rate", self.upstream(route.model).error_rate(self.min_samples)),
+                ("p95_seconds", self.upstream(route.model).latency.percentile(0.95, self.min_samples) or 0.0),
+            )
+        }
+
+
+# Process-wide router for the OpenAI wrapper
+router = ModelRouter()
+registry.add_stats("openai_routes", router.stats)
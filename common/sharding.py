@@ -0,0 +1,244 @@
+"""Sharded bot_mem: user_id -> worker routing and a supervisor for worker processes."""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from collections.abc import Awaitable, Callable, Sequence
+from pathlib import Path
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from common.config import (
+    BOT_MEM_WORKER_QUEUE,
+    BOT_MEM_WORKER_STOP_TIMEOUT,
+    DATA_DIR,
+    METRICS_PORT,
+    OPENAI_MAX_IN_FLIGHT,
+    OPENAI_QUEUE_SIZE,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GROUP_RATE_PER_MIN,
+)
+
+logger = logging.getLogger(__name__)
+
+SHARDS_DIR = DATA_DIR / "shards"
+# Run by path (the script puts the project root on sys.path), so the front may start from any cwd
+WORKER_COMMAND = (sys.executable, str(Path(__file__).resolve().parent.parent / "bot_mem" / "worker.py"))
+# Restart backoff for crashed workers (s); reset once a worker stayed up for _STABLE_AFTER seconds
+_RESTART_MIN_DELAY = 1.0
+_RESTART_MAX_DELAY = 30.0
+_STABLE_AFTER = 60.0
+_STOP = None
+
+
+def shard_for(user_id: int, shards: int) -> int:
+    """
+    Shard owning user_id: crc32 of the id split into `shards` equal hash ranges. Stable across
+    processes and restarts (unlike hash()), so a user always lands on the same SQLite shard.
+    """
+    h = zlib.crc32(user_id.to_bytes(8, "little", signed=True))
+    return h * shards >> 32
+
+
+def shard_db_path(index: int, shards_dir: Path = SHARDS_DIR) -> Path:
+    return shards_dir / f"memory-{index}.db"
+
+
+def check_layout(workers: int, shards_dir: Path = SHARDS_DIR) -> bool:
+    """
+    Record the worker count next to the shards on first start; False if it differs from the
+    recorded one (users would be routed to shards without their history).
+    """
+    layout = shards_dir / "layout.json"
+    if layout.exists():
+        recorded = json.loads(layout.read_text()).get("workers")
+        if recorded != workers:
+            logger.error(
+                "В %s шарды созданы для %s воркеров, а запущено %s: история пользователей окажется в чужих шардах",
+                shards_dir, recorded, workers,
+            )
+            return False
+        return True
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    layout.write_text(json.dumps({"workers": workers}))
+    return True
+
+
+class _Worker:
+    """One worker slot: its pending updates (JSON lines) and the current process, if any."""
+
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(queue_size)
+        self.process: asyncio.subprocess.Process | None = None
+        self.restarts = 0
+        self.dropped = 0
+
+
+class Supervisor:
+    """
+    Runs `workers` bot_mem worker processes, each owning the users with shard_for(user_id) == its
+    index and its own SQLite file (shards/memory-<i>.db). route() hands an update to the owner's
+    queue; a pump task writes it to the worker's stdin, so each user's updates stay in order.
+    Crashed workers are restarted with backoff; updates routed meanwhile wait in the queue
+    (up to `queue_size`, then dropped). stop() closes stdin so workers finish queued turns and exit.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        command: Sequence[str] = WORKER_COMMAND,
+        shards_dir: Path = SHARDS_DIR,
+        queue_size: int = BOT_MEM_WORKER_QUEUE,
+        stop_timeout: float = BOT_MEM_WORKER_STOP_TIMEOUT,
+        env: dict[str, str] | None = None,
+    ):
+        self.command = tuple(command)
+        self.shards_dir = shards_dir
+        self.stop_timeout = stop_timeout
+        self.env = env
+        self._workers = [_Worker(i, queue_size) for i in range(workers)]
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    def worker_env(self, index: int) -> dict[str, str]:
+        """
+        Environment of worker `index`: its shard, DB file, /metrics port (METRICS_PORT + 1 + index)
+        and its share of the limits meant for the whole bot: the global Telegram send rate, the
+        group chat rate (members of one group land on different workers, each with its own chat
+        bucket) and the OpenAI in-flight cap and queue.
+        """
+        env = dict(os.environ if self.env is None else self.env)
+        env.update(
+            {
+                "BOT_MEM_SHARD": str(index),
+                "MEMORY_DB_PATH": str(shard_db_path(index, self.shards_dir)),
+                "METRICS_PORT": str(METRICS_PORT + 1 + index),
+                "TELEGRAM_GLOBAL_RATE": str(TELEGRAM_GLOBAL_RATE / self.workers),
+                "TELEGRAM_GROUP_RATE_PER_MIN": str(TELEGRAM_GROUP_RATE_PER_MIN / self.workers),
+                "OPENAI_MAX_IN_FLIGHT": str(max(1, OPENAI_MAX_IN_FLIGHT // self.workers)),
+                "OPENAI_QUEUE_SIZE": str(OPENAI_QUEUE_SIZE // self.workers if OPENAI_QUEUE_SIZE else 0),
+            }
+        )
+        return env
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._supervise(w), name=f"shard-{w.index}") for w in self._workers]
+        logger.info("Запущено воркеров bot_mem: %s", self.workers)
+
+    def route(self, user_id: int, update: bytes) -> bool:
+        """Queue a serialized update for the worker owning user_id; False if its queue is full."""
+        worker = self._workers[shard_for(user_id, self.workers)]
+        try:
+            worker.queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            worker.dropped += 1
+            logger.error("Очередь воркера %s переполнена, обновление user_id=%s отброшено", worker.index, user_id)
+            return False
+
+    async def stop(self) -> None:
+        """Let every worker drain its queue and finish its turns; kill the ones that overrun stop_timeout."""
+        if not self._tasks:
+            return
+        self._stopping.set()
+        for w in self._workers:
+            try:
+                w.queue.put_nowait(_STOP)
+            except asyncio.QueueFull:
+                # Full queue of a live worker drains; of a dead one, the kill below handles it
+                try:
+                    await asyncio.wait_for(w.queue.put(_STOP), self.stop_timeout)
+                except asyncio.TimeoutError:
+                    pass
+        _, pending = await asyncio.wait(self._tasks, timeout=self.stop_timeout)
+        for w in self._workers:
+            if w.process is not None and w.process.returncode is None:
+                logger.error("Воркер %s не завершился за %s с, принудительная остановка", w.index, self.stop_timeout)
+                w.process.kill()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Воркеры bot_mem остановлены")
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "workers": self.workers,
+            "alive": sum(w.process is not None and w.process.returncode is None for w in self._workers),
+            "restarts": sum(w.restarts for w in self._workers),
+            "queued": sum(w.queue.qsize() for w in self._workers),
+            "dropped": sum(w.dropped for w in self._workers),
+        }
+
+    async def _supervise(self, worker: _Worker) -> None:
+        delay = _RESTART_MIN_DELAY
+        while True:
+            started = time.monotonic()
+            worker.process = await asyncio.create_subprocess_exec(
+                *self.command,
+                stdin=asyncio.subprocess.PIPE,
+                env=self.worker_env(worker.index),
+                # Own process group: Ctrl+C reaches only the front, which then stops workers in order
+                start_new_session=True,
+            )
+            pump = asyncio.create_task(self._pump(worker, worker.process))
+            code = await worker.process.wait()
+            pump.cancel()
+            if self._stopping.is_set():
+                return
+            if time.monotonic() - started >= _STABLE_AFTER:
+                delay = _RESTART_MIN_DELAY
+            worker.restarts += 1
+            logger.error("Воркер %s завершился с кодом %s, перезапуск через %.0f с", worker.index, code, delay)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, _RESTART_MAX_DELAY)
+
+    async def _pump(self, worker: _Worker, process: asyncio.subprocess.Process) -> None:
+        stdin = process.stdin
+        while True:
+            line = await worker.queue.get()
+            if line is _STOP:
+                stdin.close()
+                return
+            try:
+                stdin.write(line)
+                await stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # Worker died: the update in hand is lost, later ones wait for the restarted worker
+                logger.error("Воркер %s недоступен, обновление потеряно", worker.index)
+                return
+
+
+class RouteToWorker(BaseMiddleware):
+    """Front dispatcher's outer update middleware: hands each update to its user's worker instead of handlers."""
+
+    def __init__(self, supervisor: Supervisor):
+        self.supervisor = supervisor
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        line = event.model_dump_json(exclude_unset=True, by_alias=True).encode() + b"\n"
+        self.supervisor.route(user.id if user else 0, line)
+        return None
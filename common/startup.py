@@ -0,0 +1,35 @@
+"""Bot startup: blocking preparation overlapped with the Telegram connection instead of delaying it."""
+import asyncio
+import logging
+from collections.abc import Callable
+
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+# Background startup jobs (a reference keeps the task alive until it is done)
+_warming: set[asyncio.Task] = set()
+
+
+async def overlap_with_connect(bot: Bot, *jobs: Callable[[], None]) -> None:
+    """
+    Run jobs in threads while getMe opens the Telegram session, then wait for all of them.
+    aiogram caches getMe, so polling does not repeat it. A failed getMe is only logged here
+    (polling then fails on its own getMe; webhook mode does not need it); a failed job raises.
+    """
+    tasks = [asyncio.create_task(asyncio.to_thread(job)) for job in jobs]
+    try:
+        await bot.me()
+    except Exception as e:
+        logger.warning("Telegram недоступен при старте: %s", e)
+    await asyncio.gather(*tasks)
+
+
+def warm_up(job: Callable[[], None]) -> None:
+    """
+    Run job in a thread without waiting: startup goes on and polling connects meanwhile.
+    For work the first update may need, guarded by its own lock (openai_client.prepare_clients).
+    """
+    task = asyncio.create_task(asyncio.to_thread(job))
+    _warming.add(task)
+    task.add_done_callback(_warming.discard)
@@ -0,0 +1,109 @@
+"""Telegram side of streamed replies: placeholder message, rate-limited edits, split at TELEGRAM_MAX_LEN."""
+import logging
+import time
+from collections.abc import AsyncIterator
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from common.config import STREAM_EDIT_INTERVAL
+from common.openai_client import CompletionError
+from common.outbound import outbound
+
+logger = logging.getLogger(__name__)
+
+# Telegram message length limit
+TELEGRAM_MAX_LEN = 4096
+
+PLACEHOLDER = "…"
+EMPTY_REPLY = "Нет ответа от модели."
+
+
+def chunk_text(text: str, max_len: int = TELEGRAM_MAX_LEN - 100) -> list[str]:
+    """Split text into chunks not exceeding max_len. Prefer split at \n\n."""
+    if len(text) <= max_len:
+        return [text] if text else []
+    chunks = []
+    remainder = text
+    while remainder:
+        if len(remainder) <= max_len:
+            chunks.append(remainder)
+            break
+        block = remainder[:max_len]
+        last_break = block.rfind("\n\n")
+        if last_break > max_len // 2:
+            chunks.append(remainder[: last_break + 2].rstrip())
+            remainder = remainder[last_break + 2 :].lstrip()
+        else:
+            chunks.append(block)
+            remainder = remainder[max_len:]
+    return chunks
+
+
+class _LiveReply:
+    """Messages shown for one streamed reply; keeps them in sync with chunk_text(text)."""
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.sent: list[Message] = []
+        self.shown: list[str] = []
+
+    async def start(self) -> None:
+        self.sent.append(await outbound.answer(self.message, PLACEHOLDER))
+        self.shown.append(PLACEHOLDER)
+
+    async def show(self, text: str, final: bool = False) -> None:
+        for i, chunk in enumerate(chunk_text(text)):
+            if i >= len(self.sent):
+                self.sent.append(await outbound.answer(self.message, chunk))
+                self.shown.append(chunk)
+            elif self.shown[i] != chunk:
+                await self._edit(i, chunk, final)
+
+    async def _edit(self, i: int, chunk: str, final: bool) -> None:
+        try:
+            # Final text is retried after flood limits (by outbound); an intermediate one is skipped
+            await outbound.edit(self.sent[i], chunk, retry=final)
+            self.shown[i] = chunk
+        except TelegramRetryAfter as e:
+            if final:
+                raise
+            logger.warning("Telegram flood limit при редактировании, промежуточный текст пропущен (%s с)", e.retry_after)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+
+    async def show_final(self, text: str) -> None:
+        """show(text, final=True); a Telegram error is logged, since the reply already exists upstream."""
+        try:
+            await self.show(text, final=True)
+        except TelegramAPIError as e:
+            logger.error("Не удалось показать итоговый текст ответа: %s", e)
+
+
+async def stream_reply(message: Message, deltas: AsyncIterator[str]) -> tuple[bool, str]:
+    """
+    Answer message with a placeholder and edit it as deltas arrive (at most once per
+    STREAM_EDIT_INTERVAL seconds); text past the Telegram limit continues in new messages.
+    Returns (success, final_text); on upstream error the error text is shown to the user.
+    A Telegram error on the final edit does not change the result: the model has answered
+    (and the user has seen most of it), so the turn is still saved.
+    """
+    live = _LiveReply(message)
+    await live.start()
+    text = ""
+    last_edit = time.monotonic()
+    try:
+        async for delta in deltas:
+            text += delta
+            now = time.monotonic()
+            if now - last_edit >= STREAM_EDIT_INTERVAL and text.strip():
+                await live.show(text)
+                last_edit = now
+    except CompletionError as e:
+        shown = text.strip()
+        await live.show_final(f"{shown}\n\n{e.user_message}" if shown else e.user_message)
+        return False, e.user_message
+    text = text.strip() or EMPTY_REPLY
+    await live.show_final(text)
+    return True, text
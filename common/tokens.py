@@ -0,0 +1,49 @@
+"""Token counting: tiktoken when installed, otherwise a conservative byte-based estimate."""
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds per message (role, separators)
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str | None):
+    """tiktoken encoding for model, or None when tiktoken is not installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model or "")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Number of tokens in text for model."""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text))
+    # ~4 bytes per token for Latin text; Cyrillic (2 bytes/char) errs on the high side
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str | None = None) -> str:
+    """Cut text to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding(model)
+    if enc is not None:
+        ids = enc.encode(text)
+        return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens])
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return text
+    cut = len(text) * max_tokens // total
+    while cut > 0 and count_tokens(text[:cut], model) > max_tokens:
+        cut = cut * 9 // 10
+    return text[:cut]
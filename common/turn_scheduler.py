@@ -0,0 +1,145 @@
+"""Per-user turn scheduler: one turn in flight per user, bursts of messages merged into one turn."""
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+from common.config import TURN_DEBOUNCE_SECONDS, TURN_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _UserTurns:
+    __slots__ = ("pending", "last_at", "task", "dropped", "lock", "exclusive")
+
+    def __init__(self) -> None:
+        self.pending: list[Any] = []
+        self.last_at = 0.0
+        self.task: asyncio.Task | None = None
+        # Items dropped since the pending batch was last taken
+        self.dropped = 0
+        # Held while a turn or a run_exclusive() action runs; exclusive: actions holding or awaiting it
+        self.lock = asyncio.Lock()
+        self.exclusive = 0
+
+
+class TurnScheduler:
+    """
+    submit(user_id, item) queues item for the user. A per-user worker waits until no new
+    item arrived for `debounce` seconds, then calls process(user_id, items) with everything
+    queued so far; items arriving during that call form the next turn. Workers exit and
+    their state is dropped as soon as the user has nothing pending, so memory is bounded
+    by users with turns in progress. At most max_pending items wait per user; extra are dropped
+    and counted, and on_drop(user_id, item) is called for the first one dropped from a batch
+    (e.g. to tell the user), so an overflowing user gets one notice, not one per message.
+    run_exclusive(user_id, action) runs an action (e.g. clearing the history) between the user's
+    turns: pending items are discarded, the turn in flight finishes first, and later items wait.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[int, list[Any]], Awaitable[None]],
+        debounce: float = TURN_DEBOUNCE_SECONDS,
+        max_pending: int = TURN_MAX_PENDING,
+        on_drop: Callable[[int, Any], Awaitable[None]] | None = None,
+    ):
+        self.process = process
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._users: dict[int, _UserTurns] = {}
+        self._notices: set[asyncio.Task] = set()
+
+    def submit(self, user_id: int, item: Any) -> bool:
+        """Queue item; False if the user's queue is full and the item was dropped."""
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserTurns()
+        if len(state.pending) >= self.max_pending:
+            self.dropped += 1
+            state.dropped += 1
+            if state.dropped == 1:
+                logger.warning(
+                    "Очередь сообщений user_id=%s переполнена (%s), новые сообщения пропускаются", user_id, self.max_pending
+                )
+                if self.on_drop is not None:
+                    task = asyncio.create_task(self._notify(user_id, item))
+                    self._notices.add(task)
+                    task.add_done_callback(self._notices.discard)
+            return False
+        state.pending.append(item)
+        state.last_at = time.monotonic()
+        if state.task is None:
+            state.task = asyncio.create_task(self._run(user_id, state))
+        return True
+
+    async def run_exclusive(self, user_id: int, action: Callable[[], Awaitable[T]]) -> T:
+        """
+        Discard the user's pending items, wait for the turn in flight, then return await action().
+        Items submitted meanwhile form a turn that runs after action.
+        """
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserTurns()
+        if state.pending:
+            logger.info("Отброшено сообщений в очереди user_id=%s: %s", user_id, len(state.pending))
+        state.pending, state.dropped = [], 0
+        state.exclusive += 1
+        try:
+            async with state.lock:
+                return await action()
+        finally:
+            state.exclusive -= 1
+            self._forget(user_id, state)
+
+    async def _run(self, user_id: int, state: _UserTurns) -> None:
+        try:
+            while state.pending:
+                # Sliding debounce: wait until the user paused for `debounce` seconds
+                while (wait := state.last_at + self.debounce - time.monotonic()) > 0:
+                    await asyncio.sleep(wait)
+                if not state.pending:
+                    break  # discarded by run_exclusive()
+                batch, state.pending = state.pending, []
+                if state.dropped:
+                    logger.warning("Пропущено сообщений user_id=%s: %s", user_id, state.dropped)
+                    state.dropped = 0
+                async with state.lock:
+                    try:
+                        await self.process(user_id, batch)
+                    except Exception as e:
+                        logger.exception("Ошибка обработки хода user_id=%s: %s", user_id, e)
+        finally:
+            state.task = None
+            self._forget(user_id, state)
+
+    def _forget(self, user_id: int, state: _UserTurns) -> None:
+        # Nothing pending, running or waiting for the lock: drop the user's state
+        if state.task is None and not state.pending and not state.exclusive and self._users.get(user_id) is state:
+            del self._users[user_id]
+
+    async def _notify(self, user_id: int, item: Any) -> None:
+        try:
+            await self.on_drop(user_id, item)
+        except Exception as e:
+            logger.exception("Ошибка уведомления о переполнении очереди user_id=%s: %s", user_id, e)
+
+    @property
+    def active_users(self) -> int:
+        return len(self._users)
+
+    def stats(self) -> dict[str, int]:
+        return {"active_users": self.active_users, "dropped": self.dropped}
+
+    async def drain(self, timeout: float | None = None) -> None:
+        """Wait for all queued turns to finish (e.g. on shutdown)."""
+        tasks = [s.task for s in self._users.values() if s.task is not None]
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.error("Не завершены ходы %s пользователей", len(pending))
@@ -0,0 +1,120 @@
+"""Webhook run mode: one aiohttp server hosting one or more bots' dispatchers under different paths."""
+import asyncio
+import ipaddress
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any, NamedTuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from common.config import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_SHUTDOWN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_exposed(host: str = WEBHOOK_HOST, secret: str = WEBHOOK_SECRET) -> bool:
+    """True when updates would be accepted without a secret on a non-loopback address."""
+    if secret:
+        return False
+    if host == "localhost":
+        return False
+    try:
+        return not ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return True  # a host name: may resolve to any interface
+
+
+class WebhookTarget(NamedTuple):
+    name: str
+    bot: Bot
+    dispatcher: Dispatcher
+    path: str
+
+
+class _InFlightUpdates(BaseMiddleware):
+    """Outer update middleware counting updates being handled, so shutdown can wait for them."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        self.count += 1
+        self.idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if self.count == 0:
+                self.idle.set()
+
+
+def build_app(targets: list[WebhookTarget], secret: str = WEBHOOK_SECRET) -> web.Application:
+    """
+    aiohttp app with a POST route per target. Requests without the matching
+    X-Telegram-Bot-Api-Secret-Token header get 401 (when a secret is configured).
+    Updates are handled in the background; shutdown waits for them (WEBHOOK_SHUTDOWN_TIMEOUT).
+    """
+    app = web.Application()
+    in_flight = _InFlightUpdates()
+    for target in targets:
+        target.dispatcher.update.outer_middleware(in_flight)
+        handler = SimpleRequestHandler(
+            dispatcher=target.dispatcher,
+            bot=target.bot,
+            handle_in_background=True,
+            secret_token=secret or None,
+        )
+        app.router.add_post(target.path, handler.handle)
+
+    async def on_startup(_: web.Application) -> None:
+        for target in targets:
+            await target.dispatcher.emit_startup(bot=target.bot)
+            if WEBHOOK_BASE_URL:
+                url = WEBHOOK_BASE_URL.rstrip("/") + target.path
+                await target.bot.set_webhook(
+                    url,
+                    secret_token=secret or None,
+                    allowed_updates=target.dispatcher.resolve_used_update_types(),
+                )
+                logger.info("Webhook %s установлен: %s", target.name, url)
+            logger.info("Бот %s принимает обновления на %s", target.name, target.path)
+
+    async def on_cleanup(_: web.Application) -> None:
+        # Runs after the server stopped accepting requests: let handlers finish, then tear down
+        if in_flight.count:
+            logger.info("Ожидание завершения %s обработчиков", in_flight.count)
+            try:
+                await asyncio.wait_for(in_flight.idle.wait(), WEBHOOK_SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error("Не дождались %s обработчиков за %s с", in_flight.count, WEBHOOK_SHUTDOWN_TIMEOUT)
+        for target in targets:
+            try:
+                await target.dispatcher.emit_shutdown(bot=target.bot)
+            finally:
+                await target.bot.session.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def run_webhook(targets: list[WebhookTarget], host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT) -> None:
+    """Serve targets until SIGINT/SIGTERM, then shut down gracefully."""
+    logger.info("Webhook-сервер на %s:%s", host, port)
+    web.run_app(build_app(targets), host=host, port=port, print=None)